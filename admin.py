@@ -1,5 +1,5 @@
 from django.contrib import admin
-from models import ContentModel, ModelVersion
+from models import ContentModel, ModelVersion, ValidationJob, ValidationRun
 
 #--------------------------------------------------------------------------------------
 # This class defines some customizations of the admin interface for ContentModels
@@ -19,8 +19,8 @@ class ContentModelAdmin(admin.ModelAdmin):
     # Fields to display:
     list_display = ['__unicode__', 'latest_xsd_link', 'latest_xls_link', 'rewrite_rule_link']
     
-    # Fields to exclude from the edit form
-    exclude = ['rewrite_rule']
+    # Fields to exclude from the edit form. The latest version is maintained automatically.
+    exclude = ['rewrite_rule', 'latest_modelversion', 'last_updated']
     
     # Fields on which to base the search:
     search_fields = ['title', 'label']
@@ -44,4 +44,35 @@ class ModelVersionAdmin(admin.ModelAdmin):
     
     # Fields on which to base the search:
     search_fields = ['content_model__title']
-admin.site.register(ModelVersion, ModelVersionAdmin)
\ No newline at end of file
+admin.site.register(ModelVersion, ModelVersionAdmin)
+
+#--------------------------------------------------------------------------------------
+# This class defines some customizations of the admin interface for ValidationJobs
+#--------------------------------------------------------------------------------------
+class ValidationJobAdmin(admin.ModelAdmin):
+    # Fields to display in the table:
+    list_display = ['__unicode__', 'description', 'status', 'processed', 'error_count', 'date_created']
+    
+    # Fields to use in filtering on the right-hand-side:
+    list_filter = ['kind', 'status']
+    
+    # Jobs are created by the validators, not by hand
+    readonly_fields = ['key', 'kind', 'description', 'status', 'processed', 'error_count', 'total', 'message', 'result', 'date_started', 'date_finished']
+admin.site.register(ValidationJob, ValidationJobAdmin)
+
+#--------------------------------------------------------------------------------------
+# This class defines some customizations of the admin interface for ValidationRuns
+#--------------------------------------------------------------------------------------
+class ValidationRunAdmin(admin.ModelAdmin):
+    # Fields to display in the table:
+    list_display = ['__unicode__', 'modelversion', 'valid', 'valid_count', 'invalid_count', 'unchanged_count', 'date_created']
+    
+    # Fields to use in filtering on the right-hand-side:
+    list_filter = ['valid', 'modelversion']
+    
+    # Fields on which to base the search:
+    search_fields = ['url', 'feature_type']
+    
+    # Runs are recorded by the validators, not by hand
+    readonly_fields = ['modelversion', 'service_key', 'url', 'feature_type', 'schema_fingerprint', 'valid', 'valid_count', 'invalid_count', 'unchanged_count', 'errors']
+admin.site.register(ValidationRun, ValidationRunAdmin)
\ No newline at end of file
@@ -0,0 +1,79 @@
+#--------------------------------------------------------------------------------------
+# Benchmark comparing serial and process-pool validation of a synthetic
+#     wfs:FeatureCollection. Run from a configured Django project:
+#
+#     DJANGO_SETTINGS_MODULE=cm.settings python -m modelmanager.benchmarks.bench_parallel [features] [processes]
+#--------------------------------------------------------------------------------------
+from modelmanager.validation.validators.WfsGetFeature import ValidationResults
+from modelmanager.validation.validators.ValidationEngine import ParallelEngine
+from lxml import etree
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+SCHEMA = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:aasg="http://example.org/aasg"
+    targetNamespace="http://example.org/aasg" elementFormDefault="qualified">
+  <xs:element name="Well" type="aasg:WellType"/>
+  <xs:complexType name="WellType">
+    <xs:sequence>
+      <xs:element name="Name" type="xs:string"/>
+      <xs:element name="Depth" type="xs:double"/>
+      <xs:element name="Temperature" type="xs:double" minOccurs="0"/>
+      <xs:element name="Status">
+        <xs:simpleType>
+          <xs:restriction base="xs:string">
+            <xs:enumeration value="active"/>
+            <xs:enumeration value="abandoned"/>
+          </xs:restriction>
+        </xs:simpleType>
+      </xs:element>
+    </xs:sequence>
+  </xs:complexType>
+</xs:schema>"""
+
+# Every tenth feature is invalid
+def synthetic_collection(number_of_features):
+    members = "".join(
+        "<gml:featureMember><aasg:Well><aasg:Name>Well %d</aasg:Name><aasg:Depth>%s</aasg:Depth>"
+        "<aasg:Temperature>%d.5</aasg:Temperature><aasg:Status>%s</aasg:Status></aasg:Well></gml:featureMember>"
+        % (n, "deep" if n % 10 == 0 else n * 3.5, n % 90, "active" if n % 2 else "abandoned")
+        for n in range(number_of_features)
+    )
+    return etree.fromstring(
+        '<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs" xmlns:gml="http://www.opengis.net/gml" '
+        'xmlns:aasg="http://example.org/aasg">%s</wfs:FeatureCollection>' % members
+    )
+
+def run(number_of_features=50000, processes=None):
+    processes = processes or multiprocessing.cpu_count()
+    handle, schema_path = tempfile.mkstemp(suffix=".xsd")
+    with os.fdopen(handle, "w") as f:
+        f.write(SCHEMA)
+
+    try:
+        schema = etree.XMLSchema(etree.parse(schema_path))
+        elements = synthetic_collection(number_of_features).xpath("//aasg:Well", namespaces={"aasg": "http://example.org/aasg"})
+
+        start = time.time()
+        serial = ValidationResults(elements, schema)
+        serial_time = time.time() - start
+
+        start = time.time()
+        parallel = ValidationResults(elements, schema, ParallelEngine(schema_path, processes))
+        parallel_time = time.time() - start
+    finally:
+        os.remove(schema_path)
+
+    assert serial.valid_count() == parallel.valid_count(), "Valid counts differ"
+    assert serial.errors == parallel.errors, "Error logs differ"
+
+    print "%d features, %d processes" % (number_of_features, processes)
+    print "  serial:   %8.3fs" % serial_time
+    print "  parallel: %8.3fs" % parallel_time
+    print "  speedup:  %8.1fx" % (serial_time / parallel_time)
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,85 @@
+#--------------------------------------------------------------------------------------
+# Benchmark for SchemaIndex.layers_info() against the per-layer XPath implementation
+#     that ModelVersion.layers_info() used to run. Only needs lxml:
+#
+#     python -m modelmanager.benchmarks.bench_schemaindex [layers] [fields]
+#--------------------------------------------------------------------------------------
+from modelmanager.schemaindex import SchemaIndex
+from lxml import etree
+from collections import OrderedDict
+import re
+import sys
+import timeit
+
+NS = {
+    "xs": "http://www.w3.org/2001/XMLSchema"
+}
+
+#--------------------------------------------------------------------------------------
+# Build a multi-layer content-model XSD: a common base type plus one element and
+#     one complexType (extending the base) per layer
+#--------------------------------------------------------------------------------------
+def synthetic_schema(number_of_layers, fields_per_layer):
+    def fields(prefix):
+        return "".join(
+            '<xs:element name="%s%d" type="xs:string" minOccurs="%d">'
+            '<xs:annotation><xs:documentation>Field %d of %s</xs:documentation></xs:annotation>'
+            '</xs:element>' % (prefix, i, i % 2, i, prefix)
+            for i in range(fields_per_layer)
+        )
+
+    parts = [
+        '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:aasg="http://example.org/aasg" '
+        'xmlns:gml="http://www.opengis.net/gml" targetNamespace="http://example.org/aasg">',
+        '<xs:complexType name="CommonType"><xs:complexContent><xs:extension base="gml:AbstractFeatureType">'
+        '<xs:sequence>%s</xs:sequence></xs:extension></xs:complexContent></xs:complexType>' % fields("Common")
+    ]
+    for n in range(number_of_layers):
+        parts.append('<xs:element name="Layer%d" type="aasg:Layer%dType"/>' % (n, n))
+        parts.append(
+            '<xs:complexType name="Layer%dType"><xs:complexContent><xs:extension base="aasg:CommonType">'
+            '<xs:sequence>%s</xs:sequence></xs:extension></xs:complexContent></xs:complexType>' % (n, fields("L%d_" % n))
+        )
+    parts.append('</xs:schema>')
+    return etree.fromstring("".join(parts)).getroottree()
+
+#--------------------------------------------------------------------------------------
+# The previous implementation: one document-wide XPath per layer and per base type
+#--------------------------------------------------------------------------------------
+def xpath_layers_info(schema):
+    def field(element):
+        return {
+            "name": element.get("name"),
+            "type": re.sub("^.*\:", "", element.get("type", next(iter(element.xpath("xs:simpleType/xs:restriction/@base", namespaces=NS)), ""))),
+            "optional": True if element.get("minOccurs", "1") == "0" else False,
+            "description": getattr(next(iter(element.xpath("xs:annotation/xs:documentation", namespaces=NS)), object()), "text", None)
+        }
+
+    layer_names = OrderedDict()
+    for element in schema.xpath("//xs:schema/xs:element", namespaces=NS):
+        layer_names[element.get("name")] = re.sub(r'^.*\:', '', str(element.get("type")))
+
+    layers_fields = OrderedDict()
+    for layer in layer_names:
+        for lyr in schema.xpath("//xs:complexType[@name=\"" + layer_names[layer] + "\"]", namespaces=NS):
+            common_base = re.sub("^.*\:", "", lyr.xpath("xs:complexContent/xs:extension", namespaces=NS)[0].get("base"))
+            field_info = [field(e) for e in schema.xpath("//xs:complexType[@name=\"" + common_base + "\"]/xs:complexContent/xs:extension/xs:sequence/xs:element", namespaces=NS)]
+            field_info += [field(e) for e in lyr.xpath("xs:complexContent/xs:extension/xs:sequence/xs:element", namespaces=NS)]
+            layers_fields[layer] = field_info
+    return layers_fields
+
+def run(number_of_layers=200, fields_per_layer=30, repeat=3):
+    schema = synthetic_schema(number_of_layers, fields_per_layer)
+    assert SchemaIndex(schema).layers_info() == xpath_layers_info(schema), "Implementations disagree"
+
+    xpath_time = min(timeit.repeat(lambda: xpath_layers_info(schema), number=1, repeat=repeat))
+    index_time = min(timeit.repeat(lambda: SchemaIndex(schema).layers_info(), number=1, repeat=repeat))
+
+    print "%d layers x %d fields" % (number_of_layers, fields_per_layer)
+    print "  per-layer XPath: %8.4fs" % xpath_time
+    print "  SchemaIndex:     %8.4fs" % index_time
+    print "  speedup:         %8.1fx" % (xpath_time / index_time)
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,135 @@
+from django.conf import settings
+from os import path
+import os
+import re
+import tempfile
+import zlib
+
+# brotli is optional; without it responses are only gzip-compressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#--------------------------------------------------------------------------------------
+# Compressed responses. Artifacts that are materialized (the catalog feeds and feature
+#     catalogues) or uploaded through Overwriter get compressed copies made once, at
+#     the highest compression level: in the feed cache for feeds, and as .gz and .br
+#     siblings on disk for files. Anything else of at least COMPRESS_MIN_SIZE bytes
+#     with a textual content type is compressed as it is served, at a faster level.
+#--------------------------------------------------------------------------------------
+COMPRESS_MIN_SIZE = getattr(settings, "COMPRESS_MIN_SIZE", 1024)
+PRECOMPRESS = getattr(settings, "PRECOMPRESS_ARTIFACTS", True)
+
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]    # In order of preference
+SUFFIXES = {"gzip": ".gz", "br": ".br"}
+TEXT_TYPES = re.compile(r"^(text/|application/(json|xml|.*\+xml|javascript))")
+
+def compress(content, encoding, fast=False):
+    if encoding == "br":
+        return brotli.compress(content, quality=5 if fast else 11)
+    compressor = zlib.compressobj(6 if fast else 9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(content) + compressor.flush()
+
+# Compressed copies of content that are worth keeping: {encoding: compressed content}.
+#     A copy that saves less than a tenth of the size (a zipped XLSX, say) is dropped.
+def precompress(content):
+    copies = {}
+    if not PRECOMPRESS or len(content) < COMPRESS_MIN_SIZE: return copies
+    for encoding in ENCODINGS:
+        compressed = compress(content, encoding)
+        if len(compressed) < len(content) * 0.9:
+            copies[encoding] = compressed
+    return copies
+
+#--------------------------------------------------------------------------------------
+# Content negotiation. Returns the best of the available encodings that the request's
+#     Accept-Encoding allows, or None for the uncompressed content.
+#--------------------------------------------------------------------------------------
+def accepted_encodings(request):
+    accepted = {}
+    for coding in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        params = coding.split(";")
+        name = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name: accepted[name] = quality
+    return accepted
+
+def preferred_encoding(request, available=ENCODINGS):
+    accepted = accepted_encodings(request)
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+# The content to send for a request: (encoding or None, content). copies is a
+#     dictionary of pre-compressed content, or a function of the encoding that returns
+#     it or None.
+def encode_content(request, content, content_type, copies=None):
+    encoding = preferred_encoding(request)
+    if encoding is None: return None, content
+
+    copy = copies(encoding) if callable(copies) else (copies or {}).get(encoding)
+    if copy is None and len(content) >= COMPRESS_MIN_SIZE and TEXT_TYPES.match(content_type or ""):
+        copy = compress(content, encoding, fast=True)
+    if copy is None: return None, content
+    return encoding, copy
+
+#--------------------------------------------------------------------------------------
+# Files on disk, and their compressed siblings (file.xsd -> file.xsd.gz, file.xsd.br)
+#--------------------------------------------------------------------------------------
+def sibling_path(file_path, encoding):
+    return file_path + SUFFIXES[encoding]
+
+# Write a file by renaming a finished temporary file over it, so that it is never
+#     served half-written
+def write_file(file_path, content):
+    folder = path.dirname(file_path)
+    if not path.exists(folder):
+        os.makedirs(folder)
+    handle, temp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(content)
+        os.chmod(temp_path, 0644)
+        os.rename(temp_path, file_path)
+    except:
+        os.remove(temp_path)
+        raise
+
+# Write the compressed siblings of a file, and remove any that are no longer worth having
+def write_compressed_siblings(file_path, content=None):
+    if content is None:
+        with open(file_path, "rb") as f:
+            content = f.read()
+
+    copies = precompress(content)
+    for encoding in SUFFIXES:
+        if encoding in copies:
+            write_file(sibling_path(file_path, encoding), copies[encoding])
+        elif path.exists(sibling_path(file_path, encoding)):
+            os.remove(sibling_path(file_path, encoding))
+
+def remove_compressed_siblings(file_path):
+    for encoding in SUFFIXES:
+        try:
+            os.remove(sibling_path(file_path, encoding))
+        except OSError:
+            pass    # There wasn't one
+
+# The contents of a file's sibling for an encoding, or None if it doesn't have one
+def read_sibling(file_path, encoding):
+    try:
+        with open(sibling_path(file_path, encoding), "rb") as f:
+            return f.read()
+    except IOError:
+        return None
@@ -9,6 +9,79 @@ URI_REGISTER_URL = 'http://localhost:8000/uri-gin/'
 # Put the site's base URL here.
 BASE_URL = 'http://localhost:8000/'
 
+# Number of compiled XML Schema validators to keep in memory per process
+SCHEMA_VALIDATOR_CACHE_SIZE = 32
+
+# Which of the CACHES below holds metadata parsed out of XSD files, and for how long.
+#   Use a file-based or database cache to keep it across restarts.
+SCHEMA_METADATA_CACHE = 'default'
+SCHEMA_METADATA_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# Which cache holds the pre-rendered /contentmodels.* feeds. With more than one server
+#   process this should be a shared cache (memcached, database or file-based).
+FEED_CACHE = 'default'
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# Pages of /contentmodels.json?limit=... and /changes.json: the default and largest sizes
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Feeds, feature catalogues and uploaded files get gzip (and, if the brotli package is
+#   installed, brotli) compressed copies when they are written. Other responses of at
+#   least COMPRESS_MIN_SIZE bytes are compressed as they are sent.
+PRECOMPRESS_ARTIFACTS = True
+COMPRESS_MIN_SIZE = 1024
+
+# Requests to WFS servers: timeout in seconds, and connections kept open per host.
+#   GetCapabilities documents are reused for WFS_CAPABILITIES_TTL seconds, then revalidated.
+WFS_FETCH_TIMEOUT = 30
+WFS_FETCH_POOL_SIZE = 10
+WFS_CAPABILITIES_TTL = 300
+
+# "All" features of a layer are requested WFS_PAGE_SIZE at a time (0 for one request),
+#   with up to WFS_PAGE_PREFETCH pages downloading while the current one is validated.
+WFS_PAGE_SIZE = 1000
+WFS_PAGE_PREFETCH = 3
+
+# WFS validation runs are kept, with a hash of every feature. A re-run against the same
+#   service reuses the results of features that (and whose schema) haven't changed.
+WFS_INCREMENTAL_VALIDATION = True
+
+# Features of a layer (the changed ones, with incremental validation) can be validated in
+#   this many worker processes, WFS_VALIDATION_BATCH_SIZE at a time when not incremental
+#   (0 validates them in the server process).
+WFS_VALIDATION_PROCESSES = 0
+WFS_VALIDATION_BATCH_SIZE = 200
+
+# WFS and CSV validations run in the background on this many threads per server process.
+#   Set to 0 to validate within the request instead.
+VALIDATION_JOB_WORKERS = 2
+
+# Jobs still queued or running after this many seconds (say, because the server restarted)
+#   are reported as failed.
+VALIDATION_JOB_TIMEOUT = 60 * 60 * 6
+
+# Uploaded CSV files wait here to be validated (None for the system's temporary directory).
+#   Corrected output is kept in memory up to CSV_SPOOL_SIZE bytes, then written to disk.
+CSV_UPLOAD_DIR = None
+CSV_SPOOL_SIZE = 1024 * 1024
+
+# Corrected CSV files are kept here for download, for CSV_OUTPUT_TTL seconds.
+CSV_OUTPUT_DIR = '/tmp/modelmanager-csv'
+CSV_OUTPUT_TTL = 60 * 60 * 24
+
+# Seconds before the CSV validator reloads its list of models and layers from usginmodels
+CSV_CATALOG_TTL = 60 * 60
+
+# Batch WFS validation (/validate/batch and manage.py validate_wfs_batch): entries validated
+#   at once, and requests allowed to any one host at a time.
+WFS_BATCH_WORKERS = 8
+WFS_BATCH_HOST_CONCURRENCY = 2
+
+# Batches are queued at /validate/batch by logged-in staff users, or by scripts sending
+#   "Authorization: Token <WFS_BATCH_API_TOKEN>" (None to allow staff users only).
+WFS_BATCH_API_TOKEN = None
+
 #--------------------------------------------------------------------------------------
 
 # Django settings for cm project.
@@ -33,6 +106,12 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
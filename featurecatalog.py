@@ -0,0 +1,68 @@
+from django.template.loader import render_to_string
+from schemacache import file_fingerprint
+from feedcache import conditional_response
+from compression import write_file, write_compressed_siblings, read_sibling
+from os import path
+import hashlib
+
+#--------------------------------------------------------------------------------------
+# ISO 19110 FeatureCatalogue documents are rendered once, when a ModelVersion is saved,
+#     and written next to its XSD and XLS files. The ETag of a catalogue is a digest of
+#     everything the template reads: the XSD's contents and the few ContentModel and
+#     ModelVersion fields it shows. It is stored on the ModelVersion, so a catalogue is
+#     only re-rendered when one of those changes, and conditional GETs are answered
+#     without reading the file. Compressed siblings are written along with it.
+#--------------------------------------------------------------------------------------
+FEATURE_CATALOG_FILENAME = "featureCatalog.xml"
+FEATURE_CATALOG_TEMPLATE = "featureCatalog.xml"
+
+def catalog_etag(modelversion):
+    cm = modelversion.content_model
+    parts = [
+        file_fingerprint(modelversion.xsd_file.path)[2],
+        cm.label,
+        cm.title,
+        cm.cleaned_description(),
+        modelversion.version,
+        modelversion.absolute_uri()
+    ]
+    return hashlib.md5(u"\n".join(unicode(part) for part in parts).encode("utf-8")).hexdigest()
+
+#--------------------------------------------------------------------------------------
+# Render and write a version's catalogue, unless the one on disk is already current.
+#     Returns the catalogue's ETag.
+#--------------------------------------------------------------------------------------
+def refresh_feature_catalog(modelversion, force=False):
+    etag = catalog_etag(modelversion)
+    file_path = modelversion.feature_catalog_path()
+    if not force and etag == modelversion.feature_catalog_etag and path.exists(file_path):
+        return etag
+
+    content = render_to_string(FEATURE_CATALOG_TEMPLATE, {"version": modelversion}).encode("utf-8")
+    write_file(file_path, content)
+    write_compressed_siblings(file_path, content)
+
+    # A queryset update doesn't send post_save, which would render the catalogue again
+    type(modelversion).objects.filter(pk=modelversion.pk).update(feature_catalog_etag=etag)
+    modelversion.feature_catalog_etag = etag
+    return etag
+
+# Forget a version's catalogue so that it is rendered by the next request for it
+def forget_feature_catalog(modelversion):
+    type(modelversion).objects.filter(pk=modelversion.pk).update(feature_catalog_etag="")
+    modelversion.feature_catalog_etag = ""
+
+#--------------------------------------------------------------------------------------
+# Serve a version's catalogue from disk, rendering it first if it is missing
+#--------------------------------------------------------------------------------------
+def feature_catalog_response(request, modelversion):
+    file_path = modelversion.feature_catalog_path()
+    etag = modelversion.feature_catalog_etag
+    if not etag or not path.exists(file_path):
+        etag = refresh_feature_catalog(modelversion, force=True)
+
+    def read_catalog():
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    return conditional_response(request, read_catalog, "text/xml", etag, copies=lambda encoding: read_sibling(file_path, encoding))
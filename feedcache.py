@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.cache import get_cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+from compression import ENCODINGS, precompress, encode_content
+import hashlib
+
+#--------------------------------------------------------------------------------------
+# The catalog feeds (/contentmodels.json, .xml, .html, .drupal) only change when a
+#     ContentModel or ModelVersion is saved or deleted. Saves and deletes drop them, and
+#     the next request renders them and keeps them in a Django cache together with a
+#     strong ETag. They have no Last-Modified date: no stored date moves with every
+#     change (edits, deletes) to second precision, so revalidation relies on the ETag.
+#     In multi-process deployments FEED_CACHE should name a shared cache (memcached,
+#     database or file-based) so that every process sees the refreshed feeds;
+#     FEED_CACHE_TIMEOUT bounds how stale a process-local cache can get. Compressed
+#     copies are made at the same time (see compression.py).
+#--------------------------------------------------------------------------------------
+FEED_EXTENSIONS = ["json", "xml", "html", "drupal"]
+FEED_TIMEOUT = getattr(settings, "FEED_CACHE_TIMEOUT", 60 * 60)
+
+def feed_cache():
+    return get_cache(getattr(settings, "FEED_CACHE", "default"))
+
+def feed_key(extension):
+    return "modelmanager:feed:%s" % extension
+
+#--------------------------------------------------------------------------------------
+# A rendered representation, ready to be served with validators
+#--------------------------------------------------------------------------------------
+class RenderedFeed(object):
+    def __init__(self, content, content_type, last_modified=None):
+        self.content = content
+        self.content_type = content_type
+        self.etag = hashlib.md5(content).hexdigest()
+        self.last_modified = last_modified    # Seconds since the epoch, or None
+        self.compressed = precompress(content)    # Content-Encoding -> compressed content
+
+# Render one feed. render(contentmodels) must return an HttpResponse.
+def render_feed(contentmodels, render):
+    response = render(list(contentmodels))
+    return RenderedFeed(response.content, response["Content-Type"])
+
+#--------------------------------------------------------------------------------------
+# Return the cached feed for an extension, rendering and storing it on a miss
+#--------------------------------------------------------------------------------------
+def cached_feed(extension, contentmodels, render):
+    cache = feed_cache()
+    feed = cache.get(feed_key(extension))
+    if feed is None:
+        feed = render_feed(contentmodels, render)
+        cache.set(feed_key(extension), feed, FEED_TIMEOUT)
+    return feed
+
+#--------------------------------------------------------------------------------------
+# Drop every feed. Called when ContentModels and ModelVersions are saved or deleted;
+#     the feeds are rendered again by the next request for them.
+#--------------------------------------------------------------------------------------
+def forget_feeds():
+    feed_cache().delete_many([feed_key(extension) for extension in FEED_EXTENSIONS])
+
+#--------------------------------------------------------------------------------------
+# Serve content with ETag and Last-Modified headers, answering conditional GETs
+#     with 304 Not Modified. If-None-Match takes precedence over If-Modified-Since.
+#     content may be a function, which is only called if the content is sent.
+#     Compressed content is sent to clients that accept it, with the encoding appended
+#     to its ETag; copies maps encodings to pre-compressed content (see compression.py).
+#--------------------------------------------------------------------------------------
+
+# The ETag in If-None-Match that matches the content in any of its encodings, or None
+def matching_etag(request, etag):
+    etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    for tag in [etag] + ["%s-%s" % (etag, encoding) for encoding in ENCODINGS]:
+        if tag in etags: return tag
+    if "*" in etags: return etag
+    return None
+
+def not_modified(request, etag, last_modified=None):
+    if request.META.get("HTTP_IF_NONE_MATCH"):
+        return matching_etag(request, etag) is not None
+
+    if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    if if_modified_since is not None and last_modified is not None:
+        return int(last_modified) <= if_modified_since
+
+    return False
+
+def conditional_response(request, content, content_type, etag, last_modified=None, copies=None):
+    if request.method in ("GET", "HEAD") and not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+        response["ETag"] = quote_etag(matching_etag(request, etag) or etag)
+    else:
+        encoding, content = encode_content(request, content() if callable(content) else content, content_type, copies)
+        response = HttpResponse(content, content_type=content_type)
+        if encoding is not None:
+            response["Content-Encoding"] = encoding
+            etag = "%s-%s" % (etag, encoding)
+        response["ETag"] = quote_etag(etag)
+
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+# Feeds cached before compressed copies were kept don't have any
+def feed_response(request, feed):
+    return conditional_response(request, feed.content, feed.content_type, feed.etag, feed.last_modified, getattr(feed, "compressed", None))
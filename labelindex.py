@@ -0,0 +1,49 @@
+from models import ContentModel, ModelVersion
+from django.db.models.signals import post_save, post_delete
+import threading
+
+#--------------------------------------------------------------------------------------
+# An in-process map from ContentModel labels, and (label, version) pairs, to primary
+#     keys. Entries are filled in from single indexed queries as they are asked for;
+#     labels that don't exist are not remembered, so the map only ever holds real
+#     models and versions. The whole map is dropped when a ContentModel or
+#     ModelVersion is saved or deleted in this process. Other processes can hold
+#     stale entries, so callers should check the object they fetch by primary key
+#     still has the label they asked for, and call forget() if it doesn't.
+#--------------------------------------------------------------------------------------
+class LabelIndex(object):
+    def __init__(self):
+        self.pks = {}    # (label, version or None) -> primary key
+        self.lock = threading.Lock()
+
+    # The primary key of a ContentModel, or of one of its ModelVersions if a version
+    #     is given. None if there is no such model or version.
+    def lookup(self, label, version=None):
+        key = (label, version)
+        with self.lock:
+            if key in self.pks: return self.pks[key]
+
+        if version is None:
+            pks = ContentModel.objects.filter(label=label).values_list('pk', flat=True)
+        else:
+            pks = ModelVersion.objects.filter(content_model__label=label, version=version).values_list('pk', flat=True)
+        pks = list(pks[:1])
+        if len(pks) == 0: return None
+
+        with self.lock:
+            self.pks[key] = pks[0]
+        return pks[0]
+
+    def forget(self):
+        with self.lock:
+            self.pks = {}
+
+label_index = LabelIndex()
+
+def forget_labels(sender=None, instance=None, **kwargs):
+    label_index.forget()
+
+post_save.connect(forget_labels, sender=ContentModel)
+post_save.connect(forget_labels, sender=ModelVersion)
+post_delete.connect(forget_labels, sender=ContentModel)
+post_delete.connect(forget_labels, sender=ModelVersion)
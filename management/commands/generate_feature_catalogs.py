@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from modelmanager.models import ModelVersion
+from modelmanager.featurecatalog import refresh_feature_catalog
+from optparse import make_option
+import sys
+
+#--------------------------------------------------------------------------------------
+# manage.py generate_feature_catalogs [--force]
+#     Writes the ISO 19110 feature catalogue of every ModelVersion that doesn't have a
+#     current one. Catalogues are written whenever versions are saved; this fills them
+#     in for existing versions, and --force re-renders them after the template changes.
+#--------------------------------------------------------------------------------------
+class Command(BaseCommand):
+    help = "Write the feature catalogue of every ModelVersion next to its XSD"
+    option_list = BaseCommand.option_list + (
+        make_option("--force", action="store_true", default=False, help="Re-render catalogues that are already current"),
+    )
+
+    def handle(self, *args, **options):
+        versions = ModelVersion.objects.select_related('content_model')
+        failed = 0
+        for modelversion in versions:
+            try:
+                refresh_feature_catalog(modelversion, options["force"])
+            except Exception, err:
+                failed += 1
+                sys.stderr.write("Could not write the catalogue of %s: %s\n" % (modelversion, err))
+                continue
+            if int(options["verbosity"]) > 1:
+                sys.stderr.write("Wrote %s\n" % modelversion.feature_catalog_path())
+
+        sys.stderr.write("%s of %s feature catalogues are current\n" % (len(versions) - failed, len(versions)))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from modelmanager.models import ModelVersion, LayerField
+import sys
+
+#--------------------------------------------------------------------------------------
+# manage.py index_layer_fields
+#     Rebuilds the LayerField rows of every ModelVersion from its XSD. Versions are
+#     re-indexed whenever they are saved; this fills the table for existing versions.
+#--------------------------------------------------------------------------------------
+class Command(BaseCommand):
+    help = "Rebuild the index of layer fields from every ModelVersion's XSD"
+
+    def handle(self, *args, **options):
+        versions = ModelVersion.objects.select_related('content_model')
+        for modelversion in versions:
+            modelversion.index_fields()
+            if int(options["verbosity"]) > 1:
+                sys.stderr.write("Indexed %s\n" % modelversion)
+
+        sys.stderr.write("%s fields indexed from %s versions\n" % (LayerField.objects.count(), len(versions)))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from modelmanager.models import ContentModel, ModelVersion
+from modelmanager.uriconfigure import RuleSync, RewriteRule, run_in_transaction, generated_rules, CHUNK_SIZE
+from optparse import make_option
+import sys
+import time
+
+#--------------------------------------------------------------------------------------
+# manage.py rebuild_rewrite_rules [--dry-run] [--prune]
+#     Recomputes the RewriteRule and AcceptMappings of every ContentModel and
+#     ModelVersion, for instance after BASE_URL or SCHEMA_URI has changed, and applies
+#     the differences in bulk (see uriconfigure.RuleSync). --dry-run lists the changes
+#     without making them. --prune also deletes rules that this app wrote but no content
+#     model or version uses any more (see uriconfigure.generated_rules); other rules in
+#     the register are left alone. With --dry-run they are listed instead.
+#--------------------------------------------------------------------------------------
+class Command(BaseCommand):
+    help = "Rebuild the URI rewrite rules of every content model and version"
+    option_list = BaseCommand.option_list + (
+        make_option("--dry-run", action="store_true", dest="dry_run", default=False, help="List the changes without making them"),
+        make_option("--prune", action="store_true", default=False, help="Delete rules this app wrote that nothing uses")
+    )
+
+    def handle(self, *args, **options):
+        started = time.time()
+        sync = RuleSync(options["dry_run"])
+        pruned = run_in_transaction(self.rebuild, sync, options["prune"])
+
+        if options["dry_run"] or int(options["verbosity"]) > 1:
+            for change in sync.changes:
+                sys.stdout.write("%s\n" % change)
+
+        counts = ", ".join("%s %s" % (sync.counts[kind], kind) for kind in ["rules created", "rules updated", "mappings created", "mappings deleted"])
+        sys.stderr.write("%s%s, %s unused rules %s in %.2f seconds\n" % (
+            "Dry run: " if options["dry_run"] else "", counts, pruned,
+            "found" if options["dry_run"] else "deleted", time.time() - started
+        ))
+
+    # Sync every object in one pass. Versions are given their ContentModel from memory
+    #     so that building the desired mappings doesn't query for it.
+    def rebuild(self, sync, prune):
+        models = dict((cm.pk, cm) for cm in ContentModel.objects.select_related("rewrite_rule", "latest_modelversion"))
+        items = [ (cm, "ContentModel") for cm in models.values() ]
+        for version in ModelVersion.objects.select_related("rewrite_rule"):
+            version.content_model = models[version.content_model_id]
+            items.append((version, "ModelVersion"))
+        rules = sync.sync_all(items)
+
+        if not prune: return 0
+        used = set(rule.pk for rule in rules if rule is not None)
+        unused = []
+        for pk, label, pattern in generated_rules(sync.default_register()).values_list("pk", "label", "pattern"):
+            if pk in used: continue
+            unused.append(pk)
+            sync.changes.append("Unused rule %s: %s" % (label, pattern))
+        if not sync.dry_run:
+            for start in range(0, len(unused), CHUNK_SIZE):
+                RewriteRule.objects.filter(pk__in=unused[start:start + CHUNK_SIZE]).delete()
+        return len(unused)
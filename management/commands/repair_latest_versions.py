@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from modelmanager.models import ContentModel, ModelVersion
+import sys
+
+#--------------------------------------------------------------------------------------
+# manage.py repair_latest_versions
+#     Recomputes ContentModel.latest_modelversion and last_updated from the versions in
+#     the database, for instance after adding the columns to an existing database.
+#     Only models whose stored values are wrong are updated.
+#--------------------------------------------------------------------------------------
+class Command(BaseCommand):
+    help = "Recompute the latest version and last updated date of every content model"
+
+    def handle(self, *args, **options):
+        # The newest version of each model, from one pass over all versions
+        latest = {}
+        for version in ModelVersion.objects.order_by('date_created', 'pk').only('pk', 'content_model', 'date_created'):
+            latest[version.content_model_id] = version
+
+        repaired = 0
+        for cm in ContentModel.objects.only('pk', 'title', 'latest_modelversion', 'last_updated'):
+            version = latest.get(cm.pk)
+            wanted = (version.pk if version else None, version.date_created if version else None)
+            if (cm.latest_modelversion_id, cm.last_updated) != wanted:
+                ContentModel.objects.filter(pk=cm.pk).update(latest_modelversion=wanted[0], last_updated=wanted[1])
+                repaired += 1
+                if int(options["verbosity"]) > 1:
+                    sys.stderr.write("Repaired %s\n" % cm.title)
+
+        sys.stderr.write("%s content models repaired\n" % repaired)
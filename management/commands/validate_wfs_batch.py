@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from modelmanager.validation.validators.batch import BatchValidation, ManifestError, read_manifest, write_report, WORKERS, HOST_CONCURRENCY
+from optparse import make_option
+import sys
+
+#--------------------------------------------------------------------------------------
+# manage.py validate_wfs_batch manifest.json [--format csv] [--output report.csv]
+#     Validates every entry of a manifest (see validation/validators/batch.py) and
+#     writes a report. Exits with status 1 if any entry was not valid.
+#--------------------------------------------------------------------------------------
+class Command(BaseCommand):
+    args = "<manifest file>"
+    help = "Validate a manifest of WFS services and write a JSON or CSV report"
+    option_list = BaseCommand.option_list + (
+        make_option("--format", default="json", choices=["json", "csv"], help="Report format: json (default) or csv"),
+        make_option("--output", default=None, help="Write the report to this file instead of standard output"),
+        make_option("--workers", type="int", default=WORKERS, help="How many entries to validate at once"),
+        make_option("--per-host", type="int", default=HOST_CONCURRENCY, dest="per_host", help="How many requests to make to one host at once")
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Give the path of one manifest file")
+
+        manifest_path = args[0]
+        try:
+            with open(manifest_path, "r") as manifest:
+                entries = read_manifest(manifest.read(), "csv" if manifest_path.lower().endswith(".csv") else "json")
+        except (IOError, ManifestError), err:
+            raise CommandError(str(err))
+
+        def progress(done, failed):
+            if int(options["verbosity"]) > 1:
+                sys.stderr.write("%s of %s validated, %s not valid\n" % (done, len(entries), failed))
+
+        rows = BatchValidation(entries, options["workers"], options["per_host"]).run(progress)
+
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                write_report(rows, output, options["format"])
+        else:
+            write_report(rows, sys.stdout, options["format"])
+
+        if any(row["status"] != "valid" for row in rows):
+            sys.exit(1)
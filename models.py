@@ -1,14 +1,20 @@
 from django.db import models
 from django.conf import settings
 from django.template.defaultfilters import slugify
-from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.utils import timezone
 #from django.dispatch import receiver
-from uriconfigure import adjust_rewrite_rule, delete_rewrite_rule, update_related_rewrite_rules, RewriteRule
+from uriconfigure import adjust_rewrite_rule, delete_rewrite_rule, update_related_rewrite_rules, RewriteRule, run_in_transaction
 from os import path
-from lxml import etree
 from overwriter import Overwriter
+from schemacache import validator_cache, cached_schema_metadata, forget_schema_metadata
+from schemaindex import SchemaIndex
+from feedcache import forget_feeds
+from featurecatalog import FEATURE_CATALOG_FILENAME, refresh_feature_catalog, forget_feature_catalog
+from lxml import etree
+import json
 import re
-from collections import OrderedDict
+import uuid
 
 #--------------------------------------------------------------------------------------
 # Function that gets the path for a uploaded files.
@@ -38,6 +44,15 @@ def add_target_to_anchors(string_to_fix, target="_blank"):
     
     return re.sub(pattern, repl_func, string_to_fix)    
  
+#--------------------------------------------------------------------------------------
+# Manager for ContentModels. with_versions() loads every model's versions in a single
+#     extra query, and each model's latest version in the same query as the model,
+#     which the feed renderers rely on to avoid a query per model.
+#--------------------------------------------------------------------------------------
+class ContentModelManager(models.Manager):
+    def with_versions(self):
+        return self.get_query_set().select_related('latest_modelversion').prefetch_related('modelversion_set')
+
 #--------------------------------------------------------------------------------------
 # This class represent specific USGIN content-models, which are built to convey
 #     specific types of geoscience information.
@@ -54,6 +69,23 @@ class ContentModel(models.Model):
     status = models.TextField(blank=True)
     rewrite_rule = models.OneToOneField(RewriteRule, null=True, blank=True)
     
+    # The most recent version and its creation date, kept up to date by the ModelVersion
+    #     signal handlers below. manage.py repair_latest_versions recomputes them.
+    latest_modelversion = models.ForeignKey('ModelVersion', null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    last_updated = models.DateField(null=True, blank=True)
+    
+    objects = ContentModelManager()
+    
+    # Saves and deletes commit along with the work of the signal handlers below. See
+    #     ModelVersion.save.
+    def save(self, *args, **kwargs):
+        run_in_transaction(lambda: super(ContentModel, self).save(*args, **kwargs))
+        forget_feeds()
+    
+    def delete(self, *args, **kwargs):
+        run_in_transaction(lambda: super(ContentModel, self).delete(*args, **kwargs))
+        forget_feeds()
+    
     # Functions to return cleaned-up properties
     def cleaned_description(self):
         return removeTags(self.description)
@@ -72,10 +104,22 @@ class ContentModel(models.Model):
     def folder_path(self):
         return slugify(self.title)
     
+    # All versions of this instance, most recent first. Sorting happens in memory so
+    #     that models loaded through ContentModel.objects.with_versions() need no queries.
+    def versions_newest_first(self):
+        return sorted(self.modelversion_set.all(), key=lambda v: (v.date_created, v.pk), reverse=True)
+    
     # Simple pointer to the latest version of a instance
     def latest_version(self):
-        if self.modelversion_set.count() > 0: return self.modelversion_set.latest('date_created')
-        else: return None
+        return self.latest_modelversion
+    
+    # Look up the latest version and store it, and its date, on this instance. Uses an
+    #     update query so that ContentModel save signals don't fire again.
+    def refresh_latest_version(self):
+        versions = self.modelversion_set.order_by('-date_created', '-pk')[:1]
+        self.latest_modelversion = versions[0] if len(versions) > 0 else None
+        self.last_updated = self.latest_modelversion.date_created if self.latest_modelversion is not None else None
+        ContentModel.objects.filter(pk=self.pk).update(latest_modelversion=self.latest_modelversion, last_updated=self.last_updated)
     
     # Simply return the latest version number
     def latest_version_number(self):
@@ -85,9 +129,7 @@ class ContentModel(models.Model):
     
     # The updated date for an instance is the last time that a version was created
     def date_updated(self):
-        version = self.latest_version()
-        if version is not None: return version.date_created
-        else: return None
+        return self.last_updated
         
     # Return the updated date as an ISO-formatted string
     def iso_date_updated(self):
@@ -98,26 +140,26 @@ class ContentModel(models.Model):
     # Return the absolute path to the latest version's XSD file
     def absolute_latest_xsd_path(self):
         version = self.latest_version()
-        if version is not None: return self.latest_version().absolute_xsd_path()
+        if version is not None: return version.absolute_xsd_path()
         else: return None
     
     # Return the absolute path to the latest version's XLS file
     def absolute_latest_xls_path(self):
         version = self.latest_version()
-        if version is not None: return self.latest_version().absolute_xls_path()
+        if version is not None: return version.absolute_xls_path()
         else: return None
     
     # Provide a link to the latest version's XSD file
     def latest_xsd_link(self):
         version = self.latest_version()
-        if version != None: return self.latest_version().xsd_link()
+        if version != None: return version.xsd_link()
         else: return None
     latest_xsd_link.allow_tags = True
     
     # Provide a link to the latest version's XLS file
     def latest_xls_link(self):
         version = self.latest_version()
-        if version != None: return self.latest_version().xls_link()
+        if version != None: return version.xls_link()
         else: return None
     latest_xls_link.allow_tags = True
     
@@ -171,22 +213,25 @@ class ContentModel(models.Model):
     
     # Return the most recent three versions, most recent first
     def recent_versions(self):
-        return self.modelversion_set.order_by("-date_created")[:3]
+        return self.versions_newest_first()[:3]
     
     # Return the instance as a dictionary that can be easily converted to JSON
-    #     Include a list of versions relevant to this content model
-    def serialized(self):
-        as_json = {
-            'title': self.title,
-            'uri': self.absolute_uri(),
-            'label': self.label,
-            'description': self.description,
-            'discussion': self.discussion,
-            'status': self.status,
-            'date_updated': self.iso_date_updated(),
-            'versions': [ mv.serialized() for mv in self.modelversion_set.all() ]
-        }        
-        return as_json
+    #     Include a list of versions relevant to this content model. fields and
+    #     version_fields limit the keys to those named; the rest are never computed.
+    SERIALIZED_FIELDS = ['title', 'uri', 'label', 'description', 'discussion', 'status', 'date_updated', 'versions']
+
+    def serialized(self, fields=None, version_fields=None):
+        getters = {
+            'title': lambda: self.title,
+            'uri': self.absolute_uri,
+            'label': lambda: self.label,
+            'description': lambda: self.description,
+            'discussion': lambda: self.discussion,
+            'status': lambda: self.status,
+            'date_updated': self.iso_date_updated,
+            'versions': lambda: [ mv.serialized(version_fields) for mv in self.modelversion_set.all() ]
+        }
+        return dict((name, getters[name]()) for name in self.SERIALIZED_FIELDS if fields is None or name in fields)
 
     # Return the layer name that should be used for this model
     def layer_name(self):
@@ -199,6 +244,7 @@ class ContentModel(models.Model):
 class ModelVersion(models.Model):
     class Meta:
         ordering = ['version']    # Defines the order of any list of ModelVersions
+        unique_together = ('content_model', 'version')    # Also the index for lookups by label and version
         
     # Define the models data members
     content_model = models.ForeignKey('ContentModel')
@@ -210,6 +256,20 @@ class ModelVersion(models.Model):
     lyr_file = models.FileField(upload_to=get_file_path, storage=Overwriter(), blank=True)
     sample_wfs_request = models.CharField(max_length=2000, blank=True)
     rewrite_rule = models.OneToOneField(RewriteRule, null=True, blank=True)
+    feature_catalog_etag = models.CharField(max_length=32, blank=True, editable=False)    # See featurecatalog.py
+
+    # Save or delete in one transaction with the signal handlers below, so that the
+    #     ContentModel's latest version is never left out of step with its versions. A
+    #     transaction the caller already has open (the admin's, say) is joined rather
+    #     than committed early. Cached feeds are dropped again afterwards, in case a
+    #     request rendered them from the old rows in the meantime.
+    def save(self, *args, **kwargs):
+        run_in_transaction(lambda: super(ModelVersion, self).save(*args, **kwargs))
+        forget_feeds()
+
+    def delete(self, *args, **kwargs):
+        run_in_transaction(lambda: super(ModelVersion, self).delete(*args, **kwargs))
+        forget_feeds()
 
     # Return the first-decimal, or "Major" version number. In the case of version 1.23 this would be 1.2
     def major_version(self):
@@ -292,130 +352,257 @@ class ModelVersion(models.Model):
         return '<a href="/admin/uriredirect/rewriterule/%s">Edit Rule</a>' % self.rewrite_rule.pk
     rewrite_rule_link.allow_tags = True
     
+    # The pre-generated ISO 19110 feature catalogue, kept beside the XSD and XLS files
+    def feature_catalog_path(self):
+        return path.join(settings.MEDIA_ROOT, get_file_path(self, FEATURE_CATALOG_FILENAME))
+
     # Return the created date in ISO format
     def iso_date_created(self):
         return self.date_created.isoformat()
     
-    # Return an lxml.etree.XMLSchema validator
+    # Return an lxml.etree.XMLSchema validator. Compiled validators are cached per
+    #     thread, since they can't be shared between threads, and recompiled only when
+    #     the XSD file's fingerprint changes.
     def schema_validator(self):
-        class SchemaResolver(etree.Resolver):
-            def resolve(self, url, id, context):
-                schema_folder = path.join(
-                    path.dirname(__file__), 
-                    "validation", 
-                    "schemas.opengis.net"
-                )
-
-                if url == "http://schemas.opengis.net/gml/3.1.1/base/gml.xsd":
-                    that = path.join(
-                        schema_folder,
-                        "gml",
-                        "3.1.1",
-                        "base",
-                        "gml.xsd"
-                    )
-                    return self.resolve_filename(that, context)
-                else:    
-                    return self.resolve_filename(url, context)
-        
-        parser = etree.XMLParser()
-        parser.resolvers.add(SchemaResolver())
-        
-        # I don't know why this isn't working: schema_file = self.xsd_file.open()
-        schema_file = open(self.xsd_file.path, 'r')
-        schema_doc = etree.parse(schema_file, parser)
-        try:
-            schema = etree.XMLSchema(schema_doc)
-        except etree.XMLSchemaParseError, err:
-            print err
-        return schema
+        return validator_cache.get(self)
     
     # Return the instance as a dictionary that can be easily converted to JSON.
-    #     Contains URLs to directly download files 
-    def serialized(self):
-        as_json = {
-            'uri': self.absolute_uri(),
-            'version': self.version,
-            'date_created': self.date_created.isoformat(),
-            'xsd_file_path': self.absolute_xsd_path(),
-            'xls_file_path': self.absolute_xls_path(),
-            'sld_file_path': self.absolute_sld_path(),
-            'sample_wfs_request': self.sample_wfs_request,
-            'layers_info': self.layers_info()
+    #     Contains URLs to directly download files. fields limits the keys to those
+    #     named, so that layers_info isn't read from the XSD unless it is wanted.
+    SERIALIZED_FIELDS = ['uri', 'version', 'date_created', 'xsd_file_path', 'xls_file_path', 'sld_file_path', 'sample_wfs_request', 'layers_info']
+
+    def serialized(self, fields=None):
+        getters = {
+            'uri': self.absolute_uri,
+            'version': lambda: self.version,
+            'date_created': self.iso_date_created,
+            'xsd_file_path': self.absolute_xsd_path,
+            'xls_file_path': self.absolute_xls_path,
+            'sld_file_path': self.absolute_sld_path,
+            'sample_wfs_request': lambda: self.sample_wfs_request,
+            'layers_info': self.layers_info
         }
-        return as_json
+        return dict((name, getters[name]()) for name in self.SERIALIZED_FIELDS if fields is None or name in fields)
 
-    # Parse a schema document to find details about fields
+    # Details about the fields of each layer in the schema, cached per XSD revision
     def layers_info(self):
-        schema_file = open(self.xsd_file.path, 'r')
-        schema = etree.parse(schema_file)
-        ns = {
-            "gco": "http://isotc211.org/2005/gco",
-            "gmd": "http://isotc211.org/2005/gmd",
-            "gmx": "http://isotc211.org/2005/gmx",
-            "gss": "http://isotc211.org/2005/gss",
-            "gfc": "http://isotc211.org/2005/gfc",
-            "gsr": "http://isotc211.org/2005/gsr",
-            "gts": "http://isotc211.org/2005/gts",
-            "gml": "http://www.opengis.net/gml/3.2",
-            "xlink": "http://www.w3.org/1999/xlink",
-            "xs": "http://www.w3.org/2001/XMLSchema"
-        }
+        return cached_schema_metadata(self, "layers_info", self.parse_layers_info)
 
-        # Create a dictionary of the layer names in a schema
-        # The layer name is the key and layer type is the value
-        layer_names = OrderedDict()
-        for element in schema.xpath("//xs:schema/xs:element", namespaces=ns):
-            layer_type = str(element.get("type"))
-            layer_names[element.get("name")] = re.sub(r'^.*\:', '', layer_type)
-
-        layers_fields = OrderedDict()
-
-        # Add each layer and its field info to the dictionary of all layers and associated field info
-        for layer in layer_names:
-            for lyr in schema.xpath("//xs:complexType[@name=\""+ layer_names[layer] + "\"]", namespaces=ns):
-                field_info = []
-
-                # For each layer, get its base type and if there is another layer whose name matches the base
-                # type (as is the case when there are common fields which are not listed with each layer but
-                # instead listed separately) append those fields to the beginning of the field list for the layer
-                common_base = re.sub("^.*\:", "", lyr.xpath("xs:complexContent/xs:extension", namespaces=ns)[0].get("base"))
-                for element in schema.xpath("//xs:complexType[@name=\"" + common_base + "\"]/xs:complexContent/xs:extension/xs:sequence/xs:element", namespaces=ns):
-                    field_info.append({
-                        "name": element.get("name"),
-                        "type": re.sub("^.*\:", "", element.get("type", next(iter(element.xpath("xs:simpleType/xs:restriction/@base", namespaces=ns)), ""))),
-                        "optional": True if element.get("minOccurs", "1") == "0" else False,
-                        "description": getattr(next(iter(element.xpath("xs:annotation/xs:documentation", namespaces=ns)), object()), "text", None)
-                    })
-
-                # For each layer get the fields that are listed explicitly with the layer
-                for element in lyr.xpath("xs:complexContent/xs:extension/xs:sequence/xs:element", namespaces=ns):
-                    field_info.append({
-                        "name": element.get("name"),
-                        "type": re.sub("^.*\:", "", element.get("type", next(iter(element.xpath("xs:simpleType/xs:restriction/@base", namespaces=ns)), ""))),
-                        "optional": True if element.get("minOccurs", "1") == "0" else False,
-                        "description": getattr(next(iter(element.xpath("xs:annotation/xs:documentation", namespaces=ns)), object()), "text", None)
-                    })
-                layers_fields[layer] = field_info
-
-        return layers_fields
+    # Parse a schema document to find details about fields
+    def parse_layers_info(self):
+        return SchemaIndex.from_file(self.xsd_file.path).layers_info()
 
-    # Parse a schema document to determine the target namespace and type
+    # The target namespace and type of the schema, cached per XSD revision
     def type_details(self):
-        schema_file = open(self.xsd_file.path, "r")
-        schema = etree.parse(schema_file)
-        ns = {
-            "xs": "http://www.w3.org/2001/XMLSchema"
+        return cached_schema_metadata(self, "type_details", self.parse_type_details)
+
+    # Parse a schema document to determine the target namespace and type
+    def parse_type_details(self):
+        index = SchemaIndex.from_file(self.xsd_file.path)
+        return TypeDetails(index.target_namespace(), index.first_element_type().replace("Type", ""))
+
+    # Replace this version's rows in the LayerField table with the fields of its XSD.
+    #     A version whose XSD can't be read simply has no rows.
+    def index_fields(self):
+        LayerField.objects.filter(modelversion=self).delete()
+        try:
+            layers = self.layers_info()
+        except (IOError, etree.XMLSyntaxError):
+            return
+
+        LayerField.objects.bulk_create([
+            LayerField(
+                modelversion=self,
+                layer=layer,
+                position=position,
+                name=field["name"] or "",
+                type=field["type"] or "",
+                optional=field["optional"],
+                description=field["description"] or ""
+            )
+            for layer, fields in layers.items()
+            for position, field in enumerate(fields)
+        ])
+
+#--------------------------------------------------------------------------------------
+# The target namespace and type of a schema. Defined at module level so that it can
+#     be pickled into the schema metadata cache.
+#--------------------------------------------------------------------------------------
+class TypeDetails(object):
+    def __init__(self, namespace, typename):
+        self.namespace = namespace
+        self.typename = typename
+        try:
+            self.prefix = re.match("^(?P<prefix>.*):", typename).group("prefix")
+        except:
+            self.prefix = ""
+
+#--------------------------------------------------------------------------------------
+# One field of one layer of a ModelVersion, as found by ModelVersion.layers_info(). The
+#     rows are rebuilt whenever a version is saved so that questions about fields across
+#     the whole catalog can be answered by the database instead of by parsing XSDs.
+#--------------------------------------------------------------------------------------
+class LayerField(models.Model):
+    class Meta:
+        ordering = ['modelversion', 'layer', 'position']
+
+    modelversion = models.ForeignKey('ModelVersion')
+    layer = models.CharField(max_length=255, db_index=True)
+    position = models.IntegerField()                     # Order of the field within the layer
+    name = models.CharField(max_length=255, db_index=True)
+    type = models.CharField(max_length=255, db_index=True)
+    optional = models.BooleanField(default=False)
+    description = models.TextField(blank=True)
+
+    # Define the "display name" for an instance
+    def __unicode__(self):
+        return '%s.%s' % (self.layer, self.name)
+
+#--------------------------------------------------------------------------------------
+# Function that generates the public identifier of a ValidationJob
+#--------------------------------------------------------------------------------------
+def new_job_key():
+    return uuid.uuid4().hex
+
+#--------------------------------------------------------------------------------------
+# A WFS, CSV or batch validation that runs in the background (see validation/validators/jobs.py).
+#     Progress is written as the job runs so that it can be polled, and the outcome is
+#     kept as JSON so the results page can be shown again without re-validating.
+#--------------------------------------------------------------------------------------
+class ValidationJob(models.Model):
+    class Meta:
+        ordering = ['-date_created']
+
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = ((QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+    KIND_CHOICES = (('wfs', 'WFS GetFeature'), ('cm', 'CSV file'), ('batch', 'WFS batch'))
+
+    key = models.CharField(max_length=32, unique=True, default=new_job_key)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    description = models.CharField(max_length=2000, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    processed = models.IntegerField(default=0)          # Features or rows validated so far
+    error_count = models.IntegerField(default=0)        # How many of those were invalid
+    total = models.IntegerField(null=True, blank=True)  # Expected number of features or rows, if known
+    message = models.TextField(blank=True)              # What went wrong, for failed jobs
+    result = models.TextField(blank=True)               # JSON results, for finished jobs
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(null=True, blank=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    # Define the "display name" for an instance
+    def __unicode__(self):
+        return '%s job %s' % (self.kind, self.key)
+
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    # Estimated seconds remaining, from the rate so far. None if it can't be estimated.
+    def eta(self):
+        if self.status != self.RUNNING or not self.total or not self.processed or self.date_started is None:
+            return None
+        elapsed = (timezone.now() - self.date_started).total_seconds()
+        remaining = max(self.total - self.processed, 0)
+        return int(round(elapsed / self.processed * remaining))
+
+    # The decoded results of a finished job
+    def result_data(self):
+        if not self.result: return None
+        return json.loads(self.result)
+
+    # Return the job's progress as a dictionary that can be easily converted to JSON
+    def serialized(self):
+        return {
+            'id': self.key,
+            'kind': self.kind,
+            'status': self.status,
+            'processed': self.processed,
+            'errors': self.error_count,
+            'total': self.total,
+            'eta': self.eta(),
+            'message': self.message,
+            'date_created': self.date_created.isoformat(),
+            'date_finished': self.date_finished.isoformat() if self.date_finished else None
         }
 
-        class type_details(object):
-            namespace = next(iter(schema.xpath("/xs:schema/@targetNamespace", namespaces=ns)), "")
-            typename = next(iter(schema.xpath("/xs:schema/xs:element/@type", namespaces=ns)), "").replace("Type", "")
-            try:
-                prefix = re.match("^(?P<prefix>.*):", typename).group("prefix")
-            except:
-                prefix = ""
-        return type_details()
+#--------------------------------------------------------------------------------------
+# One validation of a WFS feature type against a ModelVersion, kept as a history of runs
+#     (see validation/validators/history.py). service_key identifies the GetFeature
+#     request the run was made with.
+#--------------------------------------------------------------------------------------
+class ValidationRun(models.Model):
+    class Meta:
+        ordering = ['-date_created']
+
+    modelversion = models.ForeignKey('ModelVersion')
+    service_key = models.CharField(max_length=40, db_index=True)   # SHA-1 of the GetFeature URL
+    url = models.CharField(max_length=2000)
+    feature_type = models.CharField(max_length=500)
+    schema_fingerprint = models.CharField(max_length=32)           # MD5 of the XSD validated against
+    valid = models.BooleanField(default=False)
+    valid_count = models.IntegerField(default=0)
+    invalid_count = models.IntegerField(default=0)
+    unchanged_count = models.IntegerField(default=0)                # Features whose result was reused
+    errors = models.TextField(blank=True)                           # JSON list of {"message", "count"}
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    # Define the "display name" for an instance
+    def __unicode__(self):
+        return '%s from %s' % (self.feature_type, self.url)
+
+    # The decoded list of distinct errors
+    def error_data(self):
+        if not self.errors: return []
+        return json.loads(self.errors)
+
+#--------------------------------------------------------------------------------------
+# The last known result for one feature of a service. content_hash and
+#     schema_fingerprint say what was validated; if neither has changed, the next run
+#     reuses valid and messages instead of validating the feature again.
+#--------------------------------------------------------------------------------------
+class ValidatedFeature(models.Model):
+    class Meta:
+        unique_together = ('service_key', 'modelversion', 'feature_key')
+
+    modelversion = models.ForeignKey('ModelVersion')
+    service_key = models.CharField(max_length=40)
+    feature_key = models.CharField(max_length=255)      # gml:id, or position in the response
+    content_hash = models.CharField(max_length=40)      # SHA-1 of the serialized feature
+    schema_fingerprint = models.CharField(max_length=32)
+    valid = models.BooleanField(default=False)
+    messages = models.TextField(blank=True)             # JSON list of error messages
+
+#--------------------------------------------------------------------------------------
+# One change to the catalog: a ContentModel or ModelVersion saved or deleted. The id is
+#     a sequence number, so harvesters can ask for the changes after the last one they
+#     saw (see views.get_changes) instead of reading the whole catalog.
+#--------------------------------------------------------------------------------------
+class CatalogChange(models.Model):
+    class Meta:
+        ordering = ['id']
+
+    KINDS = [('contentmodel', 'ContentModel'), ('modelversion', 'ModelVersion')]
+    ACTIONS = [('saved', 'Saved'), ('deleted', 'Deleted')]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    object_id = models.IntegerField()
+    model_id = models.IntegerField(db_index=True)        # The ContentModel, or the version's ContentModel
+    label = models.CharField(max_length=2500)            # The ContentModel's label at the time
+    version = models.CharField(max_length=10, blank=True)
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def serialized(self):
+        uri = ContentModel(label=self.label).absolute_uri()
+        return {
+            'sequence': self.pk,
+            'kind': self.kind,
+            'action': self.action,
+            'label': self.label,
+            'version': self.version or None,
+            'uri': '%s/%s' % (uri.rstrip('/'), self.version) if self.version else uri,
+            'date': self.date.isoformat()
+        }
 
 #--------------------------------------------------------------------------------------
 # Register a function to fire before ModelVersion and ContentModel objects are saved
@@ -423,6 +610,22 @@ class ModelVersion(models.Model):
 pre_save.connect(adjust_rewrite_rule, sender=ModelVersion)
 pre_save.connect(adjust_rewrite_rule, sender=ContentModel)
 
+#--------------------------------------------------------------------------------------
+# Keep ContentModel.latest_modelversion and last_updated current. This runs in the same
+#     transaction as the save or delete that fired it (see ModelVersion.save, and
+#     queryset deletes run in one of their own), and is connected ahead of the other
+#     handlers because they read the latest version.
+#--------------------------------------------------------------------------------------
+def update_latest_version(sender, instance, **kwargs):
+    try:
+        content_model = instance.content_model
+    except ContentModel.DoesNotExist:
+        return    # The version was deleted along with its ContentModel
+    content_model.refresh_latest_version()
+
+post_save.connect(update_latest_version, sender=ModelVersion)
+post_delete.connect(update_latest_version, sender=ModelVersion)
+
 #--------------------------------------------------------------------------------------
 # Register a function to fire after ModelVersion and ContentModel objects are saved
 #--------------------------------------------------------------------------------------        
@@ -433,4 +636,80 @@ post_save.connect(update_related_rewrite_rules, sender=ContentModel)
 # Register a function to fire when ModelVersion and ContentModel objects are deleted
 #--------------------------------------------------------------------------------------    
 post_delete.connect(delete_rewrite_rule, sender=ModelVersion)
-post_delete.connect(delete_rewrite_rule, sender=ContentModel)
\ No newline at end of file
+post_delete.connect(delete_rewrite_rule, sender=ContentModel)
+
+#--------------------------------------------------------------------------------------
+# Drop cached schema validators and metadata when a ModelVersion is saved or deleted
+#--------------------------------------------------------------------------------------
+def forget_schema_caches(sender, instance, **kwargs):
+    validator_cache.invalidate(instance.pk)
+    forget_schema_metadata(instance.pk)
+
+post_save.connect(forget_schema_caches, sender=ModelVersion)
+post_delete.connect(forget_schema_caches, sender=ModelVersion)
+
+#--------------------------------------------------------------------------------------
+# Re-index a ModelVersion's layer fields when it is saved. Deleting a version deletes
+#     its rows along with it.
+#--------------------------------------------------------------------------------------
+def index_layer_fields(sender, instance, **kwargs):
+    instance.index_fields()
+
+post_save.connect(index_layer_fields, sender=ModelVersion)
+
+#--------------------------------------------------------------------------------------
+# Re-render feature catalogues whose XSD or descriptive fields changed. A catalogue
+#     that fails to render is forgotten, so the next request for it renders it (and
+#     reports the problem) instead of the save failing.
+#--------------------------------------------------------------------------------------
+def update_feature_catalogs(sender, instance, **kwargs):
+    if sender is ContentModel:
+        versions = instance.modelversion_set.all()
+        for modelversion in versions: modelversion.content_model = instance
+    else:
+        versions = [instance]
+
+    for modelversion in versions:
+        try:
+            refresh_feature_catalog(modelversion)
+        except Exception:
+            forget_feature_catalog(modelversion)
+
+post_save.connect(update_feature_catalogs, sender=ModelVersion)
+post_save.connect(update_feature_catalogs, sender=ContentModel)
+
+#--------------------------------------------------------------------------------------
+# Log every change to the catalog. Deletes are logged before the rows go, while a
+#     version's ContentModel can still be read, in the same transaction as the delete.
+#--------------------------------------------------------------------------------------
+def record_change(sender, instance, **kwargs):
+    if sender is ContentModel:
+        model, version = instance, ""
+    else:
+        model, version = instance.content_model, instance.version
+
+    CatalogChange.objects.create(
+        kind=sender.__name__.lower(),
+        action="deleted" if kwargs.get("signal") is pre_delete else "saved",
+        object_id=instance.pk,
+        model_id=model.pk,
+        label=model.label,
+        version=version
+    )
+
+post_save.connect(record_change, sender=ModelVersion)
+post_save.connect(record_change, sender=ContentModel)
+pre_delete.connect(record_change, sender=ModelVersion)
+pre_delete.connect(record_change, sender=ContentModel)
+
+#--------------------------------------------------------------------------------------
+# Drop the cached catalog feeds whenever the catalog changes. They are rendered again
+#     by the next request, so a cascaded delete doesn't render them once per row.
+#--------------------------------------------------------------------------------------
+def forget_catalog_feeds(sender, instance, **kwargs):
+    forget_feeds()
+
+post_save.connect(forget_catalog_feeds, sender=ModelVersion)
+post_save.connect(forget_catalog_feeds, sender=ContentModel)
+post_delete.connect(forget_catalog_feeds, sender=ModelVersion)
+post_delete.connect(forget_catalog_feeds, sender=ContentModel)
\ No newline at end of file
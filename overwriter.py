@@ -1,9 +1,25 @@
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
+from schemacache import file_changed
+from compression import write_compressed_siblings, remove_compressed_siblings
 import os
 
 class Overwriter(FileSystemStorage):
     def get_available_name(self, name):
         if self.exists(name):
             os.remove(os.path.join(settings.MEDIA_ROOT, name))
-        return name
\ No newline at end of file
+            file_changed(self.path(name))
+        return name
+
+    # Anything cached from the previous contents of this file is now stale. Compressed
+    #     siblings are written for the web server (or views.serve_file) to send.
+    def _save(self, name, content):
+        name = super(Overwriter, self)._save(name, content)
+        file_changed(self.path(name))
+        write_compressed_siblings(self.path(name))
+        return name
+
+    def delete(self, name):
+        super(Overwriter, self).delete(name)
+        remove_compressed_siblings(self.path(name))
+        file_changed(self.path(name))
@@ -0,0 +1,202 @@
+from django.conf import settings
+from django.core.cache import get_cache
+from lxml import etree
+from collections import OrderedDict
+from os import path
+import hashlib
+import logging
+import os
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+#--------------------------------------------------------------------------------------
+# Local copies of the OGC schemas that content-model XSDs import
+#--------------------------------------------------------------------------------------
+SCHEMA_FOLDER = path.join(path.dirname(__file__), "validation", "schemas.opengis.net")
+GML_SCHEMA_URL = "http://schemas.opengis.net/gml/3.1.1/base/gml.xsd"
+
+#--------------------------------------------------------------------------------------
+# Resolver that points GML 3.1.1 imports at the bundled copy instead of the network
+#--------------------------------------------------------------------------------------
+class SchemaResolver(etree.Resolver):
+    def resolve(self, url, id, context):
+        if url == GML_SCHEMA_URL:
+            that = path.join(SCHEMA_FOLDER, "gml", "3.1.1", "base", "gml.xsd")
+            return self.resolve_filename(that, context)
+        else:
+            return self.resolve_filename(url, context)
+
+#--------------------------------------------------------------------------------------
+# Fingerprint a file as (mtime, size, md5). The digest is only recomputed when the
+#     stat signature of the file changes, so repeated calls cost one os.stat().
+#--------------------------------------------------------------------------------------
+_digests = {}
+_digests_lock = threading.Lock()
+
+def file_fingerprint(file_path):
+    stat = os.stat(file_path)
+    signature = (stat.st_mtime, stat.st_size)
+
+    with _digests_lock:
+        known = _digests.get(file_path)
+    if known is not None and known[0] == signature:
+        return signature + (known[1],)
+
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            md5.update(chunk)
+    digest = md5.hexdigest()
+
+    with _digests_lock:
+        _digests[file_path] = (signature, digest)
+    return signature + (digest,)
+
+# Forget the digest of a file, forcing it to be re-hashed on the next fingerprint
+def forget_fingerprint(file_path):
+    with _digests_lock:
+        _digests.pop(file_path, None)
+
+#--------------------------------------------------------------------------------------
+# Compile an lxml.etree.XMLSchema from an XSD file on disk
+#--------------------------------------------------------------------------------------
+def compile_schema(file_path):
+    parser = etree.XMLParser()
+    parser.resolvers.add(SchemaResolver())
+
+    with open(file_path, "r") as schema_file:
+        schema_doc = etree.parse(schema_file, parser)
+    try:
+        return etree.XMLSchema(schema_doc)
+    except etree.XMLSchemaParseError:
+        logger.exception("Could not compile the schema at %s", file_path)
+        raise
+
+#--------------------------------------------------------------------------------------
+# LRU cache of compiled XMLSchema validators, for use by one thread.
+#     Entries are keyed by ModelVersion pk and remember the fingerprint of the XSD
+#     they were compiled from; a changed fingerprint means the entry is stale.
+#--------------------------------------------------------------------------------------
+class ValidatorCache(object):
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self.entries = OrderedDict()    # pk -> (file path, fingerprint, XMLSchema)
+        self.lock = threading.Lock()
+
+    # Return a compiled validator for a ModelVersion, compiling it if needed
+    def get(self, modelversion):
+        file_path = modelversion.xsd_file.path
+        fingerprint = file_fingerprint(file_path)
+        key = modelversion.pk
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] == file_path and entry[1] == fingerprint:
+                # Re-insert to mark the entry as most recently used
+                self.entries[key] = entry
+                return entry[2]
+
+        # Compile outside of the lock so that one slow schema doesn't block the others
+        schema = compile_schema(file_path)
+
+        with self.lock:
+            self.entries[key] = (file_path, fingerprint, schema)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return schema
+
+    # Drop the entry for one ModelVersion
+    def invalidate(self, pk):
+        with self.lock:
+            self.entries.pop(pk, None)
+
+    # Drop any entries compiled from the given file. Called by the Overwriter storage.
+    def invalidate_path(self, file_path):
+        with self.lock:
+            for key in [k for k, entry in self.entries.items() if entry[0] == file_path]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+#--------------------------------------------------------------------------------------
+# An lxml XMLSchema keeps its error_log on the object, so one validator can't be used
+#     by two threads at once. This keeps a ValidatorCache for each thread; invalidating
+#     an entry drops it from every thread's cache.
+#--------------------------------------------------------------------------------------
+class ThreadLocalValidatorCache(object):
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self.local = threading.local()
+        self.caches = weakref.WeakSet()    # Every thread's cache, until the thread exits
+        self.lock = threading.Lock()
+
+    def thread_cache(self):
+        cache = getattr(self.local, "cache", None)
+        if cache is None:
+            cache = self.local.cache = ValidatorCache(self.max_size)
+            with self.lock:
+                self.caches.add(cache)
+        return cache
+
+    def get(self, modelversion):
+        return self.thread_cache().get(modelversion)
+
+    def all_caches(self):
+        with self.lock:
+            return list(self.caches)
+
+    def invalidate(self, pk):
+        for cache in self.all_caches(): cache.invalidate(pk)
+
+    def invalidate_path(self, file_path):
+        for cache in self.all_caches(): cache.invalidate_path(file_path)
+
+    def clear(self):
+        for cache in self.all_caches(): cache.clear()
+
+validator_cache = ThreadLocalValidatorCache(getattr(settings, "SCHEMA_VALIDATOR_CACHE_SIZE", 32))
+
+#--------------------------------------------------------------------------------------
+# Metadata extracted from XSDs (layers_info, type_details) is kept in a Django cache so
+#     that it survives across requests and processes. Point SCHEMA_METADATA_CACHE at a
+#     file-based or database cache in settings.CACHES to persist it on disk or in the DB.
+#     Each entry stores the digest of the XSD it was extracted from, so it is only
+#     recomputed when the XSD changes.
+#--------------------------------------------------------------------------------------
+METADATA_KINDS = ["layers_info", "type_details"]
+METADATA_TIMEOUT = getattr(settings, "SCHEMA_METADATA_CACHE_TIMEOUT", 60 * 60 * 24 * 30)
+
+def metadata_cache():
+    return get_cache(getattr(settings, "SCHEMA_METADATA_CACHE", "default"))
+
+def metadata_key(kind, pk):
+    return "modelmanager:%s:%s" % (kind, pk)
+
+# Return cached metadata for a ModelVersion, calling build() to extract it on a miss
+def cached_schema_metadata(modelversion, kind, build):
+    digest = file_fingerprint(modelversion.xsd_file.path)[2]
+    cache = metadata_cache()
+    key = metadata_key(kind, modelversion.pk)
+
+    entry = cache.get(key)
+    if entry is not None and entry[0] == digest:
+        return entry[1]
+
+    value = build()
+    cache.set(key, (digest, value), METADATA_TIMEOUT)
+    return value
+
+# Drop all cached metadata for one ModelVersion
+def forget_schema_metadata(pk):
+    metadata_cache().delete_many([metadata_key(kind, pk) for kind in METADATA_KINDS])
+
+#--------------------------------------------------------------------------------------
+# Called whenever a file is written or removed by the Overwriter storage
+#--------------------------------------------------------------------------------------
+def file_changed(file_path):
+    forget_fingerprint(file_path)
+    validator_cache.invalidate_path(file_path)
@@ -0,0 +1,101 @@
+from lxml import etree
+from collections import OrderedDict
+import re
+
+XS = "{http://www.w3.org/2001/XMLSchema}"
+
+#--------------------------------------------------------------------------------------
+# Strip a namespace prefix from a QName, e.g. "aasg:HeatFlowType" -> "HeatFlowType"
+#--------------------------------------------------------------------------------------
+def local_name(qname):
+    return re.sub("^.*\:", "", qname)
+
+#--------------------------------------------------------------------------------------
+# Walk down a path of xs: child tags, yielding matches in document order.
+#     Equivalent to the relative XPath "xs:a/xs:b/..." without compiling an expression.
+#--------------------------------------------------------------------------------------
+def xs_children(node, *tags):
+    if len(tags) == 0:
+        yield node
+        return
+    for child in node.iterchildren(XS + tags[0]):
+        for match in xs_children(child, *tags[1:]):
+            yield match
+
+#--------------------------------------------------------------------------------------
+# An index of a content-model XSD, built in a single pass over the schema tree.
+#     Holds the top-level element declarations (layer name -> type name) and every
+#     named complexType, so layer and base-type lookups are dictionary reads instead
+#     of document-wide XPath scans.
+#--------------------------------------------------------------------------------------
+class SchemaIndex(object):
+    def __init__(self, schema):
+        self.root = schema.getroot() if hasattr(schema, "getroot") else schema
+        self.elements = OrderedDict()    # Layer name -> local name of its type
+        self.complex_types = {}          # complexType name -> [complexType nodes]
+
+        for node in self.root.iter(XS + "schema", XS + "complexType"):
+            if node.tag == XS + "schema":
+                for element in node.iterchildren(XS + "element"):
+                    self.elements[element.get("name")] = local_name(str(element.get("type")))
+            else:
+                name = node.get("name")
+                if name is not None:
+                    self.complex_types.setdefault(name, []).append(node)
+
+    @classmethod
+    def from_file(cls, file_path):
+        with open(file_path, "r") as schema_file:
+            return cls(etree.parse(schema_file))
+
+    # Describe one xs:element field declaration
+    def field_info(self, element):
+        restriction_base = next(iter(
+            r.get("base") for r in xs_children(element, "simpleType", "restriction") if r.get("base") is not None
+        ), "")
+        documentation = next(xs_children(element, "annotation", "documentation"), object())
+        return {
+            "name": element.get("name"),
+            "type": local_name(element.get("type", restriction_base)),
+            "optional": True if element.get("minOccurs", "1") == "0" else False,
+            "description": getattr(documentation, "text", None)
+        }
+
+    # Fields declared directly by a complexType (through complexContent/extension/sequence)
+    def declared_fields(self, complex_type):
+        return [
+            self.field_info(element)
+            for element in xs_children(complex_type, "complexContent", "extension", "sequence", "element")
+        ]
+
+    # Return an OrderedDict of layer name -> list of field descriptions. Fields that a
+    #     layer inherits from a common base type are listed ahead of its own fields.
+    def layers_info(self):
+        layers_fields = OrderedDict()
+
+        for layer, type_name in self.elements.items():
+            for lyr in self.complex_types.get(type_name, []):
+                field_info = []
+
+                extension = next(xs_children(lyr, "complexContent", "extension"), None)
+                base = extension.get("base") if extension is not None else None
+                if base is not None:
+                    for base_type in self.complex_types.get(local_name(base), []):
+                        field_info.extend(self.declared_fields(base_type))
+
+                field_info.extend(self.declared_fields(lyr))
+                layers_fields[layer] = field_info
+
+        return layers_fields
+
+    # The schema's targetNamespace, or "" if it has none
+    def target_namespace(self):
+        if self.root.tag != XS + "schema": return ""
+        return self.root.get("targetNamespace", "")
+
+    # The type of the first top-level element declaration, or "" if there isn't one
+    def first_element_type(self):
+        if self.root.tag != XS + "schema": return ""
+        return next(iter(
+            e.get("type") for e in self.root.iterchildren(XS + "element") if e.get("type") is not None
+        ), "")
@@ -1,2 +1,18 @@
-from contentmodel import ContentModelTestCase
-from uriconfigure import UriConfigureTestCase
\ No newline at end of file
+from contentmodel import ContentModelTestCase, LatestVersionTransactionTestCase
+from uriconfigure import UriConfigureTestCase
+from schemacache import SchemaCacheTestCase
+from schemaindex import SchemaIndexTestCase
+from views import FeedQueryCountTestCase, FeedCacheTestCase, LabelLookupTestCase, ModelQueryTestCase
+from wfsvalidation import StreamingValidationTestCase, ParallelValidationTestCase, ErrorAggregationTestCase
+from wfsfetch import FetchTestCase
+from validationjobs import ValidationJobTestCase
+from csvvalidation import CsvValidationTestCase
+from csvoutput import CsvOutputTestCase
+from layercatalog import LayerCatalogTestCase
+from wfsbatch import WfsBatchTestCase, BatchAccessTestCase
+from wfspaging import WfsPagingTestCase
+from wfshistory import WfsHistoryTestCase
+from layerfields import LayerFieldIndexTestCase
+from featurecatalog import FeatureCatalogTestCase
+from compression import CompressionTestCase
+from changelog import ChangeLogTestCase
\ No newline at end of file
@@ -0,0 +1,66 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.conf import settings
+from modelmanager.models import ContentModel, ModelVersion, CatalogChange
+from modelmanager import views
+from utils import create_schema_files
+import json, os, shutil
+
+class ChangeLogTestCase(TestCase):
+    """Saves and deletes should be logged, and harvesters given only what changed"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.cm = ContentModel.objects.create(title="Changing Model", label="changing-model", description="Changes")
+        self.other = ContentModel.objects.create(title="Other Model", label="other-model", description="Unchanged")
+        self.mv = self.add_version(self.cm, "1.0")
+
+    def tearDown(self):
+        for cm in [self.cm, self.other]:
+            folder = os.path.join(settings.MEDIA_ROOT, cm.folder_path())
+            if os.path.exists(folder):
+                shutil.rmtree(folder)
+
+    def add_version(self, cm, version):
+        xsd, xls = create_schema_files()
+        return ModelVersion.objects.create(content_model=cm, version=version, xsd_file=xsd, xls_file=xls)
+
+    def changes(self, **params):
+        return json.loads(views.get_changes(self.factory.get("/changes.json", params)).content)
+
+    def test_logged(self):
+        """Each save and delete should be logged with the model's label and URI"""
+        self.mv.delete()
+        found = [(c["kind"], c["action"], c["label"], c["version"]) for c in self.changes()["changes"]]
+        self.assertEqual(found, [
+            ("contentmodel", "saved", "changing-model", None),
+            ("contentmodel", "saved", "other-model", None),
+            ("modelversion", "saved", "changing-model", "1.0"),
+            ("modelversion", "deleted", "changing-model", "1.0")
+        ])
+        self.assertEqual(self.changes()["changes"][2]["uri"], self.mv.absolute_uri())
+
+    def test_polling(self):
+        """Polling from last_sequence should only return newer changes, a page at a time"""
+        last = self.changes()["last_sequence"]
+        self.assertEqual(self.changes(since=last), {"changes": [], "last_sequence": last, "more": False})
+
+        self.add_version(self.cm, "2.0")
+        self.add_version(self.cm, "3.0")
+        page = self.changes(since=last, limit=1)
+        self.assertEqual(([c["version"] for c in page["changes"]], page["more"]), (["2.0"], True))
+        page = self.changes(since=page["last_sequence"])
+        self.assertEqual(([c["version"] for c in page["changes"]], page["more"]), (["3.0"], False))
+
+    def test_changed_models(self):
+        """The JSON catalog should give only the models that changed"""
+        last = CatalogChange.objects.order_by("-id")[0].pk
+        self.add_version(self.other, "1.0")
+        request = self.factory.get("/contentmodels.json", {"changed_since": last, "fields": "label"})
+        self.assertEqual(json.loads(views.get_all_models(request, "json").content), [{"label": "other-model"}])
+
+    def test_cascade(self):
+        """Deleting a model should log the deletion of its versions too"""
+        ContentModel.objects.get(pk=self.cm.pk).delete()
+        deleted = CatalogChange.objects.filter(action="deleted", model_id=self.cm.pk)
+        self.assertEqual(sorted((c.kind, c.label) for c in deleted), [("contentmodel", "changing-model"), ("modelversion", "changing-model")])
@@ -0,0 +1,88 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files import File
+from modelmanager.models import ContentModel, ModelVersion
+from modelmanager.compression import preferred_encoding, sibling_path
+from modelmanager.feedcache import conditional_response
+from modelmanager import views
+from schemaindex import SCHEMA
+import gzip, os, shutil
+from StringIO import StringIO
+
+# Long enough to be worth compressing, and still a schema the catalogue can be made from
+LARGE_SCHEMA = SCHEMA + "<!-- %s -->" % ("padding " * 200)
+
+def gunzip(content):
+    return gzip.GzipFile(fileobj=StringIO(content)).read()
+
+class CompressionTestCase(TestCase):
+    """Feeds, feature catalogues and uploaded files should be sent compressed to clients that accept it"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.cm = ContentModel.objects.create(title="Compressed Model", label="compressed-model", description="Squeezed")
+        self.version = ModelVersion.objects.create(
+            content_model=self.cm, version="1.0",
+            xsd_file=File(ContentFile(LARGE_SCHEMA), "compressed.xsd"),
+            xls_file=File(ContentFile("Dummy Excel File"), "compressed.xls")
+        )
+
+    def tearDown(self):
+        folder = os.path.join(settings.MEDIA_ROOT, self.cm.folder_path())
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+    def request(self, url="/", **headers):
+        return self.factory.get(url, **headers)
+
+    def test_negotiation(self):
+        """Accept-Encoding quality values should be respected"""
+        self.assertEqual(preferred_encoding(self.request(HTTP_ACCEPT_ENCODING="gzip, deflate")), "gzip")
+        self.assertEqual(preferred_encoding(self.request(HTTP_ACCEPT_ENCODING="*")), preferred_encoding(self.request(HTTP_ACCEPT_ENCODING="br, gzip")))
+        self.assertIsNone(preferred_encoding(self.request(HTTP_ACCEPT_ENCODING="gzip;q=0, identity")))
+        self.assertIsNone(preferred_encoding(self.request()))
+
+    def test_feed(self):
+        """A feed should be sent gzipped, with its own ETag, and revalidate against it"""
+        plain = views.get_all_models(self.request(), "xml")
+        compressed = views.get_all_models(self.request(HTTP_ACCEPT_ENCODING="gzip"), "xml")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gunzip(compressed.content), plain.content)
+        self.assertEqual(compressed["ETag"], plain["ETag"][:-1] + '-gzip"')
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        revalidated = views.get_all_models(self.request(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=compressed["ETag"]), "xml")
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated["ETag"], compressed["ETag"])
+
+    def test_threshold(self):
+        """Small responses should be sent as they are"""
+        response = conditional_response(self.request(HTTP_ACCEPT_ENCODING="gzip"), "small", "text/plain", "etag")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        response = conditional_response(self.request(HTTP_ACCEPT_ENCODING="gzip"), "large " * 500, "text/plain", "etag")
+        self.assertEqual(gunzip(response.content), "large " * 500)
+
+    def test_feature_catalog(self):
+        """The catalogue's compressed sibling should be written with it and sent"""
+        catalog_path = self.version.feature_catalog_path()
+        self.assertTrue(os.path.exists(sibling_path(catalog_path, "gzip")))
+        response = views.get_feature_catalog(self.request(HTTP_ACCEPT_ENCODING="gzip"), "compressed-model", "1.0")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        with open(catalog_path, "rb") as f:
+            self.assertEqual(gunzip(response.content), f.read())
+
+    def test_uploads(self):
+        """Overwriter should keep siblings for files worth compressing, and remove them with the file"""
+        xsd_path = self.version.xsd_file.path
+        self.assertTrue(os.path.exists(sibling_path(xsd_path, "gzip")))
+        self.assertFalse(os.path.exists(sibling_path(self.version.xls_file.path, "gzip")))
+
+        relative = os.path.relpath(xsd_path, settings.MEDIA_ROOT)
+        response = views.serve_file(self.request(HTTP_ACCEPT_ENCODING="gzip"), relative, settings.MEDIA_ROOT)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gunzip("".join(response.streaming_content)), LARGE_SCHEMA)
+
+        self.version.xsd_file.storage.delete(self.version.xsd_file.name)
+        self.assertFalse(os.path.exists(sibling_path(xsd_path, "gzip")))
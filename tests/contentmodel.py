@@ -1,4 +1,6 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.db.models.signals import post_save
+from django.db import transaction
 from django.template.defaultfilters import slugify
 from django.core.files.base import ContentFile
 from django.core.files import File
@@ -69,6 +71,28 @@ class ContentModelTestCase(TestCase):
         v = self.createTwoVersions()['new']     
         self.assertEqual(self.example.latest_version(), v)
                 
+    def test_latest_version_after_delete(self):
+        """Deleting the latest version should make the previous one the latest"""
+        versions = self.createTwoVersions()
+        versions['new'].delete()
+        example = ContentModel.objects.get(pk=self.example.pk)
+        self.assertEqual(example.latest_version(), versions['old'])
+        self.assertEqual(example.date_updated(), versions['old'].date_created)
+        
+    def test_delete_with_versions(self):
+        """Deleting a model should delete its versions along with it"""
+        self.createTwoVersions()
+        ContentModel.objects.get(pk=self.example.pk).delete()
+        self.assertEqual(ModelVersion.objects.filter(content_model_id=self.example.pk).count(), 0)
+        
+    def test_latest_version_without_queries(self):
+        """Models loaded with their versions should not query for the latest version"""
+        v = self.createTwoVersions()['new']
+        example = ContentModel.objects.with_versions().get(pk=self.example.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(example.latest_version_number(), v.version)
+            self.assertEqual(example.date_updated(), v.date_created)
+                
     def test_latest_version_number_for_null(self):
         """When there are no versions of a model, the model's latest_version_number should return None"""
         self.assertIsNone(self.example.latest_version_number())
@@ -222,4 +246,51 @@ class ContentModelTestCase(TestCase):
             'date_updated': self.example.iso_date_updated(),
             'versions': [ mv.serialized() for mv in self.example.modelversion_set.all() ]
         }        
-        self.assertEqual(self.example.serialized(), expect_json)
\ No newline at end of file
+        self.assertEqual(self.example.serialized(), expect_json)
+
+class LatestVersionTransactionTestCase(TransactionTestCase):
+    fixtures = [
+            "tests/cm-example.json"
+        ]
+    
+    def setUp(self):
+        self.example = ContentModel.objects.get(label="example")
+    
+    def tearDown(self):
+        example_path = os.path.join(settings.MEDIA_ROOT, self.example.folder_path())
+        if os.path.exists(example_path):
+            shutil.rmtree(example_path)
+    
+    def test_failed_save_rolls_back(self):
+        """A version whose save fails should not be kept, or become its model's latest version"""
+        def fail(sender, **kwargs):
+            raise ValueError("Handler failed")
+        
+        post_save.connect(fail, sender=ModelVersion)
+        try:
+            self.assertRaises(ValueError, ModelVersion.objects.create,
+                content_model = self.example,
+                version = "3.0",
+                xsd_file = File(ContentFile("Dummy Schema File"), "dummyFile.xsd"),
+                xls_file = File(ContentFile("Dummy Excel File"), "dummyFile.xls")
+            )
+        finally:
+            post_save.disconnect(fail, sender=ModelVersion)
+        
+        self.assertEqual(ModelVersion.objects.filter(content_model=self.example).count(), 0)
+        self.assertIsNone(ContentModel.objects.get(pk=self.example.pk).latest_version())
+    
+    def test_joins_open_transaction(self):
+        """Saving inside a transaction should not commit it before the caller does"""
+        def save_then_fail():
+            with transaction.commit_on_success():
+                ModelVersion.objects.create(
+                    content_model = self.example,
+                    version = "3.0",
+                    xsd_file = File(ContentFile("Dummy Schema File"), "dummyFile.xsd"),
+                    xls_file = File(ContentFile("Dummy Excel File"), "dummyFile.xls")
+                )
+                raise ValueError("Caller failed")
+        
+        self.assertRaises(ValueError, save_then_fail)
+        self.assertEqual(ModelVersion.objects.filter(content_model=self.example).count(), 0)
@@ -0,0 +1,70 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from modelmanager.validation.validators import csvstore, cm
+from StringIO import StringIO
+import gzip, hashlib, os, shutil, tempfile, time
+
+CORRECTED = "WellURI,WellName\r\n" + "http://resources.usgin.org/uri-gin/a/b/c/d/,Well\r\n" * 5000
+
+class CsvOutputTestCase(TestCase):
+    """Tests for storing corrected CSV output on the server"""
+
+    def setUp(self):
+        self.store_dir = csvstore.STORE_DIR
+        csvstore.STORE_DIR = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(csvstore.STORE_DIR)
+        csvstore.STORE_DIR = self.store_dir
+
+    def read(self, stored, compressed=False):
+        content = "".join(csvstore.gzip_chunks(stored) if compressed else csvstore.chunks(stored))
+        if compressed: content = gzip.GzipFile(fileobj=StringIO(content)).read()
+        return content
+
+    def test_content_addressed(self):
+        """Output should be stored under the digest of its contents"""
+        token = csvstore.save_output(StringIO(CORRECTED))
+        self.assertEqual(token, hashlib.sha1(CORRECTED).hexdigest())
+        self.assertEqual(csvstore.save_output(StringIO(CORRECTED)), token)
+        self.assertEqual(len(os.listdir(csvstore.STORE_DIR)), 1)
+        self.assertEqual(self.read(csvstore.open_output(token)), CORRECTED)
+
+    def test_gzip(self):
+        """Compressed chunks should decompress to the stored output"""
+        token = csvstore.save_output(StringIO(CORRECTED))
+        self.assertEqual(self.read(csvstore.open_output(token), compressed=True), CORRECTED)
+
+    def test_unknown_tokens(self):
+        """Malformed, unknown and expired tokens should not open anything"""
+        self.assertIsNone(csvstore.open_output("../../etc/passwd"))
+        self.assertIsNone(csvstore.open_output("0" * 40))
+
+        token = csvstore.save_output(StringIO(CORRECTED))
+        expired = time.time() - csvstore.TTL - 1
+        os.utime(csvstore.output_path(token), (expired, expired))
+        self.assertIsNone(csvstore.open_output(token))
+
+        csvstore.remove_expired(interval=0)
+        self.assertFalse(os.path.exists(csvstore.output_path(token)))
+
+    def test_download(self):
+        """Downloads should honour Accept-Encoding and give each encoding its own ETag"""
+        token = csvstore.save_output(StringIO(CORRECTED))
+        def download(**headers):
+            return cm.download_csv(RequestFactory().get("/", **headers), token)
+
+        plain = download(HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(plain["ETag"], '"%s"' % token)
+        self.assertEqual(plain["Vary"], "Accept-Encoding")
+        self.assertEqual("".join(plain.streaming_content), CORRECTED)
+
+        compressed = download(HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(compressed["ETag"], '"%s-gzip"' % token)
+        "".join(compressed.streaming_content)
+
+        revalidated = download(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=compressed["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated["ETag"], compressed["ETag"])
@@ -0,0 +1,112 @@
+from django.test import TestCase
+from modelmanager.validation.validators.csvstream import CsvValidator, MessageLog, UnreadableCsv, validate_csv_file
+from modelmanager.validation.validators import catalog as catalog_module, cm
+from usginmodels.layer import Layer, format_messages
+import csv, io, os, tempfile
+
+FIELDS = [
+    {"name": "OBJECTID", "type": "double", "optional": True},
+    {"name": "WellURI", "type": "string", "optional": False},
+    {"name": "WellName", "type": "string", "optional": False},
+    {"name": "Depth", "type": "double", "optional": False},
+    {"name": "SRS", "type": "string", "optional": True},
+    {"name": "Shape", "type": "string", "optional": True}
+]
+
+def sample_csv(rows):
+    lines = ["WellURI,WellName,Depth,SRS"]
+    for n in range(rows):
+        uri = "http://resources.usgin.org/uri-gin/test/well/%s/" % (n % 40)
+        depth = "deep" if n % 7 == 0 else str(n * 10)
+        srs = "EPSG:4326" if n % 13 else "NAD27"
+        lines.append('%s," Well %s",%s,%s' % (uri, n, depth, srs))
+    return "\r\n".join(lines) + "\r\n"
+
+class CsvValidationTestCase(TestCase):
+    """Tests for validating CSV uploads a row at a time"""
+
+    def setUp(self):
+        self.layer = Layer("Wells", FIELDS)
+        handle, self.path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+
+    def tearDown(self):
+        if os.path.exists(self.path): os.remove(self.path)
+
+    def write(self, content):
+        with open(self.path, "wb") as f:
+            f.write(content)
+
+    def test_matches_usginmodels(self):
+        """Streaming validation should give the same messages and corrected rows as usginmodels"""
+        content = sample_csv(200)
+        self.write(content)
+        valid, messages, corrected, long_fields, srs = self.layer.validate_file(csv.DictReader(io.StringIO(unicode(content), newline=None)))
+
+        validator, output = validate_csv_file(self.path, self.layer)
+        self.assertEqual(validator.valid, valid)
+        self.assertEqual(validator.messages(), messages)
+        self.assertEqual(validator.srs, srs)
+        self.assertEqual(validator.rows, 200)
+        self.assertTrue(validator.complete)
+        self.assertEqual(list(csv.reader(output)), [[str(value) for value in row] for row in corrected])
+
+    def test_missing_required_field(self):
+        """A missing required column should stop validation with an error"""
+        self.write("WellURI,Depth\r\nhttp://resources.usgin.org/uri-gin/a/b/c/d/,1\r\n")
+        validator, output = validate_csv_file(self.path, self.layer)
+        self.assertFalse(validator.valid)
+        self.assertFalse(validator.complete)
+        self.assertIn("WellName is a required field", validator.messages()[0])
+
+    def validate_job(self, get_layer):
+        """Run the CSV job against a catalog that knows Wells 1.0, with get_layer standing in for usginmodels"""
+        self.write(sample_csv(3))
+        original = catalog_module._catalog, cm.usginmodels.get_layer
+        catalog_module._catalog = catalog_module.LayerCatalog([])
+        catalog_module._catalog.uris[("Wells", "1.0")] = "http://example.org/wells/1.0"
+        catalog_module._stale = False
+        cm.usginmodels.get_layer = get_layer
+        try:
+            result = cm.validate_csv(lambda *args, **kwargs: None, "wells.csv", self.path, "Wells", "1.0", "Wells")
+        finally:
+            catalog_module._catalog, cm.usginmodels.get_layer = original
+        self.assertFalse(os.path.exists(self.path))
+        return result
+
+    def test_unknown_version(self):
+        """A model version usginmodels doesn't know should be reported, and the upload removed"""
+        self.write(sample_csv(3))
+        original = catalog_module._catalog
+        catalog_module._catalog = catalog_module.LayerCatalog([])
+        try:
+            result = cm.validate_csv(lambda *args, **kwargs: None, "wells.csv", self.path, "Wells", "9.9", "Wells")
+        finally:
+            catalog_module._catalog = original
+        self.assertFalse(result["valid"])
+        self.assertEqual(result["messages"], "Unknown model/version: Wells 9.9")
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_job_errors(self):
+        """Layers usginmodels doesn't have are the user's problem; anything else is reported as a server error"""
+        def invalid_layer(uri, layer_name):
+            raise cm.usginmodels.InvalidLayer(layer_name)
+        def broken(uri, layer_name):
+            raise AttributeError("bug")
+
+        self.assertEqual(self.validate_job(invalid_layer)["messages"], "Invalid Layer")
+        self.assertEqual(self.validate_job(lambda uri, layer_name: self.layer)["valid"], False)
+        self.assertIn("error on the server", self.validate_job(broken)["messages"])
+
+    def test_non_ascii(self):
+        """Files with characters that aren't plain ASCII should be refused"""
+        self.write("WellURI,WellName,Depth\r\nx,Caf\xc3\xa9,1\r\n")
+        self.assertRaises(UnreadableCsv, validate_csv_file, self.path, self.layer)
+
+    def test_message_ranges(self):
+        """Rows should be reported as ranges, the way usginmodels formats them"""
+        log = MessageLog()
+        for row in [0, 1, 2, 3, 6, 7, 9, 9]:
+            log.add(row, "Warning! Something")
+        log.add(4, "Notice! Once")
+        self.assertEqual(log.formatted(), format_messages([[[1, 2, 3, 4, 7, 8, 10], "Warning! Something"], [[5], "Notice! Once"]]))
@@ -0,0 +1,63 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files import File
+from modelmanager.models import ContentModel, ModelVersion
+from modelmanager import views
+from schemaindex import SCHEMA
+import os, shutil
+
+class FeatureCatalogTestCase(TestCase):
+    """Feature catalogues should be written when versions are saved and served from disk"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.cm = ContentModel.objects.create(title="Catalog Model", label="catalog-model", description="Catalogued")
+        self.version = ModelVersion.objects.create(
+            content_model=self.cm, version="1.0",
+            xsd_file=File(ContentFile(SCHEMA), "catalog.xsd"),
+            xls_file=File(ContentFile("Dummy Excel File"), "catalog.xls")
+        )
+
+    def tearDown(self):
+        folder = os.path.join(settings.MEDIA_ROOT, self.cm.folder_path())
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+    def get(self, **headers):
+        return views.get_feature_catalog(self.factory.get("/featurecatalog/catalog-model/1.0.xml", **headers), "catalog-model", "1.0")
+
+    def catalog(self):
+        with open(self.version.feature_catalog_path(), "rb") as f:
+            return f.read()
+
+    def test_written_on_save(self):
+        """The catalogue should be beside the XSD and be what the view serves"""
+        self.assertEqual(os.path.dirname(self.version.feature_catalog_path()), os.path.dirname(self.version.xsd_file.path))
+        self.assertIn("<gco:LocalName>WellName</gco:LocalName>", self.catalog())
+
+        response = self.get()
+        self.assertEqual(response.content, self.catalog())
+        self.assertEqual(response["ETag"], '"%s"' % self.version.feature_catalog_etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_only_rewritten_when_changed(self):
+        """Saving without changing the XSD should keep the catalogue; a new XSD should replace it"""
+        with open(self.version.feature_catalog_path(), "wb") as f:
+            f.write("left alone")
+        self.version.sample_wfs_request = "http://example.org/wfs"
+        self.version.save()
+        self.assertEqual(self.catalog(), "left alone")
+
+        etag = self.version.feature_catalog_etag
+        self.version.xsd_file = File(ContentFile(SCHEMA.replace("WellName", "WellLabel")), "catalog.xsd")
+        self.version.save()
+        self.assertIn("<gco:LocalName>WellLabel</gco:LocalName>", self.catalog())
+        self.assertNotEqual(ModelVersion.objects.get(pk=self.version.pk).feature_catalog_etag, etag)
+
+    def test_rendered_when_missing(self):
+        """A catalogue that isn't on disk should be rendered by the request for it"""
+        os.remove(self.version.feature_catalog_path())
+        self.assertIn("WellName", self.get().content)
+        self.assertTrue(os.path.exists(self.version.feature_catalog_path()))
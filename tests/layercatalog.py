@@ -0,0 +1,65 @@
+from django.test import TestCase
+from modelmanager.validation.validators import catalog as catalog_module
+from modelmanager.validation.validators.catalog import LayerCatalog, catalog, forget_catalog
+
+class Item(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def fake_models():
+    return [
+        Item(title="Well Headers", versions=[
+            Item(version="1.0", uri="http://example.org/wellheader/1.0", layers=[Item(layer_name="Wellheader")]),
+            Item(version="1.5", uri="http://example.org/wellheader/1.5", layers=[Item(layer_name="Wellheader")])
+        ]),
+        Item(title="Heat Flow", versions=[
+            Item(version="1.0", uri="http://example.org/heatflow/1.0", layers=[Item(layer_name="HeatFlow"), Item(layer_name="Wellheader")])
+        ])
+    ]
+
+class LayerCatalogTestCase(TestCase):
+    """Tests for the cached index of usginmodels layers and versions"""
+
+    def setUp(self):
+        self.loads = 0
+        def get_models():
+            self.loads += 1
+            return fake_models()
+        self.originals = catalog_module.usginmodels.get_models, catalog_module.usginmodels.refresh
+        catalog_module.usginmodels.get_models = get_models
+        catalog_module.usginmodels.refresh = lambda: None
+        catalog_module._catalog = None
+        catalog_module._stale = catalog_module._refreshing = False
+
+    def tearDown(self):
+        catalog_module.usginmodels.get_models, catalog_module.usginmodels.refresh = self.originals
+        catalog_module._catalog = None
+        catalog_module._stale = catalog_module._refreshing = False
+
+    def test_index(self):
+        """Layer names should be distinct and sorted, and version URIs looked up by title and version"""
+        index = LayerCatalog(fake_models())
+        self.assertEqual(index.layer_names, ["HeatFlow", "Wellheader"])
+        self.assertEqual(index.version_uri("Well Headers", "1.5"), "http://example.org/wellheader/1.5")
+        self.assertIsNone(index.version_uri("Well Headers", "2.0"))
+
+    def test_built_once(self):
+        """The catalog should only be rebuilt when it expires or the models change"""
+        first = catalog()
+        self.assertIs(catalog(), first)
+        self.assertEqual(self.loads, 1)
+
+        forget_catalog()
+        self.assertIsNot(catalog(), first)
+        self.assertEqual(self.loads, 2)
+
+    def test_served_while_refreshing(self):
+        """The old catalog should be returned while another caller is refreshing it"""
+        first = catalog()
+        during = []
+        catalog_module.usginmodels.refresh = lambda: during.append(catalog())
+        forget_catalog()
+        second = catalog()
+        self.assertEqual(during, [first])
+        self.assertIsNot(second, first)
+        self.assertIs(catalog(), second)
@@ -0,0 +1,45 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files import File
+from modelmanager.models import ContentModel, ModelVersion, LayerField
+from modelmanager import views
+from schemaindex import SCHEMA
+import json, os, shutil
+
+class LayerFieldIndexTestCase(TestCase):
+    """Tests for the LayerField table and the /fields.json query"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.cm = ContentModel.objects.create(title="Field Model", label="field-model", description="Fields")
+        self.version = ModelVersion.objects.create(
+            content_model=self.cm, version="1.0",
+            xsd_file=File(ContentFile(SCHEMA), "fields.xsd"),
+            xls_file=File(ContentFile("Dummy Excel File"), "fields.xls")
+        )
+
+    def tearDown(self):
+        folder = os.path.join(settings.MEDIA_ROOT, self.cm.folder_path())
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+    def query(self, **params):
+        return json.loads(views.get_fields(self.factory.get("/fields.json", params)).content)
+
+    def test_indexed_on_save(self):
+        """Saving a version should store one row per field of each layer, in order"""
+        fields = LayerField.objects.filter(modelversion=self.version, layer="Wells")
+        self.assertEqual([f.name for f in fields], ["OBJECTID", "WellName", "Depth"])
+        self.assertEqual(LayerField.objects.filter(modelversion=self.version).count(), 4)
+
+    def test_query(self):
+        """Fields can be found across the catalog with a single query"""
+        with self.assertNumQueries(1):
+            found = self.query(name="OBJECTID")
+        self.assertEqual([(f["model"], f["version"], f["layer"]) for f in found], [("field-model", "1.0", "Wells")])
+
+        required = self.query(layer="Wells", optional="false")
+        self.assertEqual([f["name"] for f in required], ["WellName"])
+        self.assertEqual(required[0]["description"], "Name of the well")
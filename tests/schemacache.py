@@ -0,0 +1,95 @@
+from django.test import TestCase
+from modelmanager.schemacache import ValidatorCache, ThreadLocalValidatorCache, file_changed, cached_schema_metadata, forget_schema_metadata
+from lxml import etree
+import os, shutil, tempfile, threading
+
+SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="%s" type="xs:string"/>
+</xs:schema>"""
+
+class FakeFile(object):
+    def __init__(self, file_path):
+        self.path = file_path
+
+class FakeVersion(object):
+    """Stand-in for a ModelVersion: the cache only needs a pk and xsd_file.path"""
+    def __init__(self, pk, file_path):
+        self.pk = pk
+        self.xsd_file = FakeFile(file_path)
+
+class SchemaCacheTestCase(TestCase):
+    """Tests for the process-wide cache of compiled XMLSchema validators"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = ValidatorCache(max_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_schema(self, name, element):
+        file_path = os.path.join(self.folder, name)
+        with open(file_path, "w") as f:
+            f.write(SCHEMA % element)
+        file_changed(file_path)
+        return FakeVersion(len(os.listdir(self.folder)), file_path)
+
+    def test_reuses_compiled_schema(self):
+        """Repeated lookups for an unchanged XSD should return the same validator"""
+        v = self.write_schema("a.xsd", "A")
+        self.assertIs(self.cache.get(v), self.cache.get(v))
+
+    def test_recompiles_changed_schema(self):
+        """Rewriting the XSD should produce a fresh validator for the new content"""
+        v = self.write_schema("a.xsd", "A")
+        first = self.cache.get(v)
+        self.write_schema("a.xsd", "B")
+        second = self.cache.get(v)
+        self.assertIsNot(first, second)
+        self.assertFalse(second.validate(etree.fromstring("<A>x</A>")))
+        self.assertTrue(second.validate(etree.fromstring("<B>x</B>")))
+
+    def test_evicts_least_recently_used(self):
+        """The cache should never hold more validators than its maximum size"""
+        a = self.write_schema("a.xsd", "A")
+        b = self.write_schema("b.xsd", "B")
+        c = self.write_schema("c.xsd", "C")
+        first_a = self.cache.get(a)
+        self.cache.get(b)
+        self.cache.get(c)
+        self.assertEqual(len(self.cache.entries), 2)
+        self.assertIsNot(self.cache.get(a), first_a)
+
+    def test_validators_per_thread(self):
+        """Threads should not share a validator, and invalidating should reach every thread"""
+        cache = ThreadLocalValidatorCache()
+        v = self.write_schema("a.xsd", "A")
+        mine = cache.get(v)
+        found = []
+        thread = threading.Thread(target=lambda: found.append(cache.get(v)))
+        thread.start()
+        thread.join()
+        self.assertIs(cache.get(v), mine)
+        self.assertIsNot(found[0], mine)
+
+        cache.invalidate(v.pk)
+        self.assertIsNot(cache.get(v), mine)
+
+    def test_metadata_extracted_once_per_revision(self):
+        """Schema metadata should only be rebuilt when the XSD changes or is forgotten"""
+        calls = []
+        def build():
+            calls.append(1)
+            return len(calls)
+
+        v = self.write_schema("a.xsd", "A")
+        forget_schema_metadata(v.pk)
+        self.assertEqual(cached_schema_metadata(v, "layers_info", build), 1)
+        self.assertEqual(cached_schema_metadata(v, "layers_info", build), 1)
+
+        self.write_schema("a.xsd", "B")
+        self.assertEqual(cached_schema_metadata(v, "layers_info", build), 2)
+
+        forget_schema_metadata(v.pk)
+        self.assertEqual(cached_schema_metadata(v, "layers_info", build), 3)
\ No newline at end of file
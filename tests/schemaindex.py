@@ -0,0 +1,73 @@
+from django.test import TestCase
+from modelmanager.schemaindex import SchemaIndex
+from modelmanager.benchmarks.bench_schemaindex import synthetic_schema, xpath_layers_info
+from lxml import etree
+
+SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:aasg="http://example.org/aasg"
+           xmlns:gml="http://www.opengis.net/gml" targetNamespace="http://example.org/aasg">
+  <xs:element name="Wells" type="aasg:WellsType"/>
+  <xs:element name="Springs" type="aasg:SpringsType"/>
+  <xs:complexType name="CommonType">
+    <xs:complexContent>
+      <xs:extension base="gml:AbstractFeatureType">
+        <xs:sequence>
+          <xs:element name="OBJECTID" type="xs:int" minOccurs="0"/>
+        </xs:sequence>
+      </xs:extension>
+    </xs:complexContent>
+  </xs:complexType>
+  <xs:complexType name="WellsType">
+    <xs:complexContent>
+      <xs:extension base="aasg:CommonType">
+        <xs:sequence>
+          <xs:element name="WellName" type="xs:string">
+            <xs:annotation><xs:documentation>Name of the well</xs:documentation></xs:annotation>
+          </xs:element>
+          <xs:element name="Depth" minOccurs="0">
+            <xs:simpleType><xs:restriction base="xs:double"/></xs:simpleType>
+          </xs:element>
+        </xs:sequence>
+      </xs:extension>
+    </xs:complexContent>
+  </xs:complexType>
+  <xs:complexType name="SpringsType">
+    <xs:complexContent>
+      <xs:extension base="gml:AbstractFeatureType">
+        <xs:sequence>
+          <xs:element name="SpringName" type="xs:string"/>
+        </xs:sequence>
+      </xs:extension>
+    </xs:complexContent>
+  </xs:complexType>
+</xs:schema>"""
+
+class SchemaIndexTestCase(TestCase):
+    """Tests for the single-pass XSD introspection used by ModelVersion.layers_info"""
+
+    def setUp(self):
+        self.index = SchemaIndex(etree.fromstring(SCHEMA).getroottree())
+
+    def test_layers_info(self):
+        """layers_info should list each layer's fields, with inherited common fields first"""
+        objectid = {"name": "OBJECTID", "type": "int", "optional": True, "description": None}
+        self.assertEqual(self.index.layers_info().items(), [
+            ("Wells", [
+                objectid,
+                {"name": "WellName", "type": "string", "optional": False, "description": "Name of the well"},
+                {"name": "Depth", "type": "double", "optional": True, "description": None}
+            ]),
+            ("Springs", [
+                {"name": "SpringName", "type": "string", "optional": False, "description": None}
+            ])
+        ])
+
+    def test_type_details(self):
+        """The index should expose the target namespace and the first element's type"""
+        self.assertEqual(self.index.target_namespace(), "http://example.org/aasg")
+        self.assertEqual(self.index.first_element_type(), "aasg:WellsType")
+
+    def test_matches_xpath_implementation(self):
+        """Output should be identical to the per-layer XPath implementation it replaced"""
+        schema = synthetic_schema(20, 5)
+        self.assertEqual(SchemaIndex(schema).layers_info(), xpath_layers_info(schema))
@@ -3,7 +3,10 @@ from django.conf import settings
 from modelmanager.uriconfigure import *
 from modelmanager.models import ContentModel, ModelVersion
 from utils import create_dummy_files
-from uriredirect.models import RewriteRule
+from uriredirect.models import RewriteRule, AcceptMapping
+from django.core.management import call_command
+from StringIO import StringIO
+import sys
 
 def generate_content_model():
     """Function to generate an example ContentModel"""
@@ -135,4 +138,61 @@ class UriConfigureTestCase(TestCase):
         cm_html_mapping = cm_rule.acceptmapping_set.get(media_type=HTML_MEDIA())
         self.assertEqual(cm_html_mapping.redirect_to, self.cm.my_html())
         cm_json_mapping = cm_rule.acceptmapping_set.get(media_type=JSON_MEDIA())
-        self.assertEqual(cm_json_mapping.redirect_to, self.cm.my_json())
\ No newline at end of file
+        self.assertEqual(cm_json_mapping.redirect_to, self.cm.my_json())
+        
+    def add_versions(self, *numbers):
+        for number in numbers:
+            mv = generate_model_version(self.cm)
+            mv.version = number
+            mv.save()
+        
+    def test_relabel(self):
+        """Relabeling a ContentModel should update the rules and mappings of all its versions"""
+        self.add_versions("2.0", "3.0")
+        self.cm.label = "renamed"
+        self.cm.save()
+        
+        for version in ModelVersion.objects.filter(content_model=self.cm).select_related("rewrite_rule"):
+            self.assertEqual(version.rewrite_rule.pattern, version.regex_pattern())
+            self.assertEqual(version.rewrite_rule.acceptmapping_set.count(), 4)
+            self.assertEqual(version.rewrite_rule.acceptmapping_set.get(media_type=XSD_MEDIA()).redirect_to, version.absolute_xsd_path())
+        
+    def test_sync_unchanged(self):
+        """Syncing rules that are already correct should only read, however many versions there are"""
+        self.add_versions("2.0", "3.0")
+        cm = ContentModel.objects.select_related("rewrite_rule", "latest_modelversion").get(pk=self.cm.pk)
+        items = [(cm, "ContentModel")] + [ (mv, "ModelVersion") for mv in cm.modelversion_set.select_related("rewrite_rule", "content_model") ]
+        
+        # The register, the four media types and the existing mappings
+        with self.assertNumQueries(6):
+            RuleSync().sync(items)
+        
+    def rebuild(self, **options):
+        streams = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        try:
+            call_command("rebuild_rewrite_rules", **options)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout, sys.stderr = streams
+        
+    def test_rebuild(self):
+        """rebuild_rewrite_rules should fix mappings that are out of date, and only report them in a dry run"""
+        xsd = XSD_MEDIA()
+        AcceptMapping.objects.filter(rewrite_rule=self.mv.rewrite_rule, media_type=xsd).update(redirect_to="http://old.example.org/x.xsd")
+        unused = RewriteRule.objects.create(**create_rule_attribs(self.cm))
+        foreign = RewriteRule.objects.create(register=unused.register, label="vocabulary", description="Added by hand", pattern="^vocabulary/(\\.[a-zA-Z]{3,4}|/)?$")
+        
+        report = self.rebuild(dry_run=True, prune=True)
+        self.assertIn("http://old.example.org/x.xsd", report)
+        self.assertIn("Unused rule %s" % unused.label, report)
+        self.assertNotIn("vocabulary", report)
+        self.assertTrue(AcceptMapping.objects.filter(redirect_to="http://old.example.org/x.xsd").exists())
+        self.assertTrue(RewriteRule.objects.filter(pk=unused.pk).exists())
+        
+        self.rebuild(prune=True)
+        mapping = AcceptMapping.objects.get(rewrite_rule=self.mv.rewrite_rule, media_type=xsd)
+        self.assertEqual(mapping.redirect_to, self.mv.absolute_xsd_path())
+        self.assertFalse(RewriteRule.objects.filter(pk=unused.pk).exists())
+        self.assertTrue(RewriteRule.objects.filter(pk=foreign.pk).exists())
+        self.assertEqual(self.rebuild(dry_run=True), "")
@@ -1,6 +1,21 @@
 from django.core.files.base import ContentFile
 from django.core.files import File
 
+SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:aasg="http://example.org/aasg"
+           xmlns:gml="http://www.opengis.net/gml" targetNamespace="http://example.org/aasg">
+  <xs:element name="Example" type="aasg:ExampleType"/>
+  <xs:complexType name="ExampleType">
+    <xs:complexContent>
+      <xs:extension base="gml:AbstractFeatureType">
+        <xs:sequence>
+          <xs:element name="Name" type="xs:string"/>
+        </xs:sequence>
+      </xs:extension>
+    </xs:complexContent>
+  </xs:complexType>
+</xs:schema>"""
+
 def create_dummy_files():
   # Create dummy files to be the XSD and XLS files
   dummy_xsd_content = ContentFile("Dummy Schema File")
@@ -8,4 +23,81 @@ def create_dummy_files():
   dummy_xsd_file = File(dummy_xsd_content, "dummyFile.xsd")
   dummy_xls_file = File(dummy_xls_content, "dummyFile.xls")
   
-  return dummy_xsd_file, dummy_xls_file
\ No newline at end of file
+  return dummy_xsd_file, dummy_xls_file
+
+def create_schema_files():
+  # Like create_dummy_files, but the XSD is a real schema that can be parsed
+  xsd_file = File(ContentFile(SCHEMA), "example.xsd")
+  xls_file = File(ContentFile("Dummy Excel File"), "example.xls")
+  
+  return xsd_file, xls_file
+
+class StubServer(object):
+  """A tiny local HTTP server for tests that fetch WFS documents.
+  Serve content with server.add(path, body, etag=None, gzip=False, delay=0).
+  body may be a function of the query string parameters that returns the content."""
+  
+  def __init__(self):
+    from BaseHTTPServer import HTTPServer
+    import threading
+    
+    self.documents = {}
+    self.requests = []
+    self.server = HTTPServer(("127.0.0.1", 0), self.handler())
+    self.server.handle_error = lambda request, client_address: None   # Clients that time out hang up early
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+  
+  def url(self, path):
+    return "http://127.0.0.1:%s%s" % (self.server.server_port, path)
+  
+  def add(self, path, body, etag=None, gzip=False, delay=0):
+    self.documents[path] = {"body": body, "etag": etag, "gzip": gzip, "delay": delay}
+    return self.url(path)
+  
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+  
+  def handler(self):
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    import gzip, StringIO, time, urlparse
+    stub = self
+    
+    class Handler(BaseHTTPRequestHandler):
+      def log_message(self, *args):
+        pass
+      
+      def do_GET(self):
+        stub.requests.append({"path": self.path, "headers": dict(self.headers)})
+        doc = stub.documents.get(self.path.split("?")[0])
+        if doc is None:
+          self.send_response(404)
+          self.send_header("Content-Length", "0")
+          self.end_headers()
+          return
+        
+        time.sleep(doc["delay"])
+        if doc["etag"] and self.headers.get("If-None-Match") == doc["etag"]:
+          self.send_response(304)
+          self.send_header("Content-Length", "0")
+          self.end_headers()
+          return
+        
+        body = doc["body"]
+        if callable(body): body = body(dict(urlparse.parse_qsl(self.path.partition("?")[2])))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml")
+        if doc["etag"]: self.send_header("ETag", doc["etag"])
+        if doc["gzip"] and "gzip" in self.headers.get("Accept-Encoding", ""):
+          buf = StringIO.StringIO()
+          with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+            f.write(body)
+          body = buf.getvalue()
+          self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    return Handler
\ No newline at end of file
@@ -0,0 +1,105 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from modelmanager.models import ValidationJob
+from modelmanager.validation.validators import jobs
+from django.utils import timezone
+from datetime import timedelta
+import json
+
+def counting_task(progress, count):
+    for n in range(1, count + 1):
+        progress(n, n / 2)
+    progress(count, count / 2, force=True)
+    return {"validated": count}
+
+def failing_task(progress):
+    progress(3, 1, 10, force=True)
+    raise ValueError("The WFS went away")
+
+def unicode_failing_task(progress):
+    raise ValueError(u"Unknown feature type \u00e9")
+
+class ValidationJobTestCase(TestCase):
+    """Tests for background validation jobs"""
+
+    def run_task(self, task, *args):
+        job = ValidationJob.objects.create(kind="wfs", description="test")
+        jobs.run_job(job.pk, task, args)
+        return ValidationJob.objects.get(pk=job.pk)
+
+    def test_finished_job(self):
+        """A finished job should keep its progress and results"""
+        job = self.run_task(counting_task, 100)
+        self.assertEqual(job.status, ValidationJob.DONE)
+        self.assertEqual((job.processed, job.error_count), (100, 50))
+        self.assertEqual(job.result_data(), {"validated": 100})
+        self.assertIsNotNone(job.date_finished)
+
+    def test_failed_job(self):
+        """A task that raises should mark the job failed with its message"""
+        job = self.run_task(failing_task)
+        self.assertEqual(job.status, ValidationJob.FAILED)
+        self.assertEqual(job.message, "The WFS went away")
+        self.assertEqual((job.processed, job.total), (3, 10))
+        self.assertIsNone(job.result_data())
+
+    def test_unicode_failure(self):
+        """A failure message that isn't ASCII should be kept"""
+        job = self.run_task(unicode_failing_task)
+        self.assertEqual(job.status, ValidationJob.FAILED)
+        self.assertEqual(job.message, u"Unknown feature type \u00e9")
+
+    def test_stale_job(self):
+        """A job left running for longer than the timeout should be reported as failed"""
+        started = timezone.now() - timedelta(seconds=jobs.TIMEOUT + 60)
+        job = ValidationJob.objects.create(kind="wfs", status=ValidationJob.RUNNING, date_started=started)
+        recent = ValidationJob.objects.create(kind="wfs", status=ValidationJob.RUNNING, date_started=timezone.now())
+        status = json.loads(jobs.job_status(RequestFactory().get("/"), job.key).content)
+        self.assertEqual(status["status"], "failed")
+        self.assertEqual(ValidationJob.objects.get(pk=job.pk).status, ValidationJob.FAILED)
+        jobs.job_status(RequestFactory().get("/"), recent.key)
+        self.assertEqual(ValidationJob.objects.get(pk=recent.pk).status, ValidationJob.RUNNING)
+
+    def test_progress_is_throttled(self):
+        """Progress should only be written once per interval unless forced"""
+        job = ValidationJob.objects.create(kind="cm")
+        progress = jobs.Progress(job, interval=60)
+        with self.assertNumQueries(1):
+            for n in range(50):
+                progress(n)
+        with self.assertNumQueries(1):
+            progress(50, force=True)
+
+    def test_status(self):
+        """The status endpoint should report progress as JSON"""
+        job = ValidationJob.objects.create(kind="wfs", status=ValidationJob.RUNNING, processed=5, total=20)
+        response = jobs.job_status(RequestFactory().get("/"), job.key)
+        status = json.loads(response.content)
+        self.assertEqual(status["id"], job.key)
+        self.assertEqual((status["status"], status["processed"], status["total"]), ("running", 5, 20))
+
+    def test_missing_job(self):
+        """A job that can't be loaded should be logged, not raised into the pool"""
+        jobs.run_job(12345, counting_task, (10,))
+
+    def test_queued_after_request(self):
+        """Jobs created inside a transaction should only be queued once the request is over"""
+        queued = []
+        class FakePool(object):
+            def apply_async(self, func, args):
+                queued.append(args[0])
+        workers, pool = jobs.WORKERS, jobs.pool
+        jobs.WORKERS, jobs.pool = 2, lambda: FakePool()
+        try:
+            job = jobs.submit("wfs", "test", counting_task, 10)
+            self.assertEqual(queued, [])
+            jobs.queue_unqueued()
+            self.assertEqual(queued, [job.pk])
+        finally:
+            jobs.WORKERS, jobs.pool = workers, pool
+
+    def test_urls(self):
+        """Job URLs should come from the URLconf"""
+        job = ValidationJob.objects.create(kind="wfs")
+        self.assertEqual(jobs.job_url(job), "/validate/job/%s" % job.key)
+        self.assertEqual(jobs.job_status_url(job), "/validate/job/%s.json" % job.key)
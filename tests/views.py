@@ -0,0 +1,208 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.conf import settings
+from django.http import Http404, QueryDict
+from modelmanager.models import ContentModel, ModelVersion
+from modelmanager import views
+from modelmanager.labelindex import label_index
+from utils import create_schema_files
+import json, os, shutil
+
+class FeedQueryCountTestCase(TestCase):
+    """The catalog feeds should issue a fixed number of queries no matter how many models there are"""
+
+    def setUp(self):
+        self.created = []
+
+    def tearDown(self):
+        for cm in self.created:
+            folder = os.path.join(settings.MEDIA_ROOT, cm.folder_path())
+            if os.path.exists(folder):
+                shutil.rmtree(folder)
+
+    def create_models(self, count):
+        for n in range(len(self.created), len(self.created) + count):
+            cm = ContentModel.objects.create(
+                title="Query Count Model %s" % n,
+                label="query-count-%s" % n,
+                description="Description %s" % n
+            )
+            for version in ["1.0", "2.0"]:
+                xsd, xls = create_schema_files()
+                ModelVersion.objects.create(content_model=cm, version=version, xsd_file=xsd, xls_file=xls)
+            self.created.append(cm)
+
+    def assertConstantQueries(self, render):
+        # One query for the models, one to prefetch all of their versions
+        self.create_models(1)
+        self.assertNumQueries(2, render)
+        self.create_models(3)
+        self.assertNumQueries(2, render)
+
+    def test_json(self):
+        self.assertConstantQueries(lambda: views.view_models(ContentModel.objects.with_versions(), "json"))
+
+    def test_atom(self):
+        self.assertConstantQueries(lambda: views.view_models(ContentModel.objects.with_versions(), "xml"))
+
+    def test_drupal(self):
+        self.assertConstantQueries(lambda: views.view_models(ContentModel.objects.with_versions(), "drupal"))
+
+    def test_html(self):
+        self.assertConstantQueries(lambda: views.view_models(ContentModel.objects.with_versions(), "html"))
+
+    def test_homepage(self):
+        self.assertConstantQueries(lambda: views.homepage(None))
+
+    def test_models_page(self):
+        self.assertConstantQueries(lambda: views.models(None))
+
+
+class FeedCacheTestCase(TestCase):
+    """The catalog feeds should be served from the cache with working conditional GETs"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.cm = ContentModel.objects.create(title="Feed Cache Model", label="feed-cache", description="Cached")
+        self.add_version("1.0")
+
+    def tearDown(self):
+        folder = os.path.join(settings.MEDIA_ROOT, self.cm.folder_path())
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+    def add_version(self, version):
+        xsd, xls = create_schema_files()
+        return ModelVersion.objects.create(content_model=self.cm, version=version, xsd_file=xsd, xls_file=xls)
+
+    def get(self, extension, **headers):
+        return views.get_all_models(self.factory.get("/contentmodels.%s" % extension, **headers), extension)
+
+    def test_served_without_queries(self):
+        """Once a feed has been rendered, serving it again should not touch the database"""
+        self.get("json")
+        self.assertNumQueries(0, lambda: self.get("json"))
+
+    def test_validators(self):
+        """Responses should carry an ETag, and no Last-Modified date that could go stale"""
+        response = self.get("xml")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header("ETag"))
+        self.assertFalse(response.has_header("Last-Modified"))
+
+    def test_if_none_match(self):
+        """A matching If-None-Match should get a 304"""
+        etag = self.get("json")["ETag"]
+        self.assertEqual(self.get("json", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get("json", HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_if_modified_since(self):
+        """If-Modified-Since alone should not get a 304"""
+        self.assertEqual(self.get("drupal", HTTP_IF_MODIFIED_SINCE="Thu, 01 Jan 2099 00:00:00 GMT").status_code, 200)
+
+    def test_dropped_on_edit(self):
+        """Editing a model, not only adding a version, should change the feed's ETag"""
+        etag = self.get("json")["ETag"]
+        self.cm.description = "Edited"
+        self.cm.save()
+        self.assertEqual(self.get("json", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_refreshed_on_save(self):
+        """Saving a version should change the feed and its ETag"""
+        before = self.get("json")
+        self.add_version("2.0")
+        after = self.get("json")
+        self.assertNotEqual(before["ETag"], after["ETag"])
+        self.assertIn("2.0", after.content)
+
+class LabelLookupTestCase(TestCase):
+    """Models and versions should be looked up by label through the label index"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        label_index.forget()
+        self.cm = ContentModel.objects.create(title="Label Lookup Model", label="label-lookup", description="Looked up")
+        xsd, xls = create_schema_files()
+        self.mv = ModelVersion.objects.create(content_model=self.cm, version="1.0", xsd_file=xsd, xls_file=xls)
+
+    def tearDown(self):
+        label_index.forget()
+        folder = os.path.join(settings.MEDIA_ROOT, self.cm.folder_path())
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+    def test_lookup(self):
+        """Labels and versions should resolve to primary keys, and be remembered"""
+        self.assertEqual(views.model_by_label("label-lookup"), self.cm.pk)
+        self.assertEqual(views.model_by_label("label-lookup", "1.0"), self.mv.pk)
+        self.assertNumQueries(0, lambda: views.model_by_label("label-lookup", "1.0"))
+
+    def test_not_found(self):
+        """Unknown labels and versions should be 404s"""
+        request = self.factory.get("/")
+        self.assertRaises(Http404, views.get_model, request, "no-such-model", "json")
+        self.assertRaises(Http404, views.get_feature_catalog, request, "no-such-model", "1.0")
+        self.assertRaises(Http404, views.get_feature_catalog, request, "label-lookup", "9.9")
+
+    def test_stale_index(self):
+        """An entry left behind by another process should be noticed and replaced"""
+        views.model_by_label("label-lookup")
+        label_index.pks[("label-lookup", None)] = self.cm.pk + 100
+        response = views.get_model(self.factory.get("/"), "label-lookup", "json")
+        self.assertEqual(json.loads(response.content)[0]["label"], "label-lookup")
+        self.assertEqual(label_index.lookup("label-lookup"), self.cm.pk)
+
+    def test_forgotten_on_save(self):
+        """Renaming a model should drop its old label from the index"""
+        views.model_by_label("label-lookup")
+        self.cm.label = "label-lookup-renamed"
+        self.cm.save()
+        self.assertRaises(Http404, views.model_by_label, "label-lookup")
+
+
+class ModelQueryTestCase(TestCase):
+    """The JSON catalog should page, filter and leave out fields that aren't asked for"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.created = []
+        for n in range(3):
+            cm = ContentModel.objects.create(title="Query Model %s" % n, label="query-model-%s" % n, description="Queried", status="draft" if n == 1 else "")
+            xsd, xls = create_schema_files()
+            ModelVersion.objects.create(content_model=cm, version="1.0", xsd_file=xsd, xls_file=xls)
+            self.created.append(cm)
+
+    def tearDown(self):
+        for cm in self.created:
+            folder = os.path.join(settings.MEDIA_ROOT, cm.folder_path())
+            if os.path.exists(folder):
+                shutil.rmtree(folder)
+
+    def get(self, **params):
+        return views.get_all_models(self.factory.get("/contentmodels.json", params), "json")
+
+    def test_pages(self):
+        """Following the next links should visit every model once"""
+        labels, params = [], {"limit": "2"}
+        while True:
+            response = self.get(**params)
+            labels += [cm["label"] for cm in json.loads(response.content)]
+            if not response.has_header("Link"): break
+            params = dict(QueryDict(response["Link"].split("?", 1)[1].split(">")[0]).items())
+        self.assertEqual(labels, ["query-model-0", "query-model-1", "query-model-2"])
+
+    def test_filters(self):
+        """Models can be picked by label, status and update date"""
+        self.assertEqual([cm["label"] for cm in json.loads(self.get(status="draft").content)], ["query-model-1"])
+        self.assertEqual(len(json.loads(self.get(label="query-model-2").content)), 1)
+        self.assertEqual(json.loads(self.get(updated_since="2999-01-01").content), [])
+        self.assertEqual(self.get(updated_since="yesterday").status_code, 400)
+
+    def test_sparse_fields(self):
+        """Only the fields asked for should be returned, without reading the versions' schemas"""
+        with self.assertNumQueries(2):
+            data = json.loads(self.get(fields="title,versions.version").content)
+        self.assertEqual(data[0], {"title": "Query Model 0", "versions": [{"version": "1.0"}]})
+        with self.assertNumQueries(1):
+            self.assertEqual(json.loads(self.get(fields="label", limit="1").content), [{"label": "query-model-0"}])
+        self.assertEqual(self.get(fields="versions.nothing").status_code, 400)
@@ -0,0 +1,116 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.contrib.auth.models import User, AnonymousUser
+from modelmanager.validation.validators import batch
+from modelmanager.validation.validators.batch import BatchValidation, BatchEntry, ManifestError, read_manifest, write_report
+from modelmanager.validation.validators.fetch import capabilities_cache
+from wfsvalidation import SCHEMA, feature_collection
+from schemacache import FakeVersion
+from utils import StubServer
+from StringIO import StringIO
+import csv, json, os, tempfile
+
+CAPABILITIES = """<wfs:WFS_Capabilities version="1.1.0" xmlns:wfs="http://www.opengis.net/wfs"
+    xmlns:ows="http://www.opengis.net/ows" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <ows:OperationsMetadata>
+    <ows:Operation name="GetFeature"><ows:DCP><ows:HTTP><ows:Get xlink:href="%s"/></ows:HTTP></ows:DCP></ows:Operation>
+  </ows:OperationsMetadata>
+  <wfs:FeatureTypeList><wfs:FeatureType><wfs:Name>aasg:Well</wfs:Name></wfs:FeatureType></wfs:FeatureTypeList>
+</wfs:WFS_Capabilities>"""
+
+class FakeBatch(BatchValidation):
+    """Looks versions up in a dictionary instead of the database"""
+    def __init__(self, entries, modelversions, **kwargs):
+        BatchValidation.__init__(self, entries, **kwargs)
+        self.fake_versions = modelversions
+
+    def load_modelversions(self):
+        return self.fake_versions
+
+class WfsBatchTestCase(TestCase):
+    """Tests for validating a manifest of WFS services"""
+
+    def setUp(self):
+        capabilities_cache.clear()
+        handle, self.schema_path = tempfile.mkstemp(suffix=".xsd")
+        with os.fdopen(handle, "w") as f:
+            f.write(SCHEMA)
+        self.versions = {("wells", "1.0"): FakeVersion(1, self.schema_path)}
+
+        self.server = StubServer()
+        self.server.add("/features", feature_collection(["1", "x", "3"]))
+        self.caps_url = self.server.add("/caps", CAPABILITIES % self.server.url("/features"))
+
+    def tearDown(self):
+        self.server.stop()
+        os.remove(self.schema_path)
+        capabilities_cache.clear()
+
+    def test_report(self):
+        """Each entry should get a row, and capabilities should only be fetched once"""
+        entries = [
+            BatchEntry(self.caps_url, "aasg:Well", "wells", "1.0"),
+            BatchEntry(self.caps_url, "aasg:Well", "wells", "1.0", 10),
+            BatchEntry(self.caps_url, "aasg:Pond", "wells", "1.0"),
+            BatchEntry(self.caps_url, "aasg:Well", "wells", "9.9")
+        ]
+        rows = FakeBatch(entries, self.versions, workers=4, host_concurrency=1, incremental=False).run()
+
+        self.assertEqual([row["status"] for row in rows], ["invalid", "invalid", "error", "error"])
+        self.assertEqual((rows[0]["valid_features"], rows[0]["invalid_features"]), (2, 1))
+        self.assertIn("maxfeatures=10", rows[1]["get_feature_url"])
+        self.assertEqual(len([r for r in self.server.requests if r["path"] == "/caps"]), 1)
+
+    def test_manifest(self):
+        """Manifests can be JSON or CSV, and incomplete entries are refused"""
+        entries = read_manifest(json.dumps([{"url": "http://a/wfs", "feature_type": "aasg:Well", "model": "wells", "version": "1.0"}]))
+        self.assertEqual((entries[0].url, entries[0].number_of_features), ("http://a/wfs", 99))
+
+        entries = read_manifest("url,feature_type,model,version,number_of_features\nhttp://a/wfs,aasg:Well,wells,1.0,50\n", "csv")
+        self.assertEqual(entries[0].number_of_features, 50)
+
+        self.assertRaises(ManifestError, read_manifest, json.dumps([{"url": "http://a/wfs"}]))
+        self.assertRaises(ManifestError, read_manifest, "not json")
+
+    def test_csv_report(self):
+        """The CSV report should have one line per entry with the errors joined together"""
+        entry = BatchEntry("http://a/wfs", "aasg:Well", "wells", "1.0")
+        output = StringIO()
+        write_report([entry.report("invalid", errors=[{"message": "Bad depth", "count": 2}])], output, "csv")
+        rows = list(csv.DictReader(StringIO(output.getvalue())))
+        self.assertEqual(rows[0]["errors"], "Bad depth (2)")
+        self.assertEqual(rows[0]["status"], "invalid")
+
+class BatchAccessTestCase(TestCase):
+    """Only staff users and holders of the API token may queue a batch"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.token = batch.API_TOKEN
+        batch.API_TOKEN = "secret"
+
+    def tearDown(self):
+        batch.API_TOKEN = self.token
+
+    def post(self, user=None, csrf=True, **headers):
+        request = self.factory.post("/validate/batch", "not json", content_type="application/json", **headers)
+        request.user = user or AnonymousUser()
+        request._dont_enforce_csrf_checks = not csrf
+        return batch.validate_wfs_batch(request)
+
+    def test_anonymous(self):
+        self.assertEqual(self.post(csrf=False).status_code, 403)
+        self.assertEqual(self.post(HTTP_AUTHORIZATION="Token wrong").status_code, 403)
+
+    def test_token(self):
+        """The token is enough on its own, without a session or a CSRF token"""
+        self.assertEqual(self.post(HTTP_AUTHORIZATION="Token secret").status_code, 400)
+        batch.API_TOKEN = None
+        self.assertEqual(self.post(HTTP_AUTHORIZATION="Token None").status_code, 403)
+
+    def test_staff(self):
+        """Staff users are let in, but their requests still need a CSRF token"""
+        staff = User(username="staff", is_staff=True, is_active=True)
+        self.assertEqual(self.post(staff, csrf=False).status_code, 400)
+        self.assertEqual(self.post(staff).status_code, 403)
+        self.assertEqual(self.post(User(username="user", is_active=True), csrf=False).status_code, 403)
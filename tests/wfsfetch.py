@@ -0,0 +1,54 @@
+from django.test import TestCase
+from modelmanager.validation.validators.fetch import DocumentCache, FetchError, get, open_stream
+from utils import StubServer
+
+CAPABILITIES = "<WFS_Capabilities>%s</WFS_Capabilities>" % ("<FeatureType/>" * 100)
+
+class FetchTestCase(TestCase):
+    """Tests for the shared HTTP layer used to retrieve WFS documents"""
+
+    def setUp(self):
+        self.server = StubServer()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_gzip_responses(self):
+        """Compressed responses should be requested and transparently decoded"""
+        url = self.server.add("/wfs", CAPABILITIES, gzip=True)
+        self.assertEqual(open_stream(url).read(), CAPABILITIES)
+        self.assertIn("gzip", self.server.requests[0]["headers"]["accept-encoding"])
+
+    def test_http_errors(self):
+        """Error statuses and timeouts should raise FetchError"""
+        self.assertRaises(FetchError, get, self.server.url("/missing"))
+        url = self.server.add("/slow", CAPABILITIES, delay=1)
+        self.assertRaises(FetchError, get, url, timeout=0.2)
+
+    def test_cache_within_ttl(self):
+        """A cached document should not be requested again until its TTL runs out"""
+        cache = DocumentCache(ttl=60)
+        url = self.server.add("/wfs", CAPABILITIES)
+        self.assertEqual(cache.fetch(url), CAPABILITIES)
+        self.assertEqual(cache.fetch(url), CAPABILITIES)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_revalidate_after_ttl(self):
+        """An expired document should be revalidated with its ETag and reused on 304"""
+        cache = DocumentCache(ttl=0)
+        url = self.server.add("/wfs", CAPABILITIES, etag='"v1"')
+        cache.fetch(url)
+        self.assertEqual(cache.fetch(url), CAPABILITIES)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1]["headers"]["if-none-match"], '"v1"')
+
+        # A changed document is downloaded again
+        self.server.add("/wfs", "<WFS_Capabilities/>", etag='"v2"')
+        self.assertEqual(cache.fetch(url), "<WFS_Capabilities/>")
+
+    def test_max_size(self):
+        """The cache should drop the oldest document when it is full"""
+        cache = DocumentCache(ttl=60, max_size=2)
+        for path in ["/a", "/b", "/c"]:
+            cache.fetch(self.server.add(path, CAPABILITIES))
+        self.assertEqual(sorted(cache.entries.keys()), [self.server.url("/b"), self.server.url("/c")])
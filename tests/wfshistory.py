@@ -0,0 +1,89 @@
+from django.test import TestCase
+from django.conf import settings
+from modelmanager.models import ContentModel, ModelVersion, ValidationRun, ValidatedFeature
+from modelmanager.validation.validators.history import IncrementalEngine
+from modelmanager.validation.validators.WfsGetFeature import StreamingValidationResults
+from modelmanager.validation.validators.ValidationEngine import ParallelEngine
+from wfsvalidation import SCHEMA, feature_collection
+from utils import create_schema_files
+from lxml import etree
+import os, shutil, tempfile
+
+URL = "http://example.org/wfs?request=GetFeature&typename=aasg:Well"
+
+class WfsHistoryTestCase(TestCase):
+    """Tests for keeping validation runs and skipping unchanged features"""
+
+    def setUp(self):
+        self.schema = etree.XMLSchema(etree.fromstring(SCHEMA))
+        self.cm = ContentModel.objects.create(title="History Model", label="history", description="History")
+        xsd, xls = create_schema_files()
+        self.version = ModelVersion.objects.create(content_model=self.cm, version="1.0", xsd_file=xsd, xls_file=xls)
+
+    def tearDown(self):
+        folder = os.path.join(settings.MEDIA_ROOT, self.cm.folder_path())
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+    def run_validation(self, depths, **options):
+        engine, result = self.validate(depths, **options)
+        return engine.finish(result)
+
+    def validate(self, depths, **options):
+        elements = etree.fromstring(feature_collection(depths)).iter("{http://example.org/aasg}Well")
+        engine = IncrementalEngine(self.schema, self.version, URL, "aasg:Well", **options)
+        return engine, StreamingValidationResults(elements, self.schema, engine=engine)
+
+    def test_rerun_skips_unchanged(self):
+        """A re-run should only validate the features that changed, with the same outcome"""
+        first = self.run_validation(["1", "x", "3"])
+        second = self.run_validation(["1", "x", "3"])
+        self.assertEqual((second.valid_count, second.invalid_count, second.unchanged_count), (2, 1, 3))
+        self.assertEqual(second.error_data(), first.error_data())
+
+        third = self.run_validation(["1", "2", "3"])
+        self.assertEqual((third.valid_count, third.invalid_count, third.unchanged_count), (3, 0, 2))
+        self.assertEqual(ValidationRun.objects.filter(service_key=first.service_key).count(), 3)
+
+    def test_schema_change(self):
+        """Nothing is reused once the XSD has changed"""
+        self.run_validation(["1", "2"])
+        with open(self.version.xsd_file.path, "a") as xsd:
+            xsd.write("<!-- revised -->")
+        self.assertEqual(self.run_validation(["1", "2"]).unchanged_count, 0)
+
+    def test_vanished_features(self):
+        """Features that are no longer served are forgotten"""
+        self.run_validation(["1", "2", "3"])
+        self.run_validation(["1", "2"])
+        self.assertEqual(ValidatedFeature.objects.filter(modelversion=self.version).count(), 2)
+
+    def test_pages(self):
+        """Stored results should be looked up a page at a time, with the same outcome"""
+        self.run_validation(["1", "x", "3", "4", "y"], page_size=2)
+        engine, result = self.validate(["1", "x", "3", "z", "y"], page_size=2)
+        run = engine.finish(result)
+        self.assertEqual((run.valid_count, run.invalid_count, run.unchanged_count), (2, 3, 4))
+        self.assertEqual(len(result.invalid_results()), 3)
+        self.assertEqual(ValidatedFeature.objects.filter(modelversion=self.version).count(), 5)
+
+    def test_concurrent_runs(self):
+        """Two runs against the same service that store the same features should both finish"""
+        first, first_result = self.validate(["1", "x", "3"])
+        second, second_result = self.validate(["1", "x", "3"])
+        first.finish(first_result)
+        run = second.finish(second_result)
+        self.assertEqual(run.valid_count, 2)
+        self.assertEqual(ValidatedFeature.objects.filter(modelversion=self.version).count(), 3)
+
+    def test_parallel(self):
+        """Changed features can be validated by a process pool"""
+        handle, schema_path = tempfile.mkstemp(suffix=".xsd")
+        with os.fdopen(handle, "w") as f:
+            f.write(SCHEMA)
+        try:
+            self.run_validation(["1", "x", "3"])
+            run = self.run_validation(["1", "y", "3", "4"], engine=ParallelEngine(schema_path, 2))
+        finally:
+            os.remove(schema_path)
+        self.assertEqual((run.valid_count, run.invalid_count, run.unchanged_count), (3, 1, 2))
@@ -0,0 +1,76 @@
+from django.test import TestCase
+from modelmanager.validation.validators.WfsCapabilities import WfsCapabilities
+from modelmanager.validation.validators.WfsGetFeature import WfsGetFeature
+from modelmanager.validation.validators.fetch import capabilities_cache
+from wfsvalidation import SCHEMA, feature_collection
+from wfsbatch import CAPABILITIES
+from utils import StubServer
+from lxml import etree
+
+DEPTHS = [ str(n) if n % 4 else "x%s" % n for n in range(1, 26) ]
+
+class WfsPagingTestCase(TestCase):
+    """Tests for requesting whole layers a page at a time"""
+
+    def setUp(self):
+        capabilities_cache.clear()
+        self.schema = etree.XMLSchema(etree.fromstring(SCHEMA))
+        self.server = StubServer()
+        self.hits = True
+        self.cap = len(DEPTHS)
+        self.server.add("/features", self.respond)
+        self.capabilities = WfsCapabilities(self.server.add("/caps", CAPABILITIES % self.server.url("/features")))
+
+    def tearDown(self):
+        self.server.stop()
+        capabilities_cache.clear()
+
+    def respond(self, params):
+        if params.get("resultType") == "hits":
+            collection = feature_collection([])
+            return collection.replace("<wfs:FeatureCollection", '<wfs:FeatureCollection numberOfFeatures="25"') if self.hits else collection
+        start = int(params.get("startIndex", 0))
+        return feature_collection(DEPTHS[start:start + min(self.cap, int(params.get("maxfeatures", len(DEPTHS))))])
+
+    def feature_requests(self):
+        return [ r["path"] for r in self.server.requests if r["path"].startswith("/features") and "hits" not in r["path"] ]
+
+    def validate(self):
+        get_feature = WfsGetFeature(self.capabilities, "aasg:Well", 99, page_size=10, prefetch=2)
+        self.assertTrue(get_feature.paged)
+        return get_feature, get_feature.validate_streaming(None, schema=self.schema)
+
+    def test_pages(self):
+        """Every page should be validated once, in order, sized by resultType=hits"""
+        get_feature, result = self.validate()
+        self.assertEqual((result.valid_count(), result.invalid_count()), (19, 6))
+        self.assertEqual(get_feature.number_matched, 25)
+        self.assertTrue(result.complete)
+        self.assertEqual(sorted(self.feature_requests()), sorted(get_feature.page_url(start)[len(self.server.url("")):] for start in [0, 10, 20]))
+
+    def test_without_hits(self):
+        """Without a feature count, a short page ends the layer"""
+        self.hits = False
+        get_feature, result = self.validate()
+        self.assertIsNone(get_feature.number_matched)
+        self.assertEqual((result.valid_count(), result.invalid_count()), (19, 6))
+
+    def test_capped_pages(self):
+        """A server returning fewer features than a page holds should leave the result incomplete"""
+        self.cap = 7
+        get_feature, result = self.validate()
+        self.assertFalse(result.complete)
+        self.assertFalse(result.valid)
+        self.assertTrue("fewer than the 10 asked for" in result.errors[0].message)
+
+    def test_capped_pages_without_hits(self):
+        """Without a feature count, features after a short page show that it was capped"""
+        self.hits = False
+        self.cap = 7
+        get_feature, result = self.validate()
+        self.assertFalse(result.complete)
+        self.assertTrue("fewer than the 10 asked for" in result.errors[0].message)
+
+    def test_not_paged(self):
+        """A limited number of features is requested in one go"""
+        self.assertFalse(WfsGetFeature(self.capabilities, "aasg:Well", 10).paged)
@@ -0,0 +1,122 @@
+from django.test import TestCase
+from modelmanager.validation.validators.WfsBase import WfsBase
+from modelmanager.validation.validators.WfsGetFeature import StreamingValidationResults, ValidationResults
+from modelmanager.validation.validators.ValidationEngine import ParallelEngine, ErrorLog, NamespacePrefixer
+from utils import StubServer
+from lxml import etree
+import os, tempfile
+
+SCHEMA = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="http://example.org/aasg" elementFormDefault="qualified">
+  <xs:element name="Well">
+    <xs:complexType><xs:sequence><xs:element name="Depth" type="xs:int"/></xs:sequence></xs:complexType>
+  </xs:element>
+</xs:schema>"""
+
+def feature_collection(depths):
+    members = "".join(
+        "<gml:featureMember><aasg:Well><aasg:Depth>%s</aasg:Depth></aasg:Well></gml:featureMember>" % depth
+        for depth in depths
+    )
+    return ('<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs" xmlns:gml="http://www.opengis.net/gml" '
+            'xmlns:aasg="http://example.org/aasg">%s</wfs:FeatureCollection>' % members)
+
+class StreamingValidationTestCase(TestCase):
+    """Tests for validating GetFeature responses as they are parsed"""
+
+    def setUp(self):
+        self.schema = etree.XMLSchema(etree.fromstring(SCHEMA))
+        self.server = StubServer()
+        self.collection = feature_collection(["1", "x", "3", "y", "5"])
+        self.url = self.server.add("/wfs", self.collection, gzip=True)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def stream(self, name="aasg:Well", sample_size=10):
+        doc = WfsBase(self.url)
+        return StreamingValidationResults(doc.iter_elements(name), self.schema, sample_size)
+
+    def test_counts_match_tree_validation(self):
+        """Streaming validation should count the same valid and invalid features as the tree-based path"""
+        tree = etree.fromstring(self.collection)
+        elements = tree.xpath("//aasg:Well", namespaces={"aasg": "http://example.org/aasg"})
+        expected = ValidationResults(elements, self.schema)
+        result = self.stream()
+        self.assertFalse(result.valid)
+        self.assertEqual(result.valid_count(), expected.valid_count())
+        self.assertEqual(result.invalid_count(), expected.invalid_count())
+        self.assertEqual(len(result.invalid_results()), 2)
+
+    def test_sample_is_bounded(self):
+        """Only sample_size invalid features should be kept"""
+        self.assertEqual(len(self.stream(sample_size=1).invalid_results()), 1)
+
+    def test_no_elements(self):
+        """A response without the requested feature type should not be valid"""
+        result = self.stream("aasg:Spring")
+        self.assertFalse(result.valid)
+        self.assertIn("No elements were validated.", [error.message for error in result.errors])
+
+
+class ParallelValidationTestCase(TestCase):
+    """Validating in a process pool should give exactly the same results as validating serially"""
+
+    def setUp(self):
+        handle, self.schema_path = tempfile.mkstemp(suffix=".xsd")
+        with os.fdopen(handle, "w") as f:
+            f.write(SCHEMA)
+        self.schema = etree.XMLSchema(etree.parse(self.schema_path))
+        collection = etree.fromstring(feature_collection(["1", "x", "3", "y", "5", "6", "z"]))
+        self.elements = collection.xpath("//aasg:Well", namespaces={"aasg": "http://example.org/aasg"})
+
+    def tearDown(self):
+        os.remove(self.schema_path)
+
+    def test_matches_serial(self):
+        serial = ValidationResults(self.elements, self.schema)
+        parallel = ValidationResults(self.elements, self.schema, ParallelEngine(self.schema_path, 2, batch_size=2))
+        self.assertEqual(parallel.valid, serial.valid)
+        self.assertEqual(parallel.valid_count(), serial.valid_count())
+        self.assertEqual(parallel.invalid_count(), serial.invalid_count())
+        self.assertEqual(parallel.errors, serial.errors)
+        self.assertEqual([r["valid"] for r in parallel.results], [r["valid"] for r in serial.results])
+
+    def test_streaming_matches_serial(self):
+        """Streamed elements can be validated in the pool too, keeping invalid samples"""
+        serial = StreamingValidationResults(iter(self.elements), self.schema)
+        parallel = StreamingValidationResults(iter(self.elements), self.schema, engine=ParallelEngine(self.schema_path, 2, batch_size=2))
+        self.assertEqual(parallel.valid_count(), serial.valid_count())
+        self.assertEqual(parallel.invalid_count(), serial.invalid_count())
+        self.assertEqual(parallel.errors, serial.errors)
+        self.assertEqual(parallel.invalid_results(), serial.invalid_results())
+
+class ErrorAggregationTestCase(TestCase):
+    """Errors should be collected from every feature and counted once per feature"""
+
+    def setUp(self):
+        self.schema = etree.XMLSchema(etree.fromstring(SCHEMA))
+        collection = etree.fromstring(feature_collection(["x", "1", "x", "y", "2"]))
+        self.elements = collection.xpath("//aasg:Well", namespaces={"aasg": "http://example.org/aasg"})
+
+    def test_counts_every_feature(self):
+        """Errors from every invalid feature should be reported, not just the last one's"""
+        errors = dict(ValidationResults(self.elements, self.schema).errors)
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(sorted(errors.values()), [1, 2])
+
+    def test_prefixed_messages(self):
+        """Namespace URIs in messages should be replaced with the document's prefixes"""
+        for error in ValidationResults(self.elements, self.schema).errors:
+            self.assertNotIn("{http://example.org/aasg}", error.message)
+            self.assertIn("aasg:Depth", error.message)
+
+    def test_error_log(self):
+        """A message repeated on one feature should only count once for it"""
+        log = ErrorLog()
+        log.add(["a", "b", "a"])
+        log.add(["a"])
+        self.assertEqual(log.summary(), [("a", 2), ("b", 1)])
+
+    def test_namespace_prefixer(self):
+        prefix = NamespacePrefixer([("aasg", "http://example.org/aasg"), ("gml", "http://www.opengis.net/gml")])
+        self.assertEqual(prefix("{http://example.org/aasg}Depth, {http://www.opengis.net/gml}id"), "aasg:Depth, gml:id")
\ No newline at end of file
@@ -1,5 +1,6 @@
 from uriredirect.models import UriRegister, RewriteRule, MediaType, AcceptMapping
 from django.conf import settings
+from django.db import transaction
 
 #--------------------------------------------------------------------------------------
 # Utility function to retrieve the default URI register
@@ -30,161 +31,212 @@ def get_media_type(kwargs):
     return MediaType.objects.create(**kwargs)
   
 #--------------------------------------------------------------------------------------
-# Functions to get the four needed media types needed within the module
+# The four media types needed within the module, and functions to get each of them
 #--------------------------------------------------------------------------------------
+XSD_TYPE = { "mime_type": "application/xml", "file_extension": ".xsd" }
+XLS_TYPE = { "mime_type": "application/vnd.ms-excel", "file_extension": ".xls" }
+HTML_TYPE = { "mime_type": "text/html", "file_extension": ".html" }
+JSON_TYPE = { "mime_type": "text/json", "file_extension": ".json" }
+MEDIA_TYPES = [XSD_TYPE, XLS_TYPE, HTML_TYPE, JSON_TYPE]
+
 def XSD_MEDIA():
-  return get_media_type({
-      "mime_type": "application/xml",
-      "file_extension": ".xsd"
-    })
+  return get_media_type(XSD_TYPE)
 def XLS_MEDIA(): 
-  return get_media_type({
-      "mime_type": "application/vnd.ms-excel",
-      "file_extension": ".xls"
-    })
+  return get_media_type(XLS_TYPE)
 def HTML_MEDIA():
-  return get_media_type({
-      "mime_type": "text/html",
-      "file_extension": ".html"
-    })
+  return get_media_type(HTML_TYPE)
 def JSON_MEDIA():
-  return get_media_type({
-      "mime_type": "text/json",
-      "file_extension": ".json"
-    })
+  return get_media_type(JSON_TYPE)
 
 #--------------------------------------------------------------------------------------
 # Function to define RewriteRule attributes from an object
 #   instance is a ModelVersion or ContentModel object  
 #--------------------------------------------------------------------------------------
-def create_rule_attribs(instance):
+def create_rule_attribs(instance, register=None):
   return {
-    "register": get_default_register(),
+    "register": register or get_default_register(),
     "label": instance.__unicode__(),
-    "description": "Redirection rule for %s" % instance.__unicode__(),
+    "description": "%s%s" % (RULE_DESCRIPTION_PREFIX, instance.__unicode__()),
     "pattern": instance.regex_pattern()
   }
 
 #--------------------------------------------------------------------------------------
-# Function to create a RewriteRule
+# The rules in a register that this module wrote: their descriptions come from
+#   create_rule_attribs, and their patterns have the form ContentModel.regex_pattern
+#   and ModelVersion.regex_pattern give them. The register is shared with the rest of
+#   uri-gin, so other rules in it are none of this module's business.
 #--------------------------------------------------------------------------------------
-def create_rewrite_rule(instance, class_name):
-  # Create the attributes that will define the RewriteRule
-  rule_attribs = create_rule_attribs(instance)
-  
-  # Create the RewriteRule
-  rule = RewriteRule.objects.create(**rule_attribs)
-  
-  # Associate the RewriteRule with this object
-  instance.rewrite_rule = rule
-  
-  # Configure AcceptMappings for this RewriteRule
-  configure_rule_mappings(instance, rule, class_name)
-  
-  # Return the rule
-  return rule
-  
+RULE_DESCRIPTION_PREFIX = "Redirection rule for "
+RULE_PATTERN_PREFIX = "^xmlschema/"
+RULE_PATTERN_SUFFIX = "(\\.[a-zA-Z]{3,4}|/)?$"
+
+def generated_rules(register):
+  return RewriteRule.objects.filter(
+    register=register,
+    description__startswith=RULE_DESCRIPTION_PREFIX,
+    pattern__startswith=RULE_PATTERN_PREFIX,
+    pattern__endswith=RULE_PATTERN_SUFFIX
+  )
+
 #--------------------------------------------------------------------------------------
-# Function to update a RewriteRule
+# Run a function in a transaction of its own, unless the caller already has one open.
+#   (Nesting commit_on_success would commit the caller's transaction early.)
 #--------------------------------------------------------------------------------------
-def update_rewrite_rule(instance, rule, class_name):
-  # Create the attributes that will define the RewriteRule
-  rule_attribs = create_rule_attribs(instance)
+def run_in_transaction(func, *args):
+  if transaction.is_managed():
+    return func(*args)
+  with transaction.commit_on_success():
+    return func(*args)
+
+#--------------------------------------------------------------------------------------
+# Class that brings the RewriteRules and AcceptMappings of many objects up to date at
+#   once. The register and media types are looked up once. A rule is only written if
+#   its attributes have changed, and the mappings of all the rules are read a few
+#   hundred rules at a time, compared with the ones that should exist, and fixed with
+#   bulk operations. Mappings for media types this module doesn't manage are left alone.
+#
+#   Every change is counted in self.counts and described in self.changes. With
+#   dry_run=True nothing is written (except the register and media types, which are
+#   created if they don't exist yet).
+#--------------------------------------------------------------------------------------
+CHUNK_SIZE = 500
+
+class RuleSync(object):
+  def __init__(self, dry_run=False):
+    self.dry_run = dry_run
+    self.register = None
+    self.media = {}    # (mime_type, file_extension) -> MediaType
+    self.counts = { "rules created": 0, "rules updated": 0, "mappings created": 0, "mappings deleted": 0 }
+    self.changes = []
   
-  # Add the rule's pk to the attributes hash, allowing it to be used to update
-  rule_attribs["pk"] = rule.pk
+  def record(self, kind, description):
+    self.counts[kind] += 1
+    self.changes.append(description)
   
-  # Update the rule
-  rule = RewriteRule(**rule_attribs)
-  rule.save()
+  def default_register(self):
+    if self.register is None: self.register = get_default_register()
+    return self.register
   
-  # Configure AcceptMappings for this RewriteRule
-  configure_rule_mappings(instance, rule, class_name)
+  def media_type(self, definition):
+    key = (definition["mime_type"], definition["file_extension"])
+    if key not in self.media: self.media[key] = get_media_type(definition)
+    return self.media[key]
   
-#--------------------------------------------------------------------------------------
-# Function to configure AcceptMappings for a RewriteRule
-#--------------------------------------------------------------------------------------
-def configure_rule_mappings(instance, rule, class_name):
-  # Configure the AcceptMappings for a ModelVersion's RewriteRule.
-  if class_name is "ModelVersion":
-    configure_version_mappings(instance, rule)
+  # The AcceptMappings that an object's RewriteRule should have, as {MediaType pk: URL}
+  def desired_mappings(self, instance, class_name):
+    if class_name == "ModelVersion":
+      urls = [
+        (XLS_TYPE, instance.absolute_xls_path()),
+        (XSD_TYPE, instance.absolute_xsd_path()),
+        (HTML_TYPE, instance.content_model.my_html()),
+        (JSON_TYPE, instance.content_model.my_json())
+      ]
+    else:
+      urls = [(HTML_TYPE, instance.my_html()), (JSON_TYPE, instance.my_json())]
+      
+      # File mappings depend on there being a ModelVersion in the set
+      if instance.latest_version() is not None:
+        urls.append((XLS_TYPE, instance.absolute_latest_xls_path()))
+        urls.append((XSD_TYPE, instance.absolute_latest_xsd_path()))
+    return dict((self.media_type(definition).pk, url) for definition, url in urls)
   
-  # Configure the AcceptMappings for a ContentModel's RewriteRule.
-  elif class_name is "ContentModel":     
-    configure_model_mappings(instance, rule)
-
-#--------------------------------------------------------------------------------------
-# This function creates or updates an AcceptMapping, given --
-#   rewriterule: a RewriteRule to which the AcceptMapping pertains
-#   url: the URL to which the AcceptMapping should redirect
-#   mediatype: the MediaType which is represented by the AcceptMapping
-#--------------------------------------------------------------------------------------
-def configure_mapping(rewriterule, url, mediatype):
-  # Setup the attributes that will define the AcceptMapping
-  mapping_attribs = {
-    "rewrite_rule": rewriterule,
-    "media_type": mediatype,
-    "redirect_to": url
-  }
+  # Create or update the RewriteRule of an object, and return it. In a dry run an
+  #   object without a rule gets None.
+  def sync_rule(self, instance):
+    attribs = create_rule_attribs(instance, self.default_register())
+    rule = instance.rewrite_rule
+    
+    if rule is None:
+      self.record("rules created", "Create rule %s" % attribs["label"])
+      if self.dry_run: return None
+      rule = RewriteRule.objects.create(**attribs)
+      instance.rewrite_rule = rule
+      if instance.pk is not None:
+        type(instance).objects.filter(pk=instance.pk).update(rewrite_rule=rule)
+    
+    elif rule.register_id != attribs["register"].pk or any(getattr(rule, key) != attribs[key] for key in ["label", "description", "pattern"]):
+      self.record("rules updated", "Update rule %s" % attribs["label"])
+      if not self.dry_run:
+        RewriteRule.objects.filter(pk=rule.pk).update(**attribs)
+        for key, value in attribs.items(): setattr(rule, key, value)
+    
+    return rule
   
-  # Look for an existing AcceptMapping associated with this RewriteRule and having
-  #   the correct media_type. If there is one, put its index into the attributes in
-  #   order to force an update of the existing AcceptMapping.
-  try:    
-    mapping_attribs["pk"] = rewriterule.acceptmapping_set.get(media_type=mediatype).pk
+  # Bring the rules and mappings of a list of (instance, class name) pairs up to date
+  def sync(self, items):
+    return run_in_transaction(self.sync_all, items)
   
-  # Don't need to adjust any attributes if there is no AcceptMapping yet.
-  except AcceptMapping.DoesNotExist:    
-    pass
+  def sync_all(self, items):
+    wanted = {}    # (rule pk, media type pk) -> URL. Rules that don't exist yet are ("new", n).
+    labels = {}    # rule pk -> label, to describe changes
+    rules = []
+    for instance, class_name in items:
+      rule = self.sync_rule(instance)
+      rules.append(rule)
+      rule_key = rule.pk if rule is not None else ("new", len(rules))
+      labels[rule_key] = instance.__unicode__()
+      for media_pk, url in self.desired_mappings(instance, class_name).items():
+        wanted[(rule_key, media_pk)] = url
+    
+    # Compare with the mappings that exist
+    managed = [ self.media_type(definition).pk for definition in MEDIA_TYPES ]
+    extensions = dict((media.pk, media.file_extension) for media in self.media.values())
+    rule_pks = [ rule.pk for rule in rules if rule is not None ]
+    stale = []
+    for start in range(0, len(rule_pks), CHUNK_SIZE):
+      existing = AcceptMapping.objects.filter(rewrite_rule__in=rule_pks[start:start + CHUNK_SIZE], media_type__in=managed)
+      for mapping in existing.only("pk", "rewrite_rule", "media_type", "redirect_to"):
+        key = (mapping.rewrite_rule_id, mapping.media_type_id)
+        if wanted.get(key) == mapping.redirect_to:
+          del wanted[key]
+        else:
+          stale.append(mapping.pk)
+          self.record("mappings deleted", "Remove %s mapping of %s to %s" % (extensions[key[1]], labels[key[0]], mapping.redirect_to))
     
-  # Create a new one or update an existing AcceptMapping
-  finally:
-    mapping = AcceptMapping(**mapping_attribs)
-    mapping.save()
+    for (rule_key, media_pk), url in sorted(wanted.items()):
+      self.record("mappings created", "Map %s of %s to %s" % (extensions[media_pk], labels[rule_key], url))
+    if self.dry_run: return rules
     
+    # Replace the mappings that are wrong, add the ones that are missing
+    for start in range(0, len(stale), CHUNK_SIZE):
+      AcceptMapping.objects.filter(pk__in=stale[start:start + CHUNK_SIZE]).delete()
+    if len(wanted) > 0:
+      AcceptMapping.objects.bulk_create([
+        AcceptMapping(rewrite_rule_id=rule_pk, media_type_id=media_pk, redirect_to=url)
+        for (rule_pk, media_pk), url in wanted.items()
+      ])
+    return rules
+
 #--------------------------------------------------------------------------------------
-# Function to create AcceptMappings for a ModelVersion
+# Function to create a RewriteRule, along with its AcceptMappings
 #--------------------------------------------------------------------------------------
-def configure_version_mappings(instance, rule):
-  configure_mapping(rule, instance.absolute_xls_path(), XLS_MEDIA())
-  configure_mapping(rule, instance.absolute_xsd_path(), XSD_MEDIA())
-  configure_mapping(rule, instance.content_model.my_html(), HTML_MEDIA())
-  configure_mapping(rule, instance.content_model.my_json(), JSON_MEDIA())
+def create_rewrite_rule(instance, class_name):
+  instance.rewrite_rule = None
+  return RuleSync().sync([(instance, class_name)])[0]
   
 #--------------------------------------------------------------------------------------
-# Function to create AcceptMappings for a ContentModel
+# Function to update a RewriteRule and its AcceptMappings
 #--------------------------------------------------------------------------------------
-def configure_model_mappings(instance, rule):
-  # When you first create a ContentModel, the instance does not yet have an ID assigned.
-  #    instance.my_html() and my_json() return None, and AcceptMappings are incorrect.
-  configure_mapping(rule, instance.my_html(), HTML_MEDIA())
-  configure_mapping(rule, instance.my_json(), JSON_MEDIA())
-  
-  # File mappings depend on there being a ModelVersion in the set
-  if instance.latest_version() is not None:    
-    configure_mapping(rule, instance.absolute_latest_xls_path(), XLS_MEDIA())
-    configure_mapping(rule, instance.absolute_latest_xsd_path(), XSD_MEDIA())
-  
+def update_rewrite_rule(instance, rule, class_name):
+  instance.rewrite_rule = rule
+  RuleSync().sync([(instance, class_name)])
+
 #--------------------------------------------------------------------------------------
-# This function manages RewriteRules defined by the uriredirect module.
-#   The function is called before a ModelVersion or ContentModel is saved. 
-#   It is registered in models.py.
+# This function makes sure an object has a RewriteRule before it is saved. The rule's
+#   attributes and mappings depend on the saved object (its pk and file paths), so
+#   they are filled in by update_related_rewrite_rules afterwards.
+#   The function is registered in models.py.
 #   sender is a reference to the class that is being saved
 #   instance is the object that is being saved
 #--------------------------------------------------------------------------------------
 def adjust_rewrite_rule(sender, instance, **kwargs):
-  # Look for a RewriteRule associated with this instance
-  rule = instance.rewrite_rule
-  
-  # Create one if it doesn't already exist, update it if it does
-  class_name = sender.__name__
-  if rule is None: rule = create_rewrite_rule(instance, class_name)
-  else: update_rewrite_rule(instance, rule, class_name)
+  if instance.rewrite_rule is None:
+    instance.rewrite_rule = RewriteRule.objects.create(**create_rule_attribs(instance))
 
 #--------------------------------------------------------------------------------------
-# This function updates RewriteRules that pertain to objects related to the 
-#   instance that has been saved. The function is registered in models.py and is 
-#   called after the object is saved
+# This function updates the RewriteRule of the instance that has been saved and the
+#   rules of related objects, in one RuleSync. The function is registered in models.py
+#   and is called after the object is saved
 #--------------------------------------------------------------------------------------
 def update_related_rewrite_rules(sender, instance, **kwargs):
   # Find the class name of the object being saved
@@ -192,12 +244,17 @@ def update_related_rewrite_rules(sender, instance, **kwargs):
   
   # Saving a ModelVersion may change the latest version of the ContentModel,
   #   which effects the ContentModel's RewriteRule.
-  if class_name is "ModelVersion":    
-    update_rewrite_rule(instance.content_model, instance.content_model.rewrite_rule, "ContentModel")
+  if class_name == "ModelVersion":
+    items = [(instance, class_name), (instance.content_model, "ContentModel")]
   
   # Changes to a ContentModel can affect ModelVersion's RewriteRules (i.e. changing the label).
-  elif class_name is "ContentModel":    
-    for version in instance.modelversion_set.all(): update_rewrite_rule(version, version.rewrite_rule, "ModelVersion")
+  else:
+    items = [(instance, class_name)]
+    for version in instance.modelversion_set.select_related("rewrite_rule"):
+      version.content_model = instance
+      items.append((version, "ModelVersion"))
+  
+  RuleSync().sync(items)
 
 #--------------------------------------------------------------------------------------
 # This function deletes a RewriteRule when a ModelVersion or ContentModel is deleted
@@ -9,6 +9,12 @@ urlpatterns = patterns('modelmanager.views',
                        # Get a single ContentModel as JSON or HTML
                        url(r'^contentmodel/(?P<content_model>.*)\.(?P<extension>json|html|xml|drupal)$', 'get_model'),
 
+                       # Query the fields of every layer as JSON
+                       url(r'^fields\.json$', 'get_fields'),
+
+                       # The change log, for harvesters
+                       url(r'^changes\.json$', 'get_changes'),
+
                        # Get a FeatureCatalogue for a particular ModelVersion
                        url(r'^featurecatalog/(?P<content_model>.*)/(?P<model_version>.*)\.xml', 'get_feature_catalog'),
 
@@ -26,9 +32,9 @@ urlpatterns = patterns('modelmanager.views',
                        url(r'^swagger/(?P<path>.*)', 'swagger')
 )
 
-# Serve static files
+# Serve uploaded files, compressed when there is a compressed copy
 if settings.DEBUG:
     urlpatterns += patterns('',
-                            url(r'^files/(?P<path>.*)$', 'django.views.static.serve',
+                            url(r'^files/(?P<path>.*)$', 'modelmanager.views.serve_file',
                                 {'document_root': settings.MEDIA_ROOT}),
     )
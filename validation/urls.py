@@ -5,5 +5,10 @@ urlpatterns = patterns('modelmanager.validation.validators',
   # Validation form, and form submission
   url('^wfs$', 'validate_wfs_form'),
   url('^cm$', 'validate_cm_form'),
-  url('^dl_csv$', 'download_csv')
+  url('^batch$', 'validate_wfs_batch'),
+  url('^dl_csv/(?P<token>[0-9a-f]{40})$', 'download_csv'),
+
+  # Background validation jobs: progress or results page, and progress as JSON
+  url('^job/(?P<key>[0-9a-f]+)$', 'job_page'),
+  url('^job/(?P<key>[0-9a-f]+)\.json$', 'job_status')
 )
\ No newline at end of file
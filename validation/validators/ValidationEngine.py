@@ -0,0 +1,187 @@
+from modelmanager.schemacache import compile_schema
+from lxml import etree
+from itertools import islice
+from collections import OrderedDict, namedtuple, deque
+from django.conf import settings
+import multiprocessing
+import re
+
+# How many features are sent to a worker process at a time
+BATCH_SIZE = getattr(settings, "WFS_VALIDATION_BATCH_SIZE", 200)
+
+# How many worker processes validate a streamed GetFeature response (0 validates it in
+#     the requesting process)
+PROCESSES = getattr(settings, "WFS_VALIDATION_PROCESSES", 0)
+
+#--------------------------------------------------------------------------------------
+# Class to rewrite {namespace-uri} in error messages as the prefix an element uses for
+#     that namespace. The substitution is compiled into a single regular expression,
+#     and prefixers are shared between elements with the same namespace map, so in
+#     practice it is built once per document.
+#--------------------------------------------------------------------------------------
+class NamespacePrefixer(object):
+    def __init__(self, nsmap):
+        self.prefixes = {}
+        for prefix, url in nsmap:
+            self.prefixes.setdefault(url, prefix)
+        if len(self.prefixes) > 0:
+            self.pattern = re.compile("\\{(%s)\\}" % "|".join(re.escape(url) for url in self.prefixes))
+        else:
+            self.pattern = None
+
+    def __call__(self, message):
+        if self.pattern is None: return message
+        return self.pattern.sub(lambda m: "%s:" % self.prefixes[m.group(1)], message)
+
+_prefixers = {}
+
+def prefixer_for(nsmap):
+    key = tuple(nsmap)
+    prefixer = _prefixers.get(key)
+    if prefixer is None:
+        # Namespace maps rarely vary, but don't let odd documents grow this forever
+        if len(_prefixers) > 64: _prefixers.clear()
+        prefixer = _prefixers[key] = NamespacePrefixer(nsmap)
+    return prefixer
+
+# Function to turn an XMLSchema error log into messages using the element's prefixes
+def error_messages(element, error_log):
+    prefix = prefixer_for(element.nsmap.items())
+    return [prefix(error.message) for error in error_log]
+
+#--------------------------------------------------------------------------------------
+# Class to aggregate validation errors across features. Messages are collected as each
+#     feature is validated and counted once per feature they occur on.
+#--------------------------------------------------------------------------------------
+ErrorCount = namedtuple("ErrorCount", ["message", "count"])
+
+class ErrorLog(object):
+    def __init__(self):
+        self.counts = OrderedDict()    # message -> number of features it occurred on
+
+    # Record the messages reported for one feature
+    def add(self, messages):
+        for message in OrderedDict.fromkeys(messages):
+            self.counts[message] = self.counts.get(message, 0) + 1
+
+    def __len__(self):
+        return len(self.counts)
+
+    # Distinct messages with their counts, most frequent first
+    def summary(self):
+        errors = [ErrorCount(message, count) for message, count in self.counts.items()]
+        errors.sort(key=lambda error: error.count, reverse=True)
+        return errors
+
+#--------------------------------------------------------------------------------------
+# Validation engines take an iterable of elements and yield (valid, error messages)
+#     for each one, in order. Their results() yields (element, valid, error messages)
+#     instead, for callers that stream elements and can't hold on to them.
+#     check_all() validates a list of elements at once and returns the list of
+#     (valid, error messages); callers that use it call close() when they are done.
+#
+#     SerialEngine validates in this process against an already-compiled schema. Its
+#     check() validates a single element.
+#--------------------------------------------------------------------------------------
+class SerialEngine(object):
+    def __init__(self, schema):
+        self.schema = schema
+
+    def check(self, element):
+        valid = self.schema.validate(element)
+        return valid, error_messages(element, self.schema.error_log)
+
+    def results(self, elements):
+        for element in elements:
+            valid, messages = self.check(element)
+            yield element, valid, messages
+
+    def check_all(self, elements):
+        return [ self.check(element) for element in elements ]
+
+    def close(self):
+        pass
+
+    def __call__(self, elements):
+        for element in elements:
+            yield self.check(element)
+
+#--------------------------------------------------------------------------------------
+# ParallelEngine serializes elements into batches and validates them in a pool of
+#     worker processes. Each worker compiles its own copy of the schema once, when it
+#     starts. Results come back in the order the elements were given.
+#
+#     Batches are serialized in the calling thread and only a couple per worker are
+#     queued at once, so streamed elements can be discarded as soon as they have been
+#     sent and errors reading them are raised to the caller. The elements results()
+#     yields for invalid features are parsed back from what was sent; valid ones are
+#     yielded as None. check_all() splits its elements evenly between the workers, and
+#     keeps the pool for the next call until close().
+#--------------------------------------------------------------------------------------
+_worker_schema = None
+
+def _init_worker(schema_path):
+    global _worker_schema
+    _worker_schema = compile_schema(schema_path)
+
+def _validate_batch(batch):
+    results = []
+    for xml, nsmap in batch:
+        valid = _worker_schema.validate(etree.fromstring(xml))
+        prefix = prefixer_for(nsmap)
+        results.append((valid, [prefix(error.message) for error in _worker_schema.error_log]))
+    return results
+
+class ParallelEngine(object):
+    def __init__(self, schema_path, processes=None, batch_size=BATCH_SIZE):
+        self.schema_path = schema_path
+        self.processes = processes or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.pool = None
+
+    def start(self):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes, _init_worker, (self.schema_path,))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    # Serialize elements, along with the namespace map used to report their errors
+    def batches(self, elements, batch_size=None):
+        elements = iter(elements)
+        while True:
+            batch = [(etree.tostring(element), element.nsmap.items()) for element in islice(elements, batch_size or self.batch_size)]
+            if len(batch) == 0: return
+            yield batch
+
+    def results(self, elements):
+        pool = self.start()
+        pending = deque()
+
+        def finished():
+            batch, result = pending.popleft()
+            for (xml, nsmap), (valid, messages) in zip(batch, result.get()):
+                yield None if valid else etree.fromstring(xml), valid, messages
+
+        try:
+            for batch in self.batches(elements):
+                pending.append((batch, pool.apply_async(_validate_batch, (batch,))))
+                if len(pending) > 2 * self.processes:
+                    for result in finished(): yield result
+            while pending:
+                for result in finished(): yield result
+        finally:
+            self.close()
+
+    def check_all(self, elements):
+        if len(elements) == 0: return []
+        batch_size = -(-len(elements) // self.processes)
+        return [ result for results in self.start().map(_validate_batch, list(self.batches(elements, batch_size))) for result in results ]
+
+    def __call__(self, elements):
+        for element, valid, messages in self.results(elements):
+            yield valid, messages
@@ -1,5 +1,5 @@
-import urllib2
 from lxml import etree
+import fetch
 
 class WfsBase():    
     url = None                            # The URL of the WFS GetCapabilities document, passed into class constructor
@@ -7,6 +7,11 @@ class WfsBase():
     errors = []                         # Any errors encountered during fetching and parsing of the given URL
     doc = None                            # The document returned from the given URL
     parsed_doc = None             # The document parsed by lxml and represented as an ElementTree
+    document_cache = None     # A fetch.DocumentCache to read the document through. If None, it is streamed.
+    
+    def __init__(self, url=None):
+        self.url = url
+        self.errors = []
         
     # Function to perform an HTTP request to get the document at the given URL
     def fetch_document(self):
@@ -15,15 +20,14 @@ class WfsBase():
         
         # Open the URL and return the response
         try:
-            self.doc = urllib2.urlopen(self.url)
+            if self.document_cache is not None:
+                self.doc = self.document_cache.open(self.url)
+            else:
+                self.doc = fetch.open_stream(self.url)
             return self.doc
         
-        # There was an error processing the URL
-        except urllib2.URLError, err:
-            self.errors.append({"urlError": err})
-        
-        # There was an HTTP error retrieving the document    
-        except urllib2.HTTPError, err:
+        # There was an error connecting to the server or retrieving the document
+        except fetch.FetchError, err:
             self.errors.append({"httpError": err})
         
         # Some error was encountered, set the invalid flag and return nothing
@@ -37,6 +41,7 @@ class WfsBase():
         
         # Fetch the document
         doc = self.fetch_document()
+        if doc is None: return None
 
         # Parse the document using lxml.etree and return the ElementTree
         try:
@@ -49,4 +54,36 @@ class WfsBase():
         
         # Some error was encountered, set the invalid flag and return nothing    
         self.url_is_valid = False
-        return None        
\ No newline at end of file
+        return None
+
+    # Function to stream elements with the given (optionally prefixed) name out of the
+    #     document without building the whole tree. Each element is yielded once it has
+    #     been completely parsed; when the caller asks for the next one it is cleared
+    #     and everything before it is dropped, so memory use stays flat. A file-like doc
+    #     can be given to read instead of the document at this object's URL.
+    def iter_elements(self, name, doc=None):
+        # Fetch the document
+        if doc is None: doc = self.fetch_document()
+        if doc is None: return
+
+        # Split "prefix:LocalName". Prefixes are resolved as the parser declares them.
+        prefix, local_name = name.split(":", 1) if ":" in name else (None, name)
+        namespaces = {}
+
+        for event, node in etree.iterparse(doc, events=("start-ns", "end")):
+            if event == "start-ns":
+                namespaces.setdefault(node[0], node[1])
+                continue
+
+            if prefix is None: tag = local_name
+            elif prefix in namespaces: tag = "{%s}%s" % (namespaces[prefix], local_name)
+            else: continue
+
+            if node.tag == tag:
+                yield node
+
+                # Free the element and any siblings that came before it or its ancestors
+                node.clear()
+                for this in [node] + list(node.iterancestors()):
+                    while this.getprevious() is not None:
+                        del this.getparent()[0]
@@ -1,4 +1,5 @@
 from WfsBase import WfsBase
+from fetch import capabilities_cache
 
 #--------------------------------------------------------------------------------------
 # A class representing a WFS GetCapabilities document.
@@ -8,19 +9,21 @@ from WfsBase import WfsBase
 class WfsCapabilities(WfsBase):
     version = None                    # The WFS version, parsed from the GetCapabilites document
     feature_types = []            # The names of FeatureTypes available from the WFS
+    document_cache = capabilities_cache    # GetCapabilities documents are cached by URL
     
     # Constructor function. Requires a URL passed in as a string
     def __init__(self, url):
         # Set the object's URL value
-        self.url = url
+        WfsBase.__init__(self, url)
         
         # Get a list of FeatureTypes. Any errors encountered in the process will be logged to self.errors
         self.set_feature_types()
             
     # Function to set FeatureType list according to the document at the given URL
     def set_feature_types(self):
-        # Fetch the parsed document
+        # Fetch the parsed document. Errors have been logged if there isn't one.
         parsed_doc = self.fetch_parsed_doc()
+        if parsed_doc is None: return
         
         # Determine the WFS version, drop lxml's "smart string" in this case
         self.version = parsed_doc.xpath('@version', smart_strings=False)
@@ -41,6 +44,16 @@ class WfsCapabilities(WfsBase):
         feature_type_elements = parsed_doc.xpath('//wfs:FeatureTypeList/wfs:FeatureType/wfs:Name', namespaces=ns)
         self.feature_types = [ ftype.text for ftype in feature_type_elements ]
         
+    # Whether GetFeature requests can be paged with startIndex. It is part of WFS 2.0.0, and
+    #     the common 1.1.0 servers (GeoServer, deegree, MapServer) accept it too.
+    def supports_paging(self):
+        return self.url_is_valid and self.version in ['1.1.0', '2.0.0']
+    
+    # Function to spell out the GetFeature parameters for one page of features
+    def page_params(self, start_index, count):
+        count_param = "count" if self.version == '2.0.0' else "maxfeatures"
+        return "startIndex=%s&%s=%s" % (start_index, count_param, count)
+        
     # Function to spell out a GetFeature URL given the name of a FeatureType and the number of features
     def get_feature_url(self, feature_type_name, number_of_features):
         # Return nothing if the URL is invalid
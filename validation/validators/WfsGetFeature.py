@@ -1,5 +1,24 @@
 from WfsBase import WfsBase
+from ValidationEngine import SerialEngine, ParallelEngine, ErrorLog, ErrorCount, PROCESSES
+from lxml import etree
 from lxml.etree import XPathEvalError
+from django.conf import settings
+from multiprocessing.pool import ThreadPool
+from collections import deque
+from itertools import izip, islice, count
+from StringIO import StringIO
+import fetch
+
+# How many invalid features a streaming validation keeps to show to the user
+INVALID_SAMPLE_SIZE = getattr(settings, "WFS_INVALID_SAMPLE_SIZE", 50)
+
+# Whole layers are requested PAGE_SIZE features at a time (0 turns paging off), with up to
+#     PAGE_PREFETCH pages downloading while the current one is validated
+PAGE_SIZE = getattr(settings, "WFS_PAGE_SIZE", 1000)
+PAGE_PREFETCH = getattr(settings, "WFS_PAGE_PREFETCH", 3)
+
+class PagingError(fetch.FetchError):
+    pass
 
 #--------------------------------------------------------------------------------------
 # A class representing a WFS GetFeature document.
@@ -7,16 +26,25 @@ from lxml.etree import XPathEvalError
 #     Inherits from WfsBase, which performs HTTP requests and XML parsing
 #--------------------------------------------------------------------------------------
 class WfsGetFeature(WfsBase):
-    def __init__(self, capabilities, feature_type, number_of_features):
+    def __init__(self, capabilities, feature_type, number_of_features, page_size=PAGE_SIZE, prefetch=PAGE_PREFETCH):
         # WfsCapabilites object constructs the GetFeature URL
-        self.url = capabilities.get_feature_url(feature_type, number_of_features)
+        WfsBase.__init__(self, capabilities.get_feature_url(feature_type, number_of_features))
         self.feature_type = feature_type
+        
+        # "All" features are requested a page at a time if the WFS supports it
+        self.paged = number_of_features == 99 and page_size > 0 and self.url is not None and capabilities.supports_paging()
+        self.page_size = page_size
+        self.prefetch = max(1, prefetch)
+        self.page_params = capabilities.page_params
+        self.number_matched = None
+        self.counted = False
     
     #--------------------------------------------------------------------------------------
     # Function to setup for schema validation by finding the appropriate elements and
     #     passing them to the ValidationResults class to actually perform validation
+    #     Pass processes to validate the features in that many worker processes.
     #--------------------------------------------------------------------------------------    
-    def validate(self, modelversion):
+    def validate(self, modelversion, processes=None):
         # Retrieve the GetFeature document, parsed by lxml
         parsed_doc = self.fetch_parsed_doc()
         
@@ -29,36 +57,178 @@ class WfsGetFeature(WfsBase):
         try:
             elements = parsed_doc.xpath("//%s" % self.feature_type, namespaces=ns)
         except XPathEvalError, err:
-            class FailedResult(object):
-                def __init__(self, message):
-                    self.errors = [{"message": message}]
-                    self.valid = False
-                
-                def valid_count(self):
-                    return 0
-                
             return FailedResult("%s: Looked for //%s -- %s" % (err.message, self.feature_type, ns))
         
         # Retrieve the XMLSchema object responsible for validating this ModelVersion's schema
         schema = modelversion.schema_validator()
         
+        # Choose how the elements will be validated
+        engine = ParallelEngine(modelversion.xsd_file.path, processes) if processes else None
+        
         # Perform validation on each element
-        return ValidationResults(elements, schema)
+        return ValidationResults(elements, schema, engine)
+    
+    #--------------------------------------------------------------------------------------
+    # Function to validate the GetFeature response as it is parsed. Each feature is
+    #     validated as soon as it has been read and then discarded, so memory stays flat
+    #     however many features the WFS returns. progress(validated, invalid) is called
+    #     after each feature if it is given. A compiled schema can be passed in to use
+    #     instead of the ModelVersion's shared one, and an engine with a results() method
+    #     (such as history.IncrementalEngine) to change how each feature is validated.
+    #     Without one, features are validated in WFS_VALIDATION_PROCESSES worker
+    #     processes if that setting is above 0 (IncrementalEngine does the same for the
+    #     features that have changed).
+    #--------------------------------------------------------------------------------------
+    def validate_streaming(self, modelversion, sample_size=INVALID_SAMPLE_SIZE, progress=None, schema=None, engine=None, processes=PROCESSES):
+        # Retrieve the XMLSchema object responsible for validating this ModelVersion's schema
+        if schema is None: schema = modelversion.schema_validator()
+        if engine is None and processes: engine = ParallelEngine(modelversion.xsd_file.path, processes)
+        
+        # Large layers arrive a page at a time
+        if self.paged:
+            return StreamingValidationResults(self.iter_paged_elements(), schema, sample_size, progress, engine)
+        
+        # Make sure the document can be fetched before starting to parse it
+        if self.fetch_document() is None:
+            return FailedResult("Could not retrieve %s" % self.url)
+        
+        # Perform validation on each element as it arrives
+        return StreamingValidationResults(self.iter_elements(self.feature_type), schema, sample_size, progress, engine)
+        
+    #--------------------------------------------------------------------------------------
+    # Paging. The layer is requested page_size features at a time using startIndex. Up to
+    #     prefetch pages download concurrently while the current page is validated; pages
+    #     are validated in order and each one is dropped once it is done, so no more than
+    #     prefetch + 1 pages are held at once. page_size should not be larger than the
+    #     most features the server will return in one response.
+    #--------------------------------------------------------------------------------------
+    def page_url(self, start_index):
+        return "%s&%s" % (self.url, self.page_params(start_index, self.page_size))
+    
+    # Function to ask the WFS how many features the layer has, using resultType=hits.
+    #     Returns None if the server can't say. Only the root element of the response is
+    #     read, in case the server ignores resultType and sends the features anyway.
+    def count_features(self):
+        if self.counted or not self.paged: return self.number_matched
+        self.counted = True
+        
+        try:
+            stream = fetch.open_stream("%s&resultType=hits" % self.url)
+            try:
+                for event, node in etree.iterparse(stream, events=("start",)):
+                    # WFS 2.0.0 says numberMatched, which may be "unknown"; 1.1.0 says numberOfFeatures
+                    number = node.get("numberMatched", node.get("numberOfFeatures", ""))
+                    if number.isdigit(): self.number_matched = int(number)
+                    break
+            finally:
+                stream.close()
+        except (fetch.FetchError, etree.XMLSyntaxError):
+            pass
+        
+        return self.number_matched
+    
+    # Generator of the content of each page, in order. If the number of features isn't
+    #     known, pages are requested until iteration stops.
+    def iter_pages(self):
+        total = self.count_features()
+        start_indexes = iter(xrange(0, total, self.page_size)) if total is not None else count(0, self.page_size)
+        
+        pool = ThreadPool(self.prefetch)
+        try:
+            pending = deque(pool.apply_async(fetch_page, (self.page_url(start),)) for start in islice(start_indexes, self.prefetch))
+            while len(pending) > 0:
+                page = pending.popleft()
+                
+                # Keep the window full while this page is being validated
+                for start in islice(start_indexes, 1):
+                    pending.append(pool.apply_async(fetch_page, (self.page_url(start),)))
+                yield page.get()
+        finally:
+            pool.terminate()
+    
+    # Generator of the features of every page. A page with fewer than page_size features
+    #     must be the last one: if the number of features is known, it has to end the
+    #     layer, and if it isn't, the page after it has to be empty. Otherwise the server
+    #     returns fewer features than were asked for and some would be skipped, so a
+    #     PagingError is raised, as it is if the pages don't add up to the count.
+    def iter_paged_elements(self):
+        pages = self.iter_pages()
+        first_ids = set()
+        number_read = 0
+        short_page = None
+        try:
+            for page in pages:
+                number_in_page = 0
+                for element in self.iter_elements(self.feature_type, StringIO(page)):
+                    if number_in_page == 0:
+                        # Features came after a short page, so some were left out of it
+                        if short_page is not None: raise PagingError(short_page)
+                        
+                        # A server that ignores startIndex sends the first page over and over
+                        first_id = feature_id(element)
+                        if first_id is not None and first_id in first_ids:
+                            raise PagingError("The WFS returned feature %s at the start of more than one page. It may not support startIndex." % first_id)
+                        first_ids.add(first_id)
+                    
+                    number_in_page += 1
+                    yield element
+                
+                number_read += number_in_page
+                if number_in_page < self.page_size and short_page is None:
+                    short_page = "The WFS returned %s features starting at %s, fewer than the %s asked for. WFS_PAGE_SIZE should be no more than the most features it will return at once." % (number_in_page, number_read - number_in_page, self.page_size)
+                    if self.number_matched is not None and number_read < self.number_matched: raise PagingError(short_page)
+                
+                # Without a count, the page after a short one is read to make sure it is empty
+                if number_in_page == 0: break
+        finally:
+            pages.close()
+        
+        if self.number_matched is not None and number_read != self.number_matched:
+            raise PagingError("The WFS said the layer has %s features, but returned %s." % (self.number_matched, number_read))
         
     def get_namespaces(self):
         # Retrieve the GetFeature document, parsed by lxml
         parsed_doc = self.fetch_parsed_doc()
         
 
+# Function to download one page of a paged GetFeature request. Runs in a worker thread.
+def fetch_page(url):
+    return fetch.get(url).content
+
+# The gml:id (or GML 2 fid) of a feature, if it has one
+def feature_id(element):
+    for name, value in element.attrib.items():
+        if name == "fid" or name.endswith("}id"): return value
+    return None
+
+#--------------------------------------------------------------------------------------
+# Stand-in for a validation result when validation could not be performed at all
+#--------------------------------------------------------------------------------------
+class FailedResult(object):
+    def __init__(self, message):
+        self.errors = [ErrorCount(message, 0)]
+        self.valid = False
+    
+    def valid_count(self):
+        return 0
+    
+    def invalid_count(self):
+        return 0
+    
+    def invalid_results(self):
+        return []
+
 #--------------------------------------------------------------------------------------
 # Class to perform schema validation for each element in a wfs:FeatureCollection
 #--------------------------------------------------------------------------------------
 class ValidationResults():
     # Constructor function requires a set of elements to validate and a schema
-    #     to validate them against.
-    def __init__(self, elements, schema):
+    #     to validate them against. An engine from ValidationEngine may be given to
+    #     change how validation is carried out; by default it runs serially.
+    def __init__(self, elements, schema, engine=None):
         self.results = []
         self.errors = []
+        self.error_log = ErrorLog()
         self.valid = True
         self.bad_elements = []
 
@@ -69,19 +239,15 @@ class ValidationResults():
         if self.number_of_elements == 0:
             self.valid = False
             
-            # A little class to mimic the error objects that lxml would spit out
-            class Error(object):
-                def __init__(self, message):
-                    self.message = message
-            
             # Append an error to the array and drop out of the function        
-            self.errors.append(Error("No elements were validated."))
+            self.errors.append(ErrorCount("No elements were validated.", 0))
             return
         
-        # Otherwise, loop through elements
-        for element in elements:
-            # Validate each element
-            valid = schema.validate(element)
+        # Otherwise, validate each element
+        if engine is None: engine = SerialEngine(schema)
+        
+        # Loop through elements and their validation results
+        for element, (valid, messages) in izip(elements, engine(elements)):
             
             # Mark the entire result invalid if any one element fails
             if not valid: self.valid = False
@@ -92,17 +258,11 @@ class ValidationResults():
                     "element": element                                     
                 })
                 
-            # Grab any errors from the etree.XMLSchema object
-            def replacements(error):
-                message = error.message
-                for prefix, url in element.nsmap.items():
-                    message = message.replace("{%s}" % url, "%s:" % prefix)
-                return message
-
-            self.errors = map(replacements, schema.error_log)
+            # Add any errors reported for this element to the log
+            if not valid: self.error_log.add(messages)
 
-        # De-duplicate the error log
-        self.deduplicate_errors()
+        # Distinct errors, with the number of elements each one occurred on
+        self.errors = self.error_log.summary()
             
     # Function to count the number of valid elements
     def valid_count(self):
@@ -115,7 +275,75 @@ class ValidationResults():
     # Function to return the invalid elements
     def invalid_elements(self):
         return filter(lambda result: not result['valid'], self.results)
+    
+    # Function to return the invalid elements serialized for display
+    def invalid_results(self):
+        return [etree.tostring(bad["element"], pretty_print=True) for bad in self.invalid_elements()]
 
-    # Function to remove duplicate errors from the log
-    def deduplicate_errors(self):
-        self.errors = set(self.errors)
\ No newline at end of file
+#--------------------------------------------------------------------------------------
+# Class to perform schema validation on a stream of elements, such as the one produced
+#     by WfsBase.iter_elements. Only counters, the distinct error messages and a bounded
+#     sample of invalid features are kept; the elements themselves are not retained.
+#     progress, if given, is called with the running valid and invalid counts. Elements
+#     are checked by a SerialEngine unless another engine is given.
+#--------------------------------------------------------------------------------------
+class StreamingValidationResults():
+    def __init__(self, elements, schema, sample_size=INVALID_SAMPLE_SIZE, progress=None, engine=None):
+        self.errors = []
+        self.error_log = ErrorLog()
+        self.valid = True
+        self.complete = True    # Whether the whole response was read
+        self.number_of_elements = 0
+        self.number_valid = 0
+        self.invalid_samples = []
+        if engine is None: engine = SerialEngine(schema)
+        
+        try:
+            # Validate each element
+            for element, valid, messages in engine.results(elements):
+                self.number_of_elements += 1
+                
+                if valid:
+                    self.number_valid += 1
+                else:
+                    # Mark the entire result invalid if any one element fails
+                    self.valid = False
+                    self.error_log.add(messages)
+                    
+                    # Hang on to a limited number of invalid elements to show the user
+                    if element is not None and len(self.invalid_samples) < sample_size:
+                        self.invalid_samples.append(etree.tostring(element, pretty_print=True))
+                
+                if progress is not None: progress(self.number_of_elements, self.invalid_count())
+        
+        # The response stopped being well-formed part way through
+        except etree.XMLSyntaxError, err:
+            self.valid = False
+            self.complete = False
+            self.errors.append(ErrorCount("The GetFeature response could not be parsed: %s" % err, 0))
+        
+        # A page of a paged response could not be retrieved
+        except fetch.FetchError, err:
+            self.valid = False
+            self.complete = False
+            self.errors.append(ErrorCount("The GetFeature response could not be retrieved: %s" % err, 0))
+        
+        # If no elements were found, the result is not valid
+        if self.number_of_elements == 0:
+            self.valid = False
+            self.errors.append(ErrorCount("No elements were validated.", 0))
+        
+        # Distinct errors, with the number of elements each one occurred on
+        self.errors.extend(self.error_log.summary())
+    
+    # Function to count the number of valid elements
+    def valid_count(self):
+        return self.number_valid
+    
+    # Function to count the number of invalid elements
+    def invalid_count(self):
+        return self.number_of_elements - self.number_valid
+    
+    # Function to return the sample of invalid elements serialized for display
+    def invalid_results(self):
+        return self.invalid_samples
\ No newline at end of file
@@ -1,3 +1,5 @@
 from wfs import validate_wfs_form
 from cm import validate_cm_form
-from cm import download_csv
\ No newline at end of file
+from cm import download_csv
+from jobs import job_page, job_status
+from batch import validate_wfs_batch
\ No newline at end of file
@@ -0,0 +1,265 @@
+from modelmanager.models import ModelVersion
+from modelmanager.schemacache import validator_cache
+from WfsCapabilities import WfsCapabilities
+from WfsGetFeature import WfsGetFeature
+from history import IncrementalEngine, INCREMENTAL
+import jobs
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.utils.crypto import constant_time_compare
+from multiprocessing.pool import ThreadPool
+from urlparse import urlparse
+import csv
+import json
+import threading
+
+#--------------------------------------------------------------------------------------
+# Batch validation of many WFS services. A manifest lists (capabilities URL, feature
+#     type, content model label, version) entries, which are validated concurrently.
+#     No more than HOST_CONCURRENCY requests are made to any one host at a time.
+#--------------------------------------------------------------------------------------
+WORKERS = getattr(settings, "WFS_BATCH_WORKERS", 8)
+HOST_CONCURRENCY = getattr(settings, "WFS_BATCH_HOST_CONCURRENCY", 2)
+
+# Scripts can queue batches with an "Authorization: Token <API_TOKEN>" header, if one is set
+API_TOKEN = getattr(settings, "WFS_BATCH_API_TOKEN", None)
+
+MANIFEST_FIELDS = ["url", "feature_type", "model", "version", "number_of_features"]
+REPORT_FIELDS = ["url", "feature_type", "model", "version", "status", "valid_features", "invalid_features", "unchanged_features", "errors", "get_feature_url"]
+
+class ManifestError(Exception):
+    pass
+
+#--------------------------------------------------------------------------------------
+# One line of a manifest. number_of_features defaults to 99, which means "All".
+#--------------------------------------------------------------------------------------
+class BatchEntry(object):
+    def __init__(self, url, feature_type, model, version, number_of_features=99):
+        self.url = url
+        self.feature_type = feature_type
+        self.model = model
+        self.version = version
+        try:
+            self.number_of_features = int(number_of_features or 99)
+        except ValueError:
+            raise ManifestError("number_of_features must be a number, not %s" % number_of_features)
+
+    @classmethod
+    def from_dict(cls, entry):
+        missing = [ field for field in MANIFEST_FIELDS[:4] if not entry.get(field) ]
+        if len(missing) > 0:
+            raise ManifestError("Manifest entry %s is missing %s" % (json.dumps(entry), ", ".join(missing)))
+        return cls(*[ entry.get(field) for field in MANIFEST_FIELDS ])
+
+    # The start of a report row for this entry
+    def report(self, status, **details):
+        row = dict((field, getattr(self, field)) for field in MANIFEST_FIELDS[:4])
+        row.update({"status": status, "valid_features": 0, "invalid_features": 0, "unchanged_features": 0, "errors": [], "get_feature_url": None})
+        row.update(details)
+        return row
+
+#--------------------------------------------------------------------------------------
+# Read a manifest: a JSON list of objects (or {"entries": [...]}), or a CSV file with a
+#     header row naming the MANIFEST_FIELDS
+#--------------------------------------------------------------------------------------
+def read_manifest(content, format="json"):
+    if format == "csv":
+        entries = list(csv.DictReader(content.splitlines()))
+    else:
+        try:
+            entries = json.loads(content)
+        except ValueError, err:
+            raise ManifestError("The manifest is not valid JSON: %s" % err)
+        if isinstance(entries, dict): entries = entries.get("entries", [])
+
+    if not isinstance(entries, list):
+        raise ManifestError("The manifest should be a list of entries")
+    return [ BatchEntry.from_dict(entry) for entry in entries ]
+
+#--------------------------------------------------------------------------------------
+# Write a report, as JSON or as CSV. In CSV the errors are joined into one column.
+#--------------------------------------------------------------------------------------
+def write_report(rows, output, format="json"):
+    if format == "csv":
+        writer = csv.DictWriter(output, REPORT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            flat = dict(row)
+            flat["errors"] = "; ".join(
+                "%s (%s)" % (error["message"], error["count"]) if error["count"] else error["message"]
+                for error in row["errors"]
+            )
+            writer.writerow(dict((key, unicode(value).encode("utf-8") if value is not None else "") for key, value in flat.items()))
+    else:
+        json.dump(rows, output, indent=2)
+
+#--------------------------------------------------------------------------------------
+# Class that runs the entries of a manifest. GetCapabilities documents are fetched once
+#     per URL and compiled schemas are reused between entries. lxml validators keep
+#     their error log on the object, so each worker thread has its own compiled copy
+#     (see schemacache.ThreadLocalValidatorCache).
+#--------------------------------------------------------------------------------------
+class BatchValidation(object):
+    def __init__(self, entries, workers=WORKERS, host_concurrency=HOST_CONCURRENCY, incremental=INCREMENTAL):
+        self.entries = entries
+        self.workers = max(1, workers)
+        self.host_concurrency = max(1, host_concurrency)
+        self.incremental = incremental    # Whether unchanged features are skipped (see history.py)
+        self.capabilities = {}     # URL -> (lock, [WfsCapabilities] once it has been fetched)
+        self.host_slots = {}       # host -> BoundedSemaphore
+        self.lock = threading.Lock()
+        self.modelversions = {}
+
+    # Validate every entry and return the report rows, in manifest order.
+    #     progress(entries done, entries not valid) is called as entries finish.
+    def run(self, progress=None):
+        self.modelversions = self.load_modelversions()
+        rows = []
+        failed = 0
+
+        pool = ThreadPool(min(self.workers, max(1, len(self.entries))))
+        try:
+            for row in pool.imap(self.run_entry, self.entries):
+                rows.append(row)
+                if row["status"] != "valid": failed += 1
+                if progress is not None: progress(len(rows), failed)
+        finally:
+            pool.close()
+            pool.join()
+        return rows
+
+    # Look up every ModelVersion named in the manifest in one query
+    def load_modelversions(self):
+        labels = set(entry.model for entry in self.entries)
+        versions = ModelVersion.objects.filter(content_model__label__in=labels).select_related('content_model')
+        return dict(((mv.content_model.label, mv.version), mv) for mv in versions)
+
+    # Limit concurrent requests to one host
+    def host_slot(self, url):
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.host_concurrency)
+            return self.host_slots[host]
+
+    # The capabilities of a WFS, fetched by whichever entry needs them first. Returns
+    #     (lock, capabilities); hold the lock while using the parsed document.
+    def get_capabilities(self, url):
+        with self.lock:
+            if url not in self.capabilities:
+                self.capabilities[url] = (threading.Lock(), [])
+            lock, loaded = self.capabilities[url]
+
+        with lock:
+            if len(loaded) == 0:
+                with self.host_slot(url):
+                    loaded.append(WfsCapabilities(url))
+        return lock, loaded[0]
+
+    # A compiled schema for this worker thread
+    def schema(self, modelversion):
+        return validator_cache.get(modelversion)
+
+    # Validate an entry on a worker thread. Each thread has its own database connection,
+    #     which is closed rather than left open when the pool's threads exit.
+    def run_entry(self, entry):
+        try:
+            return self.validate_entry(entry)
+        finally:
+            if self.incremental: connection.close()
+
+    def validate_entry(self, entry):
+        modelversion = self.modelversions.get((entry.model, entry.version))
+        if modelversion is None:
+            return entry.report("error", errors=[{"message": "No version %s of content model %s" % (entry.version, entry.model), "count": 0}])
+
+        try:
+            lock, capabilities = self.get_capabilities(entry.url)
+            with lock:
+                if not capabilities.url_is_valid:
+                    return entry.report("error", errors=[{"message": "Could not read the GetCapabilities document: %s" % capabilities.errors, "count": 0}])
+                if entry.feature_type not in capabilities.feature_types:
+                    return entry.report("error", errors=[{"message": "The WFS does not provide %s" % entry.feature_type, "count": 0}])
+                # Pages are not prefetched, so an entry makes one request at a time within its host slot
+                get_feature = WfsGetFeature(capabilities, entry.feature_type, entry.number_of_features, prefetch=1)
+
+            schema = self.schema(modelversion)
+            engine = IncrementalEngine(schema, modelversion, get_feature.url, entry.feature_type) if self.incremental else None
+            with self.host_slot(get_feature.url):
+                result = get_feature.validate_streaming(modelversion, schema=schema, engine=engine)
+            if engine is not None: engine.finish(result)
+
+        except Exception, err:
+            return entry.report("error", errors=[{"message": "%s: %s" % (err.__class__.__name__, err), "count": 0}])
+
+        return entry.report(
+            "valid" if result.valid else "invalid",
+            valid_features=result.valid_count(),
+            invalid_features=result.invalid_count(),
+            unchanged_features=engine.unchanged if engine is not None else 0,
+            errors=[ error._asdict() for error in result.errors ],
+            get_feature_url=get_feature.url
+        )
+
+#--------------------------------------------------------------------------------------
+# The background job for a batch, and its report. The report is JSON unless the job
+#     page is requested with ?format=csv.
+#--------------------------------------------------------------------------------------
+def run_batch(progress, entries):
+    progress(0, 0, len(entries), force=True)
+    rows = BatchValidation(entries).run(progress)
+    progress(len(rows), len([ row for row in rows if row["status"] != "valid" ]), force=True)
+    return rows
+
+def render_batch_report(req, job, rows):
+    format = req.GET.get("format", "json")
+    response = HttpResponse(mimetype="text/csv" if format == "csv" else "application/json")
+    write_report(rows, response, format)
+    return response
+
+jobs.register('batch', render_batch_report)
+
+#--------------------------------------------------------------------------------------
+# View function for /validate/batch. POST a manifest (JSON, or CSV with a text/csv
+#     Content-Type) to queue a batch; the response says where to poll for progress
+#     and where the report will be. Batches make many requests to other servers, so
+#     they can only be queued by staff users, with the usual CSRF protection, or with
+#     the API token, which is exempt from it.
+#--------------------------------------------------------------------------------------
+def token_authorized(req):
+    if not API_TOKEN: return False
+    scheme, _, token = req.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    return scheme.lower() == "token" and constant_time_compare(token.strip(), API_TOKEN)
+
+@csrf_exempt
+def validate_wfs_batch(req):
+    if token_authorized(req):
+        return queue_batch(req)
+    return staff_batch(req)
+
+@csrf_protect
+def staff_batch(req):
+    if not (req.user.is_active and req.user.is_staff):
+        return HttpResponseForbidden("Batches can only be queued by staff users.", mimetype="text/plain")
+    return queue_batch(req)
+
+def queue_batch(req):
+    if req.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    format = "csv" if req.META.get("CONTENT_TYPE", "").startswith("text/csv") else "json"
+    try:
+        entries = read_manifest(req.body, format)
+    except ManifestError, err:
+        return HttpResponseBadRequest(str(err), mimetype="text/plain")
+
+    job = jobs.submit('batch', "Batch of %s WFS validations" % len(entries), run_batch, entries)
+    response = HttpResponse(json.dumps({
+        "id": job.key,
+        "status": jobs.job_status_url(job),
+        "report": jobs.job_url(job)
+    }), mimetype="application/json", status=202)
+    response["Location"] = jobs.job_url(job)
+    return response
@@ -0,0 +1,89 @@
+from modelmanager.models import ContentModel, ModelVersion
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+import logging
+import threading
+import time
+import usginmodels
+
+# Seconds before the catalog is reloaded from usginmodels
+CATALOG_TTL = getattr(settings, "CSV_CATALOG_TTL", 60 * 60)
+
+logger = logging.getLogger(__name__)
+
+#--------------------------------------------------------------------------------------
+# An index of the usginmodels catalog: version URIs by (model title, version number)
+#     and the sorted names of every layer, built in one pass over the models.
+#--------------------------------------------------------------------------------------
+class LayerCatalog(object):
+    def __init__(self, models):
+        self.uris = {}    # (model title, version number) -> version URI
+        names = set()
+
+        for model in models:
+            for version in model.versions:
+                self.uris[(model.title, version.version)] = version.uri
+                for layer in version.layers:
+                    names.add(layer.layer_name)
+
+        self.layer_names = sorted(names)
+        self.layer_choices = [ (name, name) for name in self.layer_names ]
+        self.built = time.time()
+
+    # The URI of a version of a model, or None if usginmodels doesn't know it
+    def version_uri(self, title, version):
+        return self.uris.get((title, version))
+
+#--------------------------------------------------------------------------------------
+# The process-wide catalog. It is rebuilt once it is older than CATALOG_TTL, or after
+#     a ContentModel or ModelVersion is saved or deleted. If usginmodels can't be
+#     refreshed the catalog that was already loaded keeps being used. Refreshing
+#     fetches the models over the network, so it is done by one thread at a time
+#     without holding the lock, and other threads keep getting the old catalog until
+#     the new one is ready.
+#--------------------------------------------------------------------------------------
+_catalog = None
+_stale = False
+_refreshing = False
+_lock = threading.Lock()
+
+def catalog():
+    global _catalog, _stale, _refreshing
+    with _lock:
+        if _catalog is not None and (_refreshing or not _stale and time.time() - _catalog.built < CATALOG_TTL):
+            return _catalog
+        first = _catalog is None
+        _refreshing = True
+
+        # A change made while the catalog is being rebuilt marks it stale again
+        _stale = False
+
+    try:
+        # usginmodels loads its models when it is imported, so the first build doesn't need a refresh
+        if not first:
+            try:
+                usginmodels.refresh()
+            except Exception:
+                logger.exception("Could not refresh the usginmodels catalog")
+
+        rebuilt = LayerCatalog(usginmodels.get_models())
+    except Exception:
+        with _lock:
+            _refreshing = False
+            _stale = True
+        raise
+
+    with _lock:
+        _catalog = rebuilt
+        _refreshing = False
+        return _catalog
+
+def forget_catalog(sender=None, instance=None, **kwargs):
+    global _stale
+    with _lock:
+        _stale = True
+
+post_save.connect(forget_catalog, sender=ContentModel)
+post_save.connect(forget_catalog, sender=ModelVersion)
+post_delete.connect(forget_catalog, sender=ContentModel)
+post_delete.connect(forget_catalog, sender=ModelVersion)
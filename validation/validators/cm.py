@@ -1,10 +1,20 @@
 from modelmanager.models import ContentModel, ModelVersion
 from django import forms
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse, HttpResponseNotModified, Http404
 from django.shortcuts import render
-import csv
+from django.utils.http import quote_etag
+from django.utils.cache import patch_vary_headers
+from modelmanager.compression import preferred_encoding
+from modelmanager.feedcache import not_modified, matching_etag
 import usginmodels
-import io
+import logging
+import os
+import jobs
+from csvstream import save_upload, count_lines, validate_csv_file, UnreadableCsv
+from csvstore import save_output, open_output, chunks, gzip_chunks
+from catalog import catalog
+
+logger = logging.getLogger(__name__)
 
 
 # def get_feature_types():
@@ -19,18 +29,9 @@ class UploadFileForm(forms.Form):
     def __init__(self, *args, **kwargs):
         super(forms.Form, self).__init__(*args, **kwargs)
 
-        # Get a list of the all the layer names
-        layernames = []
-        models = usginmodels.get_models()
-        for model in models:
-            for version in model.versions:
-                for layer in version.layers:
-                    if layer.layer_name not in layernames:
-                        layernames.append(layer.layer_name)
-        layernames = sorted(layernames)
-
-        # layernames = get_feature_types()
-        self.fields['feature_type'] = forms.ChoiceField(choices= [(typename, typename) for typename in layernames],             widget=forms.Select(attrs={'class':'span5'})
+        # The layer names come from the cached usginmodels catalog
+        self.fields['feature_type'] = forms.ChoiceField(choices=catalog().layer_choices,
+            widget=forms.Select(attrs={'class':'span5'})
         )
 
     file  = forms.FileField()
@@ -44,6 +45,78 @@ class UploadFileForm(forms.Form):
     # feature_type = forms.ChoiceField()
 
 
+# usginmodels doesn't know the version that was chosen
+class UnknownVersion(Exception):
+    pass
+
+#--------------------------------------------------------------------------------------
+# The background job for a CSV validation. Takes the uploaded file's name and the path
+#     it was saved to (see csvstream.save_upload), which is removed when the job is done.
+#     Corrected rows are kept in the csvstore; the context for the results page, which
+#     is stored as JSON, just refers to them by token.
+#--------------------------------------------------------------------------------------
+def validate_csv(progress, filename, upload_path, content_model_title, version_number, feature_type):
+    try:
+        if filename.endswith(".csv"):
+            # The header row is row 0
+            progress(0, 0, max(count_lines(upload_path) - 1, 0), force=True)
+
+            uri = catalog().version_uri(content_model_title, version_number)
+
+            try:
+                if uri is None:
+                    raise UnknownVersion("Unknown model/version: %s %s" % (content_model_title, version_number))
+
+                layer = usginmodels.get_layer(uri, feature_type)
+                validator, output = validate_csv_file(upload_path, layer, progress)
+                try:
+                    progress(validator.rows, validator.invalid_rows, force=True)
+
+                    valid = validator.valid
+                    messages = validator.messages()
+                    token = save_output(output) if validator.complete else None
+                finally:
+                    output.close()
+
+            except (UnknownVersion, UnreadableCsv), err:
+                valid = False
+                messages = str(err)
+                token = None
+
+            except (usginmodels.InvalidUri, usginmodels.InvalidLayer):
+                valid = False
+                messages = "Invalid Layer"
+                token = None
+
+            # Anything else is a bug here, not a problem with the user's file
+            except Exception:
+                logger.exception("Could not validate %s against %s %s", filename, content_model_title, version_number)
+                valid = False
+                messages = "The file could not be validated because of an error on the server."
+                token = None
+
+        else:
+            valid = False
+            messages = "Only CSV files may be validated."
+            token = None
+
+    finally:
+        if upload_path is not None: os.remove(upload_path)
+
+    return {
+        "valid": valid,
+        "messages": messages,
+        "complete": token is not None,
+        "token": token,
+        "filepath": filename
+    }
+
+def render_cm_results(req, job, result):
+    # Render the results as HTML
+    return render(req, 'validation/cm-results-bootstrap.html', result)
+
+jobs.register('cm', render_cm_results)
+
 #--------------------------------------------------------------------------------------
 # Here is the actual view function for /validate/cm
 #--------------------------------------------------------------------------------------
@@ -54,82 +127,45 @@ def validate_cm_form(req):
 
             uploadFile = req.FILES['file']
 
-
-            if uploadFile.name.endswith(".csv"):
-
-                try:
-                    fileCSV = io.StringIO(unicode(uploadFile.read()), newline=None)
-
-                except:
-                    valid = False
-                    messages = "Unable to read the CSV file. Check the file for invalid characters."
-                    datastr = None
-
-                else:
-                    models = usginmodels.get_models()
-
-                    for m in models:
-                        if m.title == form.cleaned_data["content_model"].title:
-                            for v in m.versions:
-                                if v.version == form.cleaned_data["version"].version:
-                                    uri = v.uri
-                                    break
-
-                    try:
-                        valid, messages, dataCorrected, long_fields, srs = usginmodels.validate_file(
-                            fileCSV,
-                            uri,
-                            form.cleaned_data["feature_type"]
-                        )
-
-                        # Original Working
-                        # csvstr = ""
-                        # for line in uploadFile:
-                        #     csvstr += str(line)
-
-                        datastr = ""
-                        for line in dataCorrected:
-                            for ele in line:
-                                datastr += "\"" + str(ele) + "\","
-                            datastr += "\r\n"
-
-                    except:
-                        valid = False
-                        messages = "Invalid Layer"
-                        datastr = None
-
-            else:
-                valid = False
-                messages = "Only CSV files may be validated."
-                datastr = None
-
-            context = {
-                "valid": valid,
-                "messages": messages,
-                "dataCorrected": datastr,
-                "filepath": uploadFile.name
-            }
-            # Render the results as HTML
-            return render(req, 'validation/cm-results-bootstrap.html', context)
+            # The upload only lasts as long as the request, so copy it to disk for the job
+            upload_path = save_upload(uploadFile) if uploadFile.name.endswith(".csv") else None
+            job = jobs.submit('cm', uploadFile.name, validate_csv,
+                uploadFile.name,
+                upload_path,
+                form.cleaned_data["content_model"].title,
+                form.cleaned_data["version"].version,
+                form.cleaned_data["feature_type"]
+            )
+            return jobs.redirect_to_job(job)
     else:
         form = UploadFileForm()
     return render(req, 'validation/cm-form-bootstrap.html', { 'form': form })
 
 
-def download_csv(req):
-
-    dataCorrected = req.POST['new_data']
+#--------------------------------------------------------------------------------------
+# View function for /validate/dl_csv/<token>. Streams corrected output from the
+#     csvstore, gzip-compressed for clients that accept it. The token is a digest of
+#     the contents, so it makes a good strong ETag; the gzip variant gets "-gzip"
+#     appended to it, as in feedcache.conditional_response.
+#--------------------------------------------------------------------------------------
+def download_csv(req, token):
+    stored = open_output(token)
+    if stored is None:
+        raise Http404
+
+    if req.method in ("GET", "HEAD") and not_modified(req, token):
+        stored.close()
+        response = HttpResponseNotModified()
+        response['ETag'] = quote_etag(matching_etag(req, token))
+    elif preferred_encoding(req, ["gzip"]) == "gzip":
+        response = StreamingHttpResponse(gzip_chunks(stored), content_type='text/csv')
+        response['Content-Encoding'] = 'gzip'
+        response['ETag'] = quote_etag("%s-gzip" % token)
+    else:
+        response = StreamingHttpResponse(chunks(stored), content_type='text/csv')
+        response['Content-Length'] = str(os.fstat(stored.fileno()).st_size)
+        response['ETag'] = quote_etag(token)
 
-    # Create the HttpResponse object with the appropriate CSV header.
-    response = HttpResponse(content_type='text/csv')
+    patch_vary_headers(response, ['Accept-Encoding'])
     response['Content-Disposition'] = 'attachment; filename="CorrectedData.csv"'
-
-    # This is really dumb
-    dataCorrected = str(dataCorrected).splitlines()
-    usgincsvreader = csv.reader(dataCorrected, delimiter=',', quotechar='"')
-    usgincsvwriter = csv.writer(response, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    usgincsvwriter.writerows(usgincsvreader)
-
-    response.close()
-
-    return response
\ No newline at end of file
+    return response
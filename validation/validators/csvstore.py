@@ -0,0 +1,99 @@
+from django.conf import settings
+from os import path
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+
+#--------------------------------------------------------------------------------------
+# Corrected CSV output is kept on the server under a token, the SHA-1 of its contents,
+#     so the results page only needs to hand the browser a link. Files are removed
+#     CSV_OUTPUT_TTL seconds after they were last stored.
+#--------------------------------------------------------------------------------------
+STORE_DIR = getattr(settings, "CSV_OUTPUT_DIR", path.join(tempfile.gettempdir(), "modelmanager-csv"))
+TTL = getattr(settings, "CSV_OUTPUT_TTL", 60 * 60 * 24)
+CHUNK_SIZE = 64 * 1024
+
+TOKEN = re.compile("^[0-9a-f]{40}$")
+
+def output_path(token):
+    return path.join(STORE_DIR, "%s.csv" % token)
+
+#--------------------------------------------------------------------------------------
+# Copy a file-like object into the store and return its token. Storing the same
+#     content again reuses the token and restarts its TTL.
+#--------------------------------------------------------------------------------------
+def save_output(output):
+    if not path.isdir(STORE_DIR):
+        try:
+            os.makedirs(STORE_DIR)
+        except OSError:
+            if not path.isdir(STORE_DIR): raise
+
+    sha1 = hashlib.sha1()
+    handle, part_path = tempfile.mkstemp(suffix=".part", dir=STORE_DIR)
+    with os.fdopen(handle, "wb") as f:
+        for chunk in iter(lambda: output.read(CHUNK_SIZE), b""):
+            sha1.update(chunk)
+            f.write(chunk)
+
+    # Renaming replaces any existing copy atomically
+    token = sha1.hexdigest()
+    os.rename(part_path, output_path(token))
+
+    remove_expired()
+    return token
+
+# Open stored output for reading. Returns None for unknown or expired tokens.
+def open_output(token):
+    if not TOKEN.match(token or ""): return None
+    try:
+        stored = open(output_path(token), "rb")
+    except IOError:
+        return None
+    if time.time() - os.fstat(stored.fileno()).st_mtime > TTL:
+        stored.close()
+        return None
+    return stored
+
+#--------------------------------------------------------------------------------------
+# Remove stored output older than the TTL. Runs at most once per interval, from
+#     whichever request happens to store output.
+#--------------------------------------------------------------------------------------
+_last_cleanup = 0
+_cleanup_lock = threading.Lock()
+
+def remove_expired(interval=60 * 10):
+    global _last_cleanup
+    with _cleanup_lock:
+        if time.time() - _last_cleanup < interval: return
+        _last_cleanup = time.time()
+
+    for name in os.listdir(STORE_DIR):
+        file_path = path.join(STORE_DIR, name)
+        try:
+            if time.time() - path.getmtime(file_path) > TTL:
+                os.remove(file_path)
+        except OSError:
+            pass    # Already removed by another process
+
+#--------------------------------------------------------------------------------------
+# Generators that read stored output in chunks, as-is or gzip-compressed, for
+#     StreamingHttpResponse. They close the file when they are done.
+#--------------------------------------------------------------------------------------
+def chunks(stored):
+    try:
+        for chunk in iter(lambda: stored.read(CHUNK_SIZE), b""):
+            yield chunk
+    finally:
+        stored.close()
+
+def gzip_chunks(stored):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks(stored):
+        compressed = compressor.compress(chunk)
+        if compressed: yield compressed
+    yield compressor.flush()
@@ -0,0 +1,191 @@
+from usginmodels.layer import get_primary_uri_field
+from django.conf import settings
+from collections import OrderedDict
+import csv
+import os
+import tempfile
+
+# Corrected output is kept in memory up to this many bytes, then moved to a temporary file
+SPOOL_SIZE = getattr(settings, "CSV_SPOOL_SIZE", 1024 * 1024)
+
+# Where uploads wait to be validated. None means the system's temporary directory.
+UPLOAD_DIR = getattr(settings, "CSV_UPLOAD_DIR", None)
+
+class UnreadableCsv(Exception):
+    pass
+
+#--------------------------------------------------------------------------------------
+# Copy an uploaded file to disk chunk by chunk and return its path. The caller is
+#     responsible for removing it.
+#--------------------------------------------------------------------------------------
+def save_upload(upload):
+    handle, file_path = tempfile.mkstemp(suffix=".csv", dir=UPLOAD_DIR)
+    with os.fdopen(handle, "wb") as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+    return file_path
+
+# Count the lines in a file without reading it all in, as an estimate of its rows
+def count_lines(file_path):
+    with open(file_path, "rU") as f:
+        return sum(1 for line in f)
+
+# Yield the lines of a CSV file, refusing any that are not plain ASCII
+def ascii_lines(csv_file):
+    for line in csv_file:
+        try:
+            line.decode("ascii")
+        except UnicodeDecodeError:
+            raise UnreadableCsv("Unable to read the CSV file. Check the file for invalid characters.")
+        yield line
+
+#--------------------------------------------------------------------------------------
+# Class to collect validation messages along with the rows they occurred on. Messages
+#     are formatted the way usginmodels formats them ("Rows 1-4,7 ..."), but rows are
+#     kept as ranges in a dictionary so each message costs the same however many
+#     rows there are.
+#--------------------------------------------------------------------------------------
+class MessageLog(object):
+    def __init__(self):
+        self.rows = OrderedDict()    # message -> [[first row, last row], ...]
+        self.valid = True
+        self.errors = 0              # How many times an error has been recorded
+
+    # Record a message for a row. Row -1 is the header.
+    def add(self, row_num, message):
+        if not message: return
+        if "Error" in message:
+            self.valid = False
+            self.errors += 1
+
+        row = row_num + 1
+        ranges = self.rows.get(message)
+        if ranges is None:
+            self.rows[message] = [[row, row]]
+        elif ranges[-1][1] == row:
+            pass
+        elif ranges[-1][1] + 1 == row:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+
+    def formatted(self):
+        messages = []
+        for message, ranges in self.rows.items():
+            rows_list = ",".join(str(first) if first == last else "%s-%s" % (first, last) for first, last in ranges)
+            if len(ranges) > 1 or ranges[0][0] != ranges[0][1]:
+                messages.append("Rows %s %s" % (rows_list, message))
+            else:
+                messages.append("Row %s %s" % (rows_list, message))
+        return messages
+
+# usginmodels' check_uri only needs "in" and append(); a set makes the lookups constant time
+class UsedUris(set):
+    append = set.add
+
+#--------------------------------------------------------------------------------------
+# Class to validate CSV rows against a usginmodels Layer one row at a time, writing
+#     corrected rows to an output file as it goes. Applies the same checks, in the same
+#     order, as usginmodels.Layer.validate_file, which builds everything in memory.
+#--------------------------------------------------------------------------------------
+class CsvValidator(object):
+    def __init__(self, layer):
+        # Don't include the first field (OBJECTID) or last field (Shape)
+        self.fields = layer.fields[1:][:-1]
+        self.log = MessageLog()
+        self.rows = 0
+        self.invalid_rows = 0
+        self.long_fields = {}
+        self.srs = ""
+        self.complete = False    # False if validation had to stop before the end of the file
+
+    @property
+    def valid(self):
+        return self.log.valid
+
+    def messages(self):
+        return self.log.formatted()
+
+    # Validate rows from a csv.DictReader, writing corrected rows to output.
+    #     progress(rows validated, rows with errors) is called after each row if given.
+    def validate(self, rows, output, progress=None):
+        writer = csv.writer(output, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow([f.field_name for f in self.fields])
+
+        used_uris = UsedUris()
+        primary_uri_field = get_primary_uri_field(self.fields)
+        temp_units = ""
+
+        for i, row in enumerate(rows):
+            errors_before = self.log.errors
+            row_corrected = []
+            for f in self.fields:
+
+                # Check required fields. Stop as soon as a required field is not found.
+                try:
+                    data = row[f.field_name]
+                except KeyError:
+                    if f.field_optional == False:
+                        self.log.add(-1, "Error! " + f.field_name + " is a required field but was not found in the imported file (or there is extraneous whitespace in the field name).")
+                        return self
+                    else:
+                        self.log.add(-1, "Warning! " + f.field_name + " was not found in the imported file (or there is extraneous whitespace in the field name) but this is not a required field so ignoring.")
+                        data = ""
+
+                # Check encoding of data
+                encoding_error = f.check_encoding(data)
+                self.log.add(i, encoding_error)
+
+                if not encoding_error:
+                    # Fix minor formatting issues
+                    format_error, data = f.fix_format(data)
+                    self.log.add(i, format_error)
+
+                    # Check data types
+                    type_error, data = f.validate_field(data)
+                    self.log.add(i, type_error)
+
+                    # Check URIs
+                    uri_error, data, used_uris = f.check_uri(data, primary_uri_field, used_uris)
+                    self.log.add(i, uri_error)
+
+                    # Check temperature units
+                    temp_units_error, data, temp_units = f.check_temp_units(data, temp_units)
+                    self.log.add(i, temp_units_error)
+
+                    # Check SRS
+                    srs_error, data, self.srs = f.check_srs(data, self.srs)
+                    self.log.add(i, srs_error)
+
+                    # Check Domain
+                    domain_error, data = f.check_domain(data)
+                    self.log.add(i, domain_error)
+
+                    # Check length of data
+                    self.long_fields = f.check_field_length(data, self.long_fields)
+
+                row_corrected.append(data)
+
+            writer.writerow(row_corrected)
+            self.rows += 1
+            if self.log.errors > errors_before: self.invalid_rows += 1
+            if progress is not None: progress(self.rows, self.invalid_rows)
+
+        self.complete = True
+        return self
+
+#--------------------------------------------------------------------------------------
+# Validate a CSV file on disk against a usginmodels Layer. Corrected rows are written
+#     to a spooled temporary file, which is returned along with the CsvValidator.
+#--------------------------------------------------------------------------------------
+def validate_csv_file(file_path, layer, progress=None):
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        with open(file_path, "rU") as csv_file:
+            validator = CsvValidator(layer).validate(csv.DictReader(ascii_lines(csv_file)), output, progress)
+    except:
+        # Don't leave a partly written file on disk if the CSV can't be read
+        output.close()
+        raise
+    output.seek(0)
+    return validator, output
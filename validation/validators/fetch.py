@@ -0,0 +1,112 @@
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from StringIO import StringIO
+import requests
+import threading
+import time
+
+#--------------------------------------------------------------------------------------
+# Shared HTTP layer for talking to WFS servers.
+#     Requests go through one requests.Session, which keeps a pool of persistent
+#     connections per host and transparently handles gzip/deflate responses.
+#--------------------------------------------------------------------------------------
+TIMEOUT = getattr(settings, "WFS_FETCH_TIMEOUT", 30)                  # Seconds to wait for a server
+POOL_SIZE = getattr(settings, "WFS_FETCH_POOL_SIZE", 10)              # Connections kept per host
+CAPABILITIES_TTL = getattr(settings, "WFS_CAPABILITIES_TTL", 300)     # Seconds to trust a cached document
+CAPABILITIES_CACHE_SIZE = getattr(settings, "WFS_CAPABILITIES_CACHE_SIZE", 100)
+
+class FetchError(Exception):
+    pass
+
+_session = None
+_session_lock = threading.Lock()
+
+def session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["Accept-Encoding"] = "gzip, deflate"
+        return _session
+
+#--------------------------------------------------------------------------------------
+# Function to issue a GET request, raising FetchError for connection problems, timeouts
+#     and HTTP error statuses
+#--------------------------------------------------------------------------------------
+def get(url, headers=None, stream=False, timeout=None):
+    try:
+        response = session().get(url, headers=headers or {}, stream=stream, timeout=timeout or TIMEOUT)
+    except requests.RequestException, err:
+        raise FetchError(err)
+
+    if response.status_code >= 400:
+        response.close()
+        raise FetchError("HTTP %s retrieving %s" % (response.status_code, url))
+    return response
+
+#--------------------------------------------------------------------------------------
+# Function to open a URL as a file-like stream of the (decompressed) response body.
+#     Suitable for large documents that are parsed incrementally.
+#--------------------------------------------------------------------------------------
+def open_stream(url, timeout=None):
+    response = get(url, stream=True, timeout=timeout)
+    response.raw.decode_content = True
+    return response.raw
+
+#--------------------------------------------------------------------------------------
+# Class to cache small documents (GetCapabilities) by URL. A cached document is used
+#     as-is for ttl seconds; after that it is revalidated with If-None-Match /
+#     If-Modified-Since so that an unchanged document is not downloaded again.
+#--------------------------------------------------------------------------------------
+class DocumentCache(object):
+    def __init__(self, ttl=CAPABILITIES_TTL, max_size=CAPABILITIES_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = {}    # url -> {"content", "fetched", "etag", "last_modified"}
+        self.lock = threading.Lock()
+
+    # Return the document at the URL as a string
+    def fetch(self, url, timeout=None):
+        with self.lock:
+            entry = self.entries.get(url)
+
+        if entry is not None and time.time() - entry["fetched"] < self.ttl:
+            return entry["content"]
+
+        # Ask the server whether our copy is still current
+        headers = {}
+        if entry is not None:
+            if entry["etag"]: headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]: headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            entry = dict(entry, fetched=time.time())
+        else:
+            entry = {
+                "content": response.content,
+                "fetched": time.time(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified")
+            }
+
+        with self.lock:
+            if url not in self.entries and len(self.entries) >= self.max_size:
+                # Make room by dropping the entry that was fetched longest ago
+                oldest = min(self.entries, key=lambda key: self.entries[key]["fetched"])
+                del self.entries[oldest]
+            self.entries[url] = entry
+        return entry["content"]
+
+    # Return the document at the URL as a file-like object
+    def open(self, url, timeout=None):
+        return StringIO(self.fetch(url, timeout))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+capabilities_cache = DocumentCache()
@@ -0,0 +1,186 @@
+from modelmanager.models import ValidationRun, ValidatedFeature
+from modelmanager.schemacache import file_fingerprint
+from ValidationEngine import SerialEngine, ParallelEngine, PROCESSES
+from WfsGetFeature import feature_id, INVALID_SAMPLE_SIZE
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from lxml import etree
+from itertools import islice
+import hashlib
+import json
+
+# Whether WFS validations reuse the results of features that haven't changed since the last run
+INCREMENTAL = getattr(settings, "WFS_INCREMENTAL_VALIDATION", True)
+
+# How many changed features are written to the database at a time, and how many
+#     features' stored results are looked up at a time
+FLUSH_SIZE = getattr(settings, "WFS_HISTORY_FLUSH_SIZE", 500)
+PAGE_SIZE = getattr(settings, "WFS_HISTORY_PAGE_SIZE", 500)
+
+# The key that runs and features of one GetFeature request are stored under
+def service_key(url):
+    if isinstance(url, unicode): url = url.encode("utf-8")
+    return hashlib.sha1(url).hexdigest()
+
+#--------------------------------------------------------------------------------------
+# Validation engine that remembers the features it has seen. Each feature is keyed by
+#     its gml:id (or its position if it has none) and hashed. A feature whose hash and
+#     schema fingerprint match its stored ValidatedFeature gets the stored result
+#     without being validated; the others are validated and written back in batches.
+#     Call finish() with the results once every feature has been checked.
+#
+#     Features are read page_size at a time, and only the stored results for the keys
+#     in the page are looked up. The changed features of a page are handed to another
+#     engine's check_all(): a ParallelEngine if WFS_VALIDATION_PROCESSES is above 0,
+#     otherwise a SerialEngine. Streamed elements are cleared once they have been read,
+#     so each feature is kept serialized until its page is done, and parsed again to be
+#     validated. Unchanged invalid features are only parsed again while there are
+#     fewer than sample_size of them to show; after that they are yielded as None.
+#--------------------------------------------------------------------------------------
+class IncrementalEngine(object):
+    def __init__(self, schema, modelversion, url, feature_type, flush_size=FLUSH_SIZE, page_size=PAGE_SIZE, sample_size=INVALID_SAMPLE_SIZE, engine=None, processes=PROCESSES):
+        if engine is None:
+            engine = ParallelEngine(modelversion.xsd_file.path, processes) if processes else SerialEngine(schema)
+        self.engine = engine
+        self.modelversion = modelversion
+        self.url = url
+        self.feature_type = feature_type
+        self.service_key = service_key(url)
+        self.fingerprint = file_fingerprint(modelversion.xsd_file.path)[2]
+        self.flush_size = flush_size
+        self.page_size = page_size
+        self.samples = sample_size    # Unchanged invalid features still to be parsed for display
+        self.unchanged = 0
+        self.position = 0
+        self.seen = set()
+        self.stale = []      # pks of stored features that have changed
+        self.fresh = []      # ValidatedFeatures waiting to be written
+
+    def stored_features(self):
+        return ValidatedFeature.objects.filter(service_key=self.service_key, modelversion=self.modelversion)
+
+    # A key for the feature that is unique within this run
+    def feature_key(self, element):
+        key = feature_id(element)
+        if key is None: key = "#%s" % self.position
+        elif key in self.seen: key = "%s#%s" % (key, self.position)
+        if isinstance(key, unicode): key = key.encode("utf-8")
+        if len(key) > 255: key = hashlib.sha1(key).hexdigest()
+        return key
+
+    # (key, content hash, serialized feature) for each element, read as it arrives
+    def read(self, element):
+        self.position += 1
+        key = self.feature_key(element)
+        self.seen.add(key)
+        xml = etree.tostring(element)
+        return key, hashlib.sha1(xml).hexdigest(), xml
+
+    # What the last run stored for a page of features: feature_key -> (pk, content_hash, schema_fingerprint, valid, messages)
+    def lookup(self, page):
+        rows = self.stored_features().filter(feature_key__in=[ key for key, content_hash, xml in page ])
+        return dict(
+            (row[1], (row[0],) + row[2:]) for row in
+            rows.values_list('pk', 'feature_key', 'content_hash', 'schema_fingerprint', 'valid', 'messages')
+        )
+
+    def results(self, elements):
+        elements = iter(elements)
+        try:
+            while True:
+                page = [ self.read(element) for element in islice(elements, self.page_size) ]
+                if len(page) == 0: return
+
+                known = self.lookup(page)
+                unchanged = [ key in known and known[key][1] == content_hash and known[key][2] == self.fingerprint for key, content_hash, xml in page ]
+                changed = [ etree.fromstring(xml) for (key, content_hash, xml), same in zip(page, unchanged) if not same ]
+                checked = iter(self.engine.check_all(changed))
+                changed = iter(changed)
+
+                for (key, content_hash, xml), same in zip(page, unchanged):
+                    if same:
+                        self.unchanged += 1
+                        pk, content_hash, fingerprint, valid, messages = known[key]
+                        element = None
+                        if not valid and self.samples > 0:
+                            self.samples -= 1
+                            element = etree.fromstring(xml)
+                        yield element, valid, json.loads(messages) if messages else []
+                        continue
+
+                    element = changed.next()
+                    valid, messages = checked.next()
+                    if key in known: self.stale.append(known[key][0])
+                    self.fresh.append(ValidatedFeature(
+                        modelversion=self.modelversion,
+                        service_key=self.service_key,
+                        feature_key=key,
+                        content_hash=content_hash,
+                        schema_fingerprint=self.fingerprint,
+                        valid=valid,
+                        messages=json.dumps(messages) if messages else ""
+                    ))
+                    if len(self.fresh) >= self.flush_size: self.flush()
+                    yield element, valid, messages
+        finally:
+            self.engine.close()
+
+    # Write changed features to the database. Another run against the same service
+    #     may have stored some of them since they were looked up, in which case they
+    #     are written one at a time, over whatever that run stored.
+    def flush(self):
+        try:
+            with transaction.commit_on_success():
+                forget_features(self.stale)
+                ValidatedFeature.objects.bulk_create(self.fresh)
+        except IntegrityError:
+            for feature in self.fresh: self.store(feature)
+        self.stale, self.fresh = [], []
+
+    def store(self, feature):
+        values = dict((name, getattr(feature, name)) for name in ['content_hash', 'schema_fingerprint', 'valid', 'messages'])
+        for attempt in range(2):
+            try:
+                with transaction.commit_on_success():
+                    if self.stored_features().filter(feature_key=feature.feature_key).update(**values) == 0:
+                        feature.save(force_insert=True)
+                return
+            except IntegrityError:
+                # Inserted by the other run in the meantime; the second attempt updates it
+                feature.pk = None
+
+    # Store the remaining features and record the run. Features that are no longer
+    #     served are forgotten, but only if the whole response was read.
+    def finish(self, result):
+        self.flush()
+        if getattr(result, "complete", False):
+            with transaction.commit_on_success():
+                forget_features(self.unseen_features())
+        self.seen = set()
+
+        return ValidationRun.objects.create(
+            modelversion=self.modelversion,
+            service_key=self.service_key,
+            url=self.url,
+            feature_type=self.feature_type,
+            schema_fingerprint=self.fingerprint,
+            valid=result.valid,
+            valid_count=result.valid_count(),
+            invalid_count=result.invalid_count(),
+            unchanged_count=self.unchanged,
+            errors=json.dumps([ error._asdict() for error in result.errors ])
+        )
+
+    # pks of the stored features this run didn't see, read a page at a time
+    def unseen_features(self):
+        unseen, last = [], 0
+        while True:
+            rows = list(self.stored_features().filter(pk__gt=last).order_by('pk').values_list('pk', 'feature_key')[:self.page_size])
+            if len(rows) == 0: return unseen
+            unseen.extend(pk for pk, key in rows if key not in self.seen)
+            last = rows[-1][0]
+
+# Delete ValidatedFeatures by pk, a few hundred at a time
+def forget_features(pks):
+    for start in range(0, len(pks), FLUSH_SIZE):
+        ValidatedFeature.objects.filter(pk__in=pks[start:start + FLUSH_SIZE]).delete()
@@ -0,0 +1,183 @@
+from modelmanager.models import ValidationJob
+from django.conf import settings
+from django.db import connection, transaction
+from django.core.signals import request_finished
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.shortcuts import render, get_object_or_404
+from django.utils import timezone
+from multiprocessing.pool import ThreadPool
+import json
+import logging
+import threading
+import time
+
+#--------------------------------------------------------------------------------------
+# Background validation jobs.
+#     Validation runs on a pool of threads inside the web process, so no broker or
+#     separate worker is needed. Set VALIDATION_JOB_WORKERS to 0 to run jobs in the
+#     request instead (handy for development and tests).
+#--------------------------------------------------------------------------------------
+WORKERS = getattr(settings, "VALIDATION_JOB_WORKERS", 2)
+PROGRESS_INTERVAL = getattr(settings, "VALIDATION_JOB_PROGRESS_INTERVAL", 1.0)    # Seconds between progress writes
+TIMEOUT = getattr(settings, "VALIDATION_JOB_TIMEOUT", 60 * 60 * 6)                  # Seconds before an unfinished job is given up on
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(WORKERS)
+        return _pool
+
+# Functions that render the results page of each kind of job: kind -> render(req, job, result)
+renderers = {}
+
+def register(kind, render_results):
+    renderers[kind] = render_results
+
+#--------------------------------------------------------------------------------------
+# Class passed to a job's task so it can report how far it has got. Calls are cheap;
+#     progress is only written to the database every PROGRESS_INTERVAL seconds.
+#--------------------------------------------------------------------------------------
+class Progress(object):
+    def __init__(self, job, interval=PROGRESS_INTERVAL):
+        self.job = job
+        self.interval = interval
+        self.last_write = 0
+
+    def __call__(self, processed, errors=0, total=None, force=False):
+        now = time.time()
+        if not force and now - self.last_write < self.interval:
+            return
+        self.last_write = now
+
+        changes = {"processed": processed, "error_count": errors}
+        if total is not None: changes["total"] = total
+        ValidationJob.objects.filter(pk=self.job.pk).update(**changes)
+
+#--------------------------------------------------------------------------------------
+# Create a job and queue it. task(progress, *args) performs the validation and returns
+#     JSON-serializable results for the job's renderer.
+#
+#     A worker thread can only see the job once the row creating it has committed. If
+#     the caller has a transaction open, the job is queued when the request finishes,
+#     after the transaction middleware (or the view's own transaction) has committed.
+#--------------------------------------------------------------------------------------
+_unqueued = threading.local()
+
+def submit(kind, description, task, *args):
+    job = ValidationJob.objects.create(kind=kind, description=description[:2000])
+    if WORKERS == 0:
+        run_job(job.pk, task, args)
+    elif transaction.is_managed():
+        if not hasattr(_unqueued, "jobs"): _unqueued.jobs = []
+        _unqueued.jobs.append((job.pk, task, args))
+    else:
+        pool().apply_async(run_job, (job.pk, task, args))
+    return job
+
+def queue_unqueued(sender=None, **kwargs):
+    jobs, _unqueued.jobs = getattr(_unqueued, "jobs", []), []
+    for pk, task, args in jobs:
+        pool().apply_async(run_job, (pk, task, args))
+
+request_finished.connect(queue_unqueued)
+
+# Run a queued job, recording its outcome. Nothing may escape from here: the pool
+#     would swallow it, and the job would be left queued.
+def run_job(pk, task, args):
+    try:
+        job = ValidationJob.objects.get(pk=pk)
+        job.status = ValidationJob.RUNNING
+        job.date_started = timezone.now()
+        job.save()
+
+        try:
+            result = task(Progress(job), *args)
+        except Exception, err:
+            logger.exception("Validation job %s failed", job.key)
+            job.status = ValidationJob.FAILED
+            job.message = error_message(err)
+        else:
+            job.status = ValidationJob.DONE
+            job.result = json.dumps(result)
+
+        # Pick up the last progress written by the task before saving the outcome
+        progress = ValidationJob.objects.filter(pk=pk).values("processed", "error_count", "total")[0]
+        job.processed, job.error_count, job.total = progress["processed"], progress["error_count"], progress["total"]
+        job.date_finished = timezone.now()
+        job.save()
+
+    except Exception, err:
+        logger.exception("Validation job %s could not be run", pk)
+        try:
+            ValidationJob.objects.filter(pk=pk, status__in=[ValidationJob.QUEUED, ValidationJob.RUNNING]).update(
+                status=ValidationJob.FAILED, message=error_message(err), date_finished=timezone.now())
+        except Exception:
+            logger.exception("Validation job %s could not be marked failed", pk)
+
+    finally:
+        # Pool threads outlive the job; don't leave a database connection open in them
+        if WORKERS > 0: connection.close()
+
+# An exception's message as unicode, whether it was given a byte string or unicode
+def error_message(err):
+    try:
+        message = unicode(err)
+    except UnicodeError:
+        message = str(err).decode("utf-8", "replace")
+    return message or err.__class__.__name__
+
+#--------------------------------------------------------------------------------------
+# Jobs that were queued or running when their server process stopped never finish.
+#     When a job is looked at after it has been waiting or running for longer than
+#     TIMEOUT, it is marked failed. A job that was only slow still records its outcome
+#     when it finishes.
+#--------------------------------------------------------------------------------------
+def expire_stale(job):
+    if job.finished(): return job
+    since = job.date_started or job.date_created
+    if (timezone.now() - since).total_seconds() < TIMEOUT: return job
+
+    job.status = ValidationJob.FAILED
+    job.message = "The job did not finish within %g hours." % (TIMEOUT / 3600.0)
+    job.date_finished = timezone.now()
+    ValidationJob.objects.filter(pk=job.pk, status__in=[ValidationJob.QUEUED, ValidationJob.RUNNING]).update(
+        status=job.status, message=job.message, date_finished=job.date_finished)
+    return job
+
+# The URLs of a job's page and of its progress as JSON
+def job_url(job):
+    return reverse("modelmanager.validation.validators.job_page", kwargs={"key": job.key})
+
+def job_status_url(job):
+    return reverse("modelmanager.validation.validators.job_status", kwargs={"key": job.key})
+
+# Send the browser to a job's page
+def redirect_to_job(job):
+    return HttpResponseRedirect(job_url(job))
+
+#--------------------------------------------------------------------------------------
+# View for /validate/job/<id>.json -- the job's progress as JSON, for polling
+#--------------------------------------------------------------------------------------
+def job_status(req, key):
+    job = expire_stale(get_object_or_404(ValidationJob, key=key))
+    response = HttpResponse(json.dumps(job.serialized()), mimetype="application/json")
+    response["Cache-Control"] = "no-cache"
+    return response
+
+#--------------------------------------------------------------------------------------
+# View for /validate/job/<id> -- a progress page while the job runs, then its results
+#--------------------------------------------------------------------------------------
+def job_page(req, key):
+    job = expire_stale(get_object_or_404(ValidationJob, key=key))
+    if job.status == ValidationJob.DONE:
+        render_results = renderers.get(job.kind)
+        if render_results is None: raise Http404
+        return render_results(req, job, job.result_data())
+    return render(req, "validation/job-bootstrap.html", {"job": job})
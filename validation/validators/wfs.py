@@ -1,10 +1,11 @@
 from modelmanager.models import ContentModel, ModelVersion
 from WfsCapabilities import WfsCapabilities
 from WfsGetFeature import WfsGetFeature
+from history import IncrementalEngine, INCREMENTAL
+import jobs
 from django import forms
 from django.http import HttpResponseNotAllowed
 from django.shortcuts import render
-from lxml import etree
 
 #--------------------------------------------------------------------------------------
 # A Form to gather user's input: Just the WFS URL
@@ -30,17 +31,23 @@ class WfsSelectionForm(forms.Form):
         if len(capabilities.feature_types) is 0:
             raise forms.ValidationError('The WFS you specified does not provide any FeatureTypes')
         
+        # Hang on to the parsed document so the next form doesn't have to fetch it again
+        self.capabilities = capabilities
+        return url
+        
 #--------------------------------------------------------------------------------------
 # A Form to gather user's input required to validate a WFS against some ModelVersion
 #     Note that the constructor for the form requires a URL
 #--------------------------------------------------------------------------------------
 class WfsValidationParametersForm(forms.Form):
-    # Redefine the constructor for this form to accomodate an input URL
+    # Redefine the constructor for this form to accomodate an input URL. A WfsCapabilities
+    #     object that has already been built for the URL can be passed in to be reused.
     def __init__(self, url, *args, **kwargs):
+        capabilities = kwargs.pop('capabilities', None)
         super(forms.Form, self).__init__(*args, **kwargs)
         
         # Set the feature_type field's choices to the available WFS FeatureTypes
-        self.capabilities = WfsCapabilities(url)
+        self.capabilities = capabilities or WfsCapabilities(url)
         self.fields['feature_type'].choices = [ (typename, typename) for typename in self.capabilities.feature_types ]
         
         # Set the initial URL
@@ -64,6 +71,53 @@ class WfsValidationParametersForm(forms.Form):
         )
     )
 
+#--------------------------------------------------------------------------------------
+# The background job for a WFS validation. Returns the results as a dictionary that can
+#     be stored as JSON; render_wfs_results turns it back into the results page.
+#--------------------------------------------------------------------------------------
+def validate_wfs(progress, get_feature_validator, modelversion_pk, number_of_features):
+    modelversion = ModelVersion.objects.get(pk=modelversion_pk)
+    
+    # 99 stands for "All". A paged request asks the WFS how many features there will be.
+    total = get_feature_validator.count_features() if number_of_features == 99 else number_of_features
+    progress(0, 0, total, force=True)
+    
+    # Features that haven't changed since the last run against this service are not validated again
+    schema = modelversion.schema_validator()
+    engine = IncrementalEngine(schema, modelversion, get_feature_validator.url, get_feature_validator.feature_type) if INCREMENTAL else None
+    
+    result = get_feature_validator.validate_streaming(modelversion, progress=progress, schema=schema, engine=engine)
+    if engine is not None: engine.finish(result)
+    progress(result.valid_count() + result.invalid_count(), result.invalid_count(), force=True)
+    
+    return {
+        "valid": result.valid,
+        "valid_elements": result.valid_count(),
+        "invalid_elements": result.invalid_count(),
+        "unchanged_elements": engine.unchanged if engine is not None else 0,
+        "url": get_feature_validator.url,
+        "errors": [ error._asdict() for error in result.errors ],
+        "modelversion": modelversion.pk,
+        "feature_type": get_feature_validator.feature_type,
+        "number_of_features": number_of_features,
+        "invalid_results": result.invalid_results()
+    }
+
+def render_wfs_results(req, job, result):
+    # Setup hash table for results rendering
+    context = dict(result)
+    try:
+        context["modelversion"] = ModelVersion.objects.select_related('content_model').get(pk=result["modelversion"])
+    except ModelVersion.DoesNotExist:
+        context["modelversion"] = None    # The version was deleted after the job ran
+    context["number_of_features"] = "a lot of" if result["number_of_features"] == 99 else result["number_of_features"]
+    context["wfs_base_url"] = result["url"].split('?')[0]
+    
+    # Render the results as HTML
+    return render(req, 'validation/wfs-results-bootstrap.html', context)
+
+jobs.register('wfs', render_wfs_results)
+
 #--------------------------------------------------------------------------------------
 # Here is the actual view function for /validate/wfs
 #--------------------------------------------------------------------------------------
@@ -83,29 +137,15 @@ def validate_wfs_form(req):
             
             # Check the form's validity
             if form.is_valid():
-                # Perform WFS Validation
+                # Queue the WFS Validation and send the user to its progress page
                 feature_type = form.cleaned_data['feature_type']
                 number_of_features = form.cleaned_data['number_of_features']
                 modelversion = form.cleaned_data['version']
                 get_feature_validator = WfsGetFeature(form.capabilities, feature_type, number_of_features)
-                result = get_feature_validator.validate(modelversion)
-
-                # Setup hash table for results rendering
-                context = {
-                        "valid": result.valid,
-                        "valid_elements": result.valid_count(),
-                        "invalid_elements": result.invalid_count(),
-                        "url": get_feature_validator.url,
-                        "errors": result.errors,
-                        "modelversion": modelversion,
-                        "feature_type": feature_type,
-                        "number_of_features": "a lot of" if number_of_features == 99 else number_of_features,
-                        "wfs_base_url": get_feature_validator.url.split('?')[0],
-                        "invalid_results": [etree.tostring(bad["element"], pretty_print=True) for bad in result.invalid_elements()]
-                    }
                 
-                # Render the results as HTML
-                return render(req, 'validation/wfs-results-bootstrap.html', context)
+                description = '%s from %s' % (feature_type, get_feature_validator.url)
+                job = jobs.submit('wfs', description, validate_wfs, get_feature_validator, modelversion.pk, number_of_features)
+                return jobs.redirect_to_job(job)
             
         # Otherwise it is treated as a WfsSelectionForm
         else:
@@ -115,7 +155,7 @@ def validate_wfs_form(req):
             if form.is_valid():
                 # We need to send back a WfsValidationParametersForm, which takes a URL as input
                 url = form.data['wfs_get_capabilities_url']
-                second_form = WfsValidationParametersForm(url)
+                second_form = WfsValidationParametersForm(url, capabilities=form.capabilities)
                 return render(req, 'validation/wfs-form-bootstrap.html', { 'form': second_form, 'url': url })
                 
     # A GET request should just a data-free WfsSelectionForm
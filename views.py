@@ -1,42 +1,179 @@
-from django.http import HttpResponse, Http404
-from django.shortcuts import render_to_response, render, get_object_or_404
-from models import ContentModel, ModelVersion
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
+from django.conf import settings
+from django.shortcuts import render_to_response, render
+from models import ContentModel, ModelVersion, LayerField, CatalogChange
+from feedcache import cached_feed, feed_response, conditional_response
+from labelindex import label_index
+from featurecatalog import feature_catalog_response
+from compression import ENCODINGS, preferred_encoding, sibling_path
+from django.utils.cache import patch_vary_headers
+from django.utils import timezone
+from django.utils._os import safe_join
+from django.views import static
 from datetime import datetime, date
+import hashlib
 import json
+import mimetypes
+import os
 
 #--------------------------------------------------------------------------------------
 # Query by label
+#     Labels and versions are resolved to primary keys through the in-process label
+#     index. The label is checked again on the fetched objects, in case the index
+#     is stale because the model was changed by another process.
 #--------------------------------------------------------------------------------------
-
 def model_by_label(content_model, model_version=None):
-    if model_version is not None:
-        cm = ContentModel.objects.values('id', 'label')
-        mv = ModelVersion.objects.values('id', 'content_model_id', 'version')
-        this_cm = [x for x in cm if x['label'] == content_model]
-        return [x for x in mv if x['content_model_id'] == this_cm[0]['id'] and x['version'] == model_version]
-    else:
-        cm = ContentModel.objects.values('id', 'label')
-        return [x for x in cm if x['label'] == content_model]
+    pk = label_index.lookup(content_model, model_version)
+    if pk is None: raise Http404
+    return pk
+
+# The objects of a queryset with the primary key of the labelled model or version that
+#     also meet the given conditions. Raises Http404 if there are none.
+def get_by_label(queryset, conditions, content_model, model_version=None):
+    for attempt in range(2):
+        found = list(queryset.filter(pk=model_by_label(content_model, model_version), **conditions))
+        if len(found) > 0: return found
+        label_index.forget()
+    raise Http404
 
 #--------------------------------------------------------------------------------------
 # Expose all the available ContentModels
+#     Served from the feed cache, which is refreshed whenever a model is saved. JSON
+#     requests with any of the API_PARAMS are answered by query_models instead.
 #--------------------------------------------------------------------------------------
 def get_all_models(request, extension):
-    all_models = ContentModel.objects.all()
-    return view_models(all_models, extension)
+    if extension == 'json' and any(param in request.GET for param in API_PARAMS):
+        return query_models(request)
+    all_models = ContentModel.objects.with_versions()
+    feed = cached_feed(extension, all_models, lambda contentmodels: view_models(contentmodels, extension))
+    return feed_response(request, feed)
+
+#--------------------------------------------------------------------------------------
+# The JSON catalog, a page at a time. Parameters:
+#     limit=<n>            Models per page (API_PAGE_SIZE by default, at most API_MAX_PAGE_SIZE)
+#     cursor=<id>          Continue after this model. The Link header of a page that is
+#                          not the last has the URL of the next page.
+#     label=, status=      Only models with this label or status
+#     updated_since=<date> Only models with a version created on or after this date
+#     changed_since=<n>    Only models saved, or with versions saved or deleted, after
+#                          change number n (see get_changes)
+#     fields=<names>       Only these keys, e.g. fields=title,uri,versions.version. Keys
+#                          that aren't asked for, like layers_info, aren't computed.
+#     Pages are in order of id, so they don't shift when models are added.
+#--------------------------------------------------------------------------------------
+API_PARAMS = ['limit', 'cursor', 'label', 'status', 'updated_since', 'changed_since', 'fields']
+API_PAGE_SIZE = getattr(settings, "API_PAGE_SIZE", 100)
+API_MAX_PAGE_SIZE = getattr(settings, "API_MAX_PAGE_SIZE", 1000)
+
+class ApiError(Exception):
+    pass
+
+# Split fields=title,versions.version into (model fields, version fields). None means
+#     all of them.
+def parse_fields(value):
+    if not value: return None, None
+    names = [ name.strip() for name in value.split(',') if name.strip() ]
+    fields = set(name for name in names if '.' not in name)
+    version_fields = set(name[len('versions.'):] for name in names if name.startswith('versions.'))
+    if len(version_fields) > 0: fields.add('versions')
+
+    unknown = set(name for name in names if '.' in name and not name.startswith('versions.'))
+    unknown |= (fields - set(ContentModel.SERIALIZED_FIELDS)) | (version_fields - set(ModelVersion.SERIALIZED_FIELDS))
+    if len(unknown) > 0:
+        raise ApiError("Unknown fields: %s" % ", ".join(sorted(unknown)))
+    return fields, version_fields if len(version_fields) > 0 and 'versions' not in names else None
+
+def parse_int(request, param, default):
+    try:
+        return int(request.GET.get(param, default))
+    except ValueError:
+        raise ApiError("%s must be a number" % param)
+
+def parse_date(request, param):
+    try:
+        return datetime.strptime(request.GET[param][:10], "%Y-%m-%d").date()
+    except ValueError:
+        raise ApiError("%s must be a date, like 2014-01-31" % param)
+
+# Dates and times without a zone are taken to be UTC
+def parse_datetime(request, param):
+    value = request.GET[param].replace('Z', '')
+    for format in ["%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]:
+        try:
+            parsed = datetime.strptime(value, format)
+        except ValueError:
+            continue
+        return timezone.make_aware(parsed, timezone.utc) if settings.USE_TZ else parsed
+    raise ApiError("%s must be a date and time, like 2014-01-31T12:00:00Z" % param)
+
+def query_models(request):
+    try:
+        fields, version_fields = parse_fields(request.GET.get('fields'))
+        limit = min(max(1, parse_int(request, 'limit', API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+        contentmodels = ContentModel.objects.order_by('id')
+        if 'cursor' in request.GET:
+            contentmodels = contentmodels.filter(id__gt=parse_int(request, 'cursor', 0))
+        if 'updated_since' in request.GET:
+            contentmodels = contentmodels.filter(last_updated__gte=parse_date(request, 'updated_since'))
+        if 'changed_since' in request.GET:
+            changes = CatalogChange.objects.filter(id__gt=parse_int(request, 'changed_since', 0))
+            contentmodels = contentmodels.filter(id__in=changes.values('model_id'))
+    except ApiError, err:
+        return HttpResponseBadRequest(str(err), mimetype="text/plain")
+
+    for param in ['label', 'status']:
+        if param in request.GET: contentmodels = contentmodels.filter(**{param: request.GET[param]})
+    if fields is None or 'versions' in fields:
+        contentmodels = contentmodels.prefetch_related('modelversion_set')
+
+    page = list(contentmodels[:limit + 1])
+    content = json.dumps([ cm.serialized(fields, version_fields) for cm in page[:limit] ])
+    response = conditional_response(request, content, 'application/json', hashlib.md5(content).hexdigest())
+
+    if len(page) > limit:
+        params = request.GET.copy()
+        params['cursor'] = page[limit - 1].pk
+        response['Link'] = '<%s?%s>; rel="next"' % (request.build_absolute_uri(request.path), params.urlencode())
+    return response
+
+#--------------------------------------------------------------------------------------
+# The catalog's change log, as JSON, for harvesters. ?since=<n> gives the changes after
+#     change number n and ?since_date=<ISO date and time> those after that moment, at
+#     most limit=<n> at a time. Pass last_sequence back as since to get the next ones;
+#     more is true if there are more already. Numbers are handed out as changes are
+#     made, so a change in a transaction that commits late can turn up behind a number
+#     that was already returned; harvesters that must see everything can ask again
+#     from a little way back.
+#--------------------------------------------------------------------------------------
+def get_changes(request):
+    changes = CatalogChange.objects.all()
+    try:
+        since = parse_int(request, 'since', 0)
+        limit = min(max(1, parse_int(request, 'limit', API_MAX_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+        if 'since_date' in request.GET:
+            changes = changes.filter(date__gt=parse_datetime(request, 'since_date'))
+    except ApiError, err:
+        return HttpResponseBadRequest(str(err), mimetype="text/plain")
+
+    page = list(changes.filter(id__gt=since)[:limit + 1])
+    content = json.dumps({
+        'changes': [ change.serialized() for change in page[:limit] ],
+        'last_sequence': page[:limit][-1].pk if len(page) > 0 else since,
+        'more': len(page) > limit
+    })
+    return conditional_response(request, content, 'application/json', hashlib.md5(content).hexdigest())
 
 #--------------------------------------------------------------------------------------
 # Expose a single ContentModel
 #--------------------------------------------------------------------------------------
 def get_model(request, content_model, extension):
-    query = model_by_label(content_model)
-    model_version_pk = query[0]['id']
-    contentmodels = ContentModel.objects.filter(pk=model_version_pk)
-    if not contentmodels: raise Http404
+    contentmodels = get_by_label(ContentModel.objects.with_versions(), {'label': content_model}, content_model)
     return view_models(contentmodels, extension)
 
 #--------------------------------------------------------------------------------------
-# Choose the appropriate format to expose based on the requested extension
+# Choose the appropriate format to expose based on the requested extension.
+#     contentmodels should come from ContentModel.objects.with_versions() so that
+#     rendering doesn't issue queries for each model.
 #--------------------------------------------------------------------------------------
 def view_models(contentmodels, extension):
     if extension == 'json':
@@ -92,7 +229,7 @@ class AtomFeed(object):
     date = datetime.now().isoformat()
     author_name = "Ryan Clark"
     author_email = "metadata@usgin.org"
-    contentmodels = ContentModel.objects.all()
+    contentmodels = None
 
     # Constructor function. Map kwargs to this instance to overwrite defaults
     def __init__(self, **kwargs):
@@ -101,6 +238,12 @@ class AtomFeed(object):
             # Assign them to this instance, overwriting default values
             setattr(self, arg, kwargs[arg])
 
+        # Default to all ContentModels. Evaluate the set once; the methods below
+        #   work on the list in memory.
+        if self.contentmodels is None:
+            self.contentmodels = ContentModel.objects.with_versions()
+        self.contentmodels = list(self.contentmodels)
+
         # Set date and id
         self.set_date()
         self.set_id_and_url()
@@ -108,15 +251,12 @@ class AtomFeed(object):
     # Function to set the feed's updated date based on the ContentModels passed in
     def set_date(self):
         # Count the number of ContentModels that were passed in
-        number_of_models = self.contentmodels.count()
+        number_of_models = len(self.contentmodels)
 
         # There is more than one ContentModel
         if number_of_models > 1:
-            # Sort the ContentModels by date
-            sortable = list(self.contentmodels)
-            sortable.sort(key=lambda cm: cm.date_updated())
             # Set the feed's date to the most recent ContentModel's updated date
-            self.date = sortable[len(sortable) - 1].iso_date_updated()
+            self.date = max(self.contentmodels, key=lambda cm: cm.date_updated()).iso_date_updated()
 
             # There is one ContentModel
         elif number_of_models == 1:
@@ -126,7 +266,7 @@ class AtomFeed(object):
     # Function to set the feed's id and url
     def set_id_and_url(self):
         # Use the default values unless this is a Feed containing only one ContenModel
-        if self.contentmodels.count() == 1:
+        if len(self.contentmodels) == 1:
             # Set the feed's id and url to that of the passed in ContentModel
             self.url = self.contentmodels[0].my_atom()
             self.id = self.contentmodels[0].my_atom()
@@ -141,7 +281,7 @@ def homepage(req):
         else:
             return date(1900, 1, 1)
 
-    models = list(ContentModel.objects.all())
+    models = list(ContentModel.objects.with_versions())
     models.sort(key=lambda cm: recent(cm), reverse=True)
     return render_to_response('home.html', {'recent_models': models[:3]})
 
@@ -149,7 +289,7 @@ def homepage(req):
 # Model view page
 #--------------------------------------------------------------------------------------
 def models(req):
-    return render_to_response('models.html', {'contentmodels': ContentModel.objects.all()})
+    return render_to_response('models.html', {'contentmodels': ContentModel.objects.with_versions()})
 
 #--------------------------------------------------------------------------------------
 # Swagger API Documentation
@@ -166,13 +306,69 @@ def swaggerui(request):
     return render(request, "swagger/swagger.html", {"swagger": swagger_url})
 
 #--------------------------------------------------------------------------------------
-# FeatureCatalogues
+# FeatureCatalogues, pre-generated when a version is saved (see featurecatalog.py)
 #--------------------------------------------------------------------------------------
 def get_feature_catalog(request, content_model, model_version):
-    query = model_by_label(content_model, model_version)
-    model_version_pk = query[0]['id']
-    v = get_object_or_404(ModelVersion, pk=model_version_pk)
-    return render(request, "featureCatalog.xml", {"version": v}, content_type="text/xml")
+    v = get_by_label(
+        ModelVersion.objects.select_related('content_model'),
+        {'content_model__label': content_model, 'version': model_version},
+        content_model, model_version
+    )[0]
+    return feature_catalog_response(request, v)
+
+#--------------------------------------------------------------------------------------
+# Query the fields of every layer in the catalog, as JSON. Filter with any of ?name=,
+#     ?layer=, ?type=, ?model=<label>, ?version= and ?optional=true|false. Answered
+#     from the LayerField index, so no XSDs are read.
+#--------------------------------------------------------------------------------------
+FIELD_FILTERS = {
+    'name': 'name',
+    'layer': 'layer',
+    'type': 'type',
+    'model': 'modelversion__content_model__label',
+    'version': 'modelversion__version'
+}
+
+def get_fields(request):
+    fields = LayerField.objects.all()
+    for param, lookup in FIELD_FILTERS.items():
+        if param in request.GET: fields = fields.filter(**{lookup: request.GET[param]})
+    if 'optional' in request.GET:
+        fields = fields.filter(optional=request.GET['optional'].lower() in ['true', '1', 'yes'])
+
+    rows = fields.values_list('modelversion__content_model__label', 'modelversion__version', 'layer', 'name', 'type', 'optional', 'description')
+    data = [{
+        'model': label,
+        'version': version,
+        'version_uri': '%s/%s' % (ContentModel(label=label).absolute_uri().rstrip('/'), version),
+        'layer': layer,
+        'name': name,
+        'type': field_type,
+        'optional': optional,
+        'description': description
+    } for label, version, layer, name, field_type, optional, description in rows]
+    return HttpResponse(json.dumps(data), mimetype='application/json')
+
+#--------------------------------------------------------------------------------------
+# Uploaded files, for the development server. Sends the .gz or .br sibling that
+#     Overwriter wrote when the client accepts it. In production the web server should
+#     do the same (e.g. nginx's gzip_static).
+#--------------------------------------------------------------------------------------
+def serve_file(request, path, document_root=None):
+    try:
+        file_path = safe_join(document_root, path)
+    except ValueError:
+        raise Http404
+    available = [ encoding for encoding in ENCODINGS if os.path.exists(sibling_path(file_path, encoding)) ]
+    encoding = preferred_encoding(request, available) if os.path.isfile(file_path) else None
+    if encoding is None:
+        response = static.serve(request, path, document_root)
+    else:
+        response = static.serve(request, path + sibling_path("", encoding), document_root)
+        response["Content-Type"] = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
 
 #--------------------------------------------------------------------------------------
 # Tools page